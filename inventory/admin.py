@@ -1,18 +1,240 @@
 # admin.py
 
-from django.contrib import admin
-from .models import InventoryItem, Category
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.http import HttpResponseRedirect
+from django.conf import settings
+from .bulk import REASSIGN_ERROR, apply_bulk_action, describe_bulk_action, reassign_target
+from .cache import get_categories
+from .forms import CategoryChoiceField
+from .models import (
+    InventoryItem, Category, InventoryMovement, InventorySnapshot, Job, LowStockAlert, StaleItemError, low_stock_condition,
+)
+from .pagination import EstimatedCountPaginator
+from .search import ranked_item_ids
 # Registering models with Django admin site
 
 # Custom admin class for InventoryItem
 
 
+# Action form of the item changelist, holding the values the bulk actions apply
+class InventoryItemActionForm(ActionForm):
+    quantity = forms.IntegerField(min_value=0, required=False)
+    category = CategoryChoiceField(required=False, empty_label="No category")
+    username = forms.CharField(max_length=150, required=False, label="User")
+
+
+# Change form of an item, carrying the version of the item the form was filled in from, so saving
+# it cannot overwrite a change saved by someone else in the meantime
+class InventoryItemAdminForm(forms.ModelForm):
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.fields['loaded_version'].initial = self.instance.version
+
+
+# Category filter of the item changelist, listing the cached category catalogue. Filtering uses
+# the index on the item's category.
+class CategoryListFilter(admin.SimpleListFilter):
+    title = 'category'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return [('none', 'No category')] + [(str(category.pk), category.name) for category in get_categories()]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'none':
+            return queryset.filter(category__isnull=True)
+        if self.value() and self.value().isdigit():
+            return queryset.filter(category_id=int(self.value()))
+        return queryset
+
+
+# Low stock filter of the item changelist, comparing each item with its threshold in the database
+class LowStockListFilter(admin.SimpleListFilter):
+    title = 'stock level'
+    parameter_name = 'low'
+
+    def lookups(self, request, model_admin):
+        return [('1', 'Low stock')]
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.filter(low_stock_condition())
+        return queryset
+
+
+# The item changelist is built for tables of millions of rows: each page is read with its
+# categories and users joined in, the row count comes from the planner's estimate rather than a
+# COUNT(*) and is not run a second time for the unfiltered total, the user is picked with a
+# search box instead of a select of every user, and searches go through the full text index.
 class InventoryItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'quantity', 'category', 'date_created', 'user')
-    readonly_fields = ('date_created', 'last_edited')
+    list_select_related = ('category', 'user')
+    list_filter = (CategoryListFilter, LowStockListFilter)
+    # Columns whose ordering an index serves
+    sortable_by = ('name', 'user')
+    search_fields = ('name',)
+    search_help_text = 'Search item and category names.'
+    autocomplete_fields = ('user',)
+    readonly_fields = ('date_created', 'last_edited', 'version')
+    form = InventoryItemAdminForm
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = InventoryItemActionForm
+    actions = ['set_quantity', 'set_category', 'reassign']
+
+    # Save the item over the version the form was filled in from
+    def save_model(self, request, obj, form, change):
+        if change and form.cleaned_data.get('loaded_version') is not None:
+            obj.version = form.cleaned_data['loaded_version']
+        super().save_model(request, obj, form, change)
+
+    # The item was saved by someone else since the form was loaded, and the save was rolled back.
+    # Show the item as it is now, so the change can be made again over the other one.
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StaleItemError:
+            item = self.get_object(request, object_id)
+            self.message_user(request, (
+                f'Someone else changed this item while you were editing it. It now holds {item.quantity} of '
+                f'{item.name}. Your changes were not saved, make them again to replace theirs.'
+            ), messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    # Run a bulk action over the selected items and report its summary
+    def apply_bulk_action(self, request, queryset, action, value):
+        summary = apply_bulk_action(queryset, action, value, actor=request.user)
+        self.message_user(request, describe_bulk_action(summary), messages.SUCCESS)
+
+    # The validated action form, or None after reporting its errors
+    def bulk_action_form(self, request):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            self.message_user(request, form.errors.as_text(), messages.ERROR)
+            return None
+        return form
+
+    @admin.action(description='Set quantity of selected items')
+    def set_quantity(self, request, queryset):
+        form = self.bulk_action_form(request)
+        if form is None:
+            return
+        if form.cleaned_data['quantity'] is None:
+            self.message_user(request, 'Enter the quantity to set.', messages.ERROR)
+            return
+        self.apply_bulk_action(request, queryset, 'set_quantity', form.cleaned_data['quantity'])
+
+    @admin.action(description='Change category of selected items')
+    def set_category(self, request, queryset):
+        form = self.bulk_action_form(request)
+        if form is None:
+            return
+        category = form.cleaned_data['category']
+        self.apply_bulk_action(request, queryset, 'set_category', category.pk if category else None)
+
+    @admin.action(description='Reassign selected items to user')
+    def reassign(self, request, queryset):
+        form = self.bulk_action_form(request)
+        if form is None:
+            return
+        user = reassign_target(form.cleaned_data['username'])
+        if user is None:
+            self.message_user(request, REASSIGN_ERROR, messages.ERROR)
+            return
+        self.apply_bulk_action(request, queryset, 'reassign', user.pk)
+
+    # The delete selected action deletes the confirmed items with one statement instead of
+    # deleting and signalling them one at a time
+    def delete_queryset(self, request, queryset):
+        apply_bulk_action(queryset, 'delete', actor=request.user)
+
+    # Search the full text index of every user's items instead of scanning the names, keeping
+    # the newest SEARCH_MAX_RESULTS matches among the rows left by the list filters
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        ids = ranked_item_ids(None, search_term, settings.SEARCH_MAX_RESULTS, using=queryset.db, items=queryset)
+        return queryset.filter(id__in=ids), False
+
+    # Use the cached category catalogue for the category select
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'category':
+            kwargs['form_class'] = CategoryChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 # Register the InventoryItem model with the admin site
 
 
 admin.site.register(InventoryItem, InventoryItemAdmin)
 # Register the Category model with the admin site
 admin.site.register(Category)
+
+
+# Custom admin class for the low stock alert outbox, read only as the worker owns the rows
+class LowStockAlertAdmin(admin.ModelAdmin):
+    list_display = ('item_name', 'event', 'quantity', 'user', 'status', 'attempts', 'created_at', 'delivered_at')
+    list_filter = ('status', 'event')
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(LowStockAlert, LowStockAlertAdmin)
+
+
+# Custom admin class for the movement ledger, read only as it is append-only
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'item_id', 'user', 'quantity', 'quantity_delta')
+    list_filter = ('kind',)
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(InventoryMovement, InventoryMovementAdmin)
+
+
+# Custom admin class for the ledger snapshots, taken by the snapshot_inventory command
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('taken_at', 'item_count', 'total_quantity')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(InventorySnapshot, InventorySnapshotAdmin)
+
+
+# Custom admin class for the background job queue, read only as the workers own the rows
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'status', 'progress', 'progress_total', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,252 @@
+# alerts.py
+
+import json
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import LowStockAlert, is_low_state
+
+logger = logging.getLogger("inventory.alerts")
+
+
+# Return an unsaved alert if an item crossed its low stock threshold, comparing the state
+# remembered when the item was loaded with its current values, so no query is needed. A change
+# of quantity, threshold or category can all cross it. old is None for a new item, which raises
+# an alert when it is created already low.
+def threshold_alert(old, item):
+    was_low = old is not None and is_low_state(old)
+    is_low = is_low_state(item.tracked_state())
+    if is_low == was_low:
+        return None
+    return LowStockAlert(
+        user_id=item.user_id,
+        item_id=item.pk,
+        item_name=item.name,
+        event=LowStockAlert.LOW if is_low else LowStockAlert.RESTOCKED,
+        quantity=item.quantity,
+        previous_quantity=None if old is None else old["quantity"],
+    )
+
+
+# Write the alerts for a list of (old state, item) pairs in one insert, for bulk writes that
+# send no signals
+def record_threshold_alerts(changes):
+    alerts = [alert for alert in (threshold_alert(old, item) for old, item in changes) if alert]
+    return LowStockAlert.objects.bulk_create(alerts)
+
+
+# Serialise an alert for sinks that send JSON
+def serialize_alert(alert):
+    return {
+        "id": alert.id,
+        "item": alert.item_id,
+        "item_name": alert.item_name,
+        "event": alert.event,
+        "quantity": alert.quantity,
+        "previous_quantity": alert.previous_quantity,
+        "created_at": alert.created_at,
+    }
+
+
+# Base class of the places alerts are delivered to. deliver() receives a user and the alerts
+# for them and raises if the delivery failed, in which case it is retried later.
+class AlertSink:
+    def __init__(self, **options):
+        self.options = options
+
+    def deliver(self, user, alerts):
+        raise NotImplementedError
+
+
+# Writes alerts to the "inventory.alerts" logger
+class LogSink(AlertSink):
+    def deliver(self, user, alerts):
+        for alert in alerts:
+            logger.warning("Alert for %s: %s", user.username, alert)
+
+
+# Emails the alerts to the user through the configured email backend, users without an
+# email address are skipped
+class EmailSink(AlertSink):
+    def deliver(self, user, alerts):
+        if not user.email:
+            return
+        lines = [str(alert) for alert in alerts]
+        send_mail(
+            f"{len(alerts)} inventory alert{'s' if len(alerts) != 1 else ''}",
+            "\n".join(lines),
+            self.options.get("from_email"),
+            [user.email],
+        )
+
+
+# Posts the alerts as JSON to a URL, any answer other than 2xx counts as a failure
+class WebhookSink(AlertSink):
+    def deliver(self, user, alerts):
+        body = json.dumps(
+            {"user": {"id": user.id, "username": user.username}, "alerts": [serialize_alert(a) for a in alerts]},
+            cls=DjangoJSONEncoder,
+        ).encode()
+        request = urllib.request.Request(
+            self.options["url"],
+            data=body,
+            headers={"Content-Type": "application/json", **self.options.get("headers", {})},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.options.get("timeout", 10)) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Webhook answered {response.status}")
+
+
+# Build the sinks configured in ALERT_SINKS
+def load_sinks():
+    return [import_string(sink["BACKEND"])(**sink.get("OPTIONS", {})) for sink in settings.ALERT_SINKS]
+
+
+# Delivers the alerts waiting in the outbox. Each run claims a batch of due alerts, drops the
+# ones a later alert for the same item made pointless, holds back users alerted too recently,
+# and delivers one digest per user to every sink from a thread pool. Deliveries are at least
+# once: a failed digest is retried with a growing delay, and a worker that dies while holding
+# alerts releases them when its claim expires.
+class AlertDispatcher:
+    def __init__(self, sinks=None, batch_size=None, workers=4):
+        self.sinks = load_sinks() if sinks is None else sinks
+        self.batch_size = batch_size or settings.ALERT_BATCH_SIZE
+        self.workers = workers
+
+    # Claim a batch of due alerts, so other workers skip them until the claim expires
+    def claim(self, now):
+        with transaction.atomic():
+            due = (
+                LowStockAlert.objects.filter(
+                    status__in=[LowStockAlert.PENDING, LowStockAlert.SENDING], next_attempt_at__lte=now
+                )
+                .select_for_update(skip_locked=True)
+                .order_by("id")[:self.batch_size]
+            )
+            alerts = list(due)
+            LowStockAlert.objects.filter(id__in=[alert.id for alert in alerts]).update(
+                status=LowStockAlert.SENDING, next_attempt_at=now + timedelta(seconds=settings.ALERT_CLAIM_TIMEOUT)
+            )
+        return alerts
+
+    # Keep the latest alert of each item, unless the item went back to where it started, in
+    # which case none of its alerts are worth sending. Returns (kept, superseded).
+    @staticmethod
+    def deduplicate(alerts):
+        kept, superseded = [], []
+        for _, item_alerts in groupby(sorted(alerts, key=attrgetter("item_id", "id")), key=attrgetter("item_id")):
+            item_alerts = list(item_alerts)
+            first, last = item_alerts[0], item_alerts[-1]
+            if first.event == last.event:
+                kept.append(last)
+                superseded.extend(item_alerts[:-1])
+            else:
+                superseded.extend(item_alerts)
+        return kept, superseded
+
+    # Split the alerts into those of users who may be alerted now and those of users alerted
+    # less than ALERT_USER_INTERVAL seconds ago, returned with the time they may be alerted again
+    @staticmethod
+    def rate_limit(alerts, now):
+        interval = timedelta(seconds=settings.ALERT_USER_INTERVAL)
+        last_delivered = dict(
+            LowStockAlert.objects.filter(
+                user_id__in={alert.user_id for alert in alerts},
+                status=LowStockAlert.DELIVERED,
+                delivered_at__gt=now - interval,
+            )
+            .values("user_id")
+            .annotate(last=Max("delivered_at"))
+            .values_list("user_id", "last")
+        )
+        allowed, deferred = [], {}
+        for alert in alerts:
+            if alert.user_id in last_delivered:
+                deferred.setdefault(last_delivered[alert.user_id] + interval, []).append(alert)
+            else:
+                allowed.append(alert)
+        return allowed, deferred
+
+    # Send one user's digest to every sink, returning the error message if any sink failed
+    def deliver(self, user, alerts):
+        try:
+            for sink in self.sinks:
+                sink.deliver(user, alerts)
+        except Exception as error:
+            logger.exception("Delivering %d alerts to %s failed", len(alerts), user.username)
+            return f"{type(error).__name__}: {error}"
+        return None
+
+    # Deliver one batch of due alerts and return how many ended up in each state
+    def run_once(self):
+        now = timezone.now()
+        claimed = self.claim(now)
+        counts = {"claimed": len(claimed), "delivered": 0, "superseded": 0, "deferred": 0, "retrying": 0, "failed": 0}
+        if not claimed:
+            return counts
+
+        alerts, superseded = self.deduplicate(claimed)
+        LowStockAlert.objects.filter(id__in=[alert.id for alert in superseded]).update(
+            status=LowStockAlert.SUPERSEDED
+        )
+        counts["superseded"] = len(superseded)
+
+        alerts, deferred = self.rate_limit(alerts, now)
+        for retry_at, held in deferred.items():
+            LowStockAlert.objects.filter(id__in=[alert.id for alert in held]).update(
+                status=LowStockAlert.PENDING, next_attempt_at=retry_at
+            )
+            counts["deferred"] += len(held)
+
+        # Sinks only do network IO, the database is written from this thread once they finish
+        by_user = {}
+        for alert in alerts:
+            by_user.setdefault(alert.user_id, []).append(alert)
+        users = User.objects.in_bulk(list(by_user))
+        digests = [(users[user_id], user_alerts) for user_id, user_alerts in by_user.items() if user_id in users]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            errors = list(executor.map(lambda digest: self.deliver(*digest), digests))
+
+        delivered = []
+        for (user, user_alerts), error in zip(digests, errors):
+            if error is None:
+                delivered.extend(user_alerts)
+            else:
+                self.record_failure(user_alerts, error, now, counts)
+        LowStockAlert.objects.filter(id__in=[alert.id for alert in delivered]).update(
+            status=LowStockAlert.DELIVERED, delivered_at=now
+        )
+        counts["delivered"] = len(delivered)
+        return counts
+
+    # Schedule a retry of a failed digest after a delay that doubles with every attempt, or
+    # give up once ALERT_MAX_ATTEMPTS is reached
+    def record_failure(self, alerts, error, now, counts):
+        for attempts, group in groupby(sorted(alerts, key=attrgetter("attempts")), key=attrgetter("attempts")):
+            ids = [alert.id for alert in group]
+            attempts += 1
+            if attempts >= settings.ALERT_MAX_ATTEMPTS:
+                LowStockAlert.objects.filter(id__in=ids).update(
+                    status=LowStockAlert.FAILED, attempts=attempts, last_error=error
+                )
+                counts["failed"] += len(ids)
+            else:
+                delay = timedelta(seconds=settings.ALERT_RETRY_DELAY * 2 ** (attempts - 1))
+                LowStockAlert.objects.filter(id__in=ids).update(
+                    status=LowStockAlert.PENDING, attempts=attempts, last_error=error, next_attempt_at=now + delay
+                )
+                counts["retrying"] += len(ids)
@@ -0,0 +1,216 @@
+# analytics.py
+
+import operator
+import time
+from array import array
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from functools import reduce
+from itertools import compress, repeat
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Func, IntegerField, Q, Sum
+from django.utils import timezone
+
+from .cache import get_categories_by_id
+from .models import (
+    ActivityRollup, AnalyticsState, CategoryRollup, InventoryItem, UserInventorySummary, effective_threshold,
+)
+
+# Columns packed into each category rollup, in the order they are packed
+COLUMNS = ("quantity", "threshold", "created_day", "edited_day")
+
+# Day 0 of the day columns
+EPOCH = date(1970, 1, 1)
+
+# Array type code of the packed columns, a signed 64 bit machine integer
+TYPECODE = "q"
+
+
+# Pack sequences of values, one per column, into the bytes of one array per column
+def pack_columns(columns):
+    return b"".join(array(TYPECODE, values).tobytes() for values in columns)
+
+
+# Number of a day in the day columns
+def day_number(day):
+    return (day - EPOCH).days
+
+
+# Days since EPOCH of a datetime column, in UTC, which TIME_ZONE is set to. It is computed in the
+# database, where SQLite's julianday() runs in C rather than the Python function behind TruncDate.
+class EpochDay(Func):
+    template = "CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / 86400) AS INTEGER)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = "CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+# Append the packed columns of a rollup holding items items to a dict of arrays by column
+def unpack_columns(data, items, columns):
+    size = items * array(TYPECODE).itemsize
+    for number, name in enumerate(COLUMNS):
+        columns[name].frombytes(data[number * size:(number + 1) * size])
+
+
+# The users whose rollups are out of date: the owners of the items edited since a time, and the
+# users whose summaries changed since, which also covers deleted and reassigned items and
+# category threshold changes that leave no edited item behind
+def changed_users(since):
+    user_ids = set(InventoryItem.objects.filter(last_edited__gt=since).values_list("user_id", flat=True).distinct())
+    user_ids.update(UserInventorySummary.objects.filter(last_modified__gt=since).values_list("user_id", flat=True))
+    return user_ids
+
+
+# Rewrite the category and activity rollups of some users from their items, read in one pass.
+# The rows are grouped in Python rather than ordered by the database, which would read the
+# table in index order, and the thresholds come from the cached catalogue instead of a join.
+def rebuild_rollups(user_ids):
+    items = (
+        InventoryItem.objects.filter(user__in=user_ids)
+        .annotate(created_day=EpochDay("date_created"), edited_day=EpochDay("last_edited"))
+        .values_list("user_id", "category_id", "quantity", "low_stock_threshold", "created_day", "edited_day")
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    groups = defaultdict(list)
+    for row in items:
+        groups[row[:2]].append(row[2:])
+
+    rollups, activity = [], Counter()
+    for (user_id, category_id), rows in groups.items():
+        quantities, overrides, created_days, edited_days = zip(*rows)
+        default = effective_threshold(None, category_id)
+        thresholds = [default if override is None else override for override in overrides]
+        rollups.append(CategoryRollup(
+            user_id=user_id, category_id=category_id, items=len(rows), quantity=sum(quantities),
+            low_stock=sum(map(operator.le, quantities, thresholds)),
+            columns=pack_columns((quantities, thresholds, created_days, edited_days)),
+        ))
+        activity.update((user_id, day, "created") for day in created_days)
+        activity.update((user_id, day, "edited") for day in edited_days)
+
+    days = {}
+    for (user_id, day, kind), count in activity.items():
+        rollup = days.setdefault((user_id, day), ActivityRollup(user_id=user_id, day=EPOCH + timedelta(days=day)))
+        setattr(rollup, kind, count)
+    CategoryRollup.objects.filter(user__in=user_ids).delete()
+    ActivityRollup.objects.filter(user__in=user_ids).delete()
+    CategoryRollup.objects.bulk_create(rollups, batch_size=500)
+    ActivityRollup.objects.bulk_create(days.values(), batch_size=500)
+    return len(rollups)
+
+
+# Bring the analytics rollups up to date and return a summary of the refresh. Only the users
+# changed since the watermark of the last refresh, less ANALYTICS_SETTLE seconds so changes of
+# transactions that had not committed yet are not missed, have their items read again; full=True,
+# and the first refresh, rebuild the rollups of every user. Changes that neither set last_edited
+# nor touch the user's summary, such as raw SQL, are only picked up by a full refresh.
+def refresh_analytics(full=False):
+    started = time.perf_counter()
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock the state row so refreshes run one at a time
+        state, _ = AnalyticsState.objects.select_for_update().get_or_create(pk=1)
+        full = full or state.watermark is None
+        if full:
+            user_ids = set(User.objects.values_list("id", flat=True))
+            CategoryRollup.objects.all().delete()
+            ActivityRollup.objects.all().delete()
+        else:
+            user_ids = changed_users(state.watermark - timedelta(seconds=settings.ANALYTICS_SETTLE))
+        user_ids = sorted(user_ids)
+        rollups = 0
+        for start in range(0, len(user_ids), settings.ANALYTICS_BATCH_SIZE):
+            rollups += rebuild_rollups(user_ids[start:start + settings.ANALYTICS_BATCH_SIZE])
+        state.watermark, state.refreshed_at = now, timezone.now()
+        state.refreshed_users, state.seconds = len(user_ids), time.perf_counter() - started
+        state.save()
+    return {"full": full, "users": len(user_ids), "rollups": rollups, "seconds": state.seconds}
+
+
+# Low stock items as a share of the items, None without items
+def low_stock_ratio(row):
+    return row["low_stock"] / row["items"] if row["items"] else None
+
+
+# Add the category name and low stock ratio to rows of totals by category id
+def describe_categories(rows):
+    categories = get_categories_by_id()
+    for row in rows:
+        category = categories.get(row["category_id"])
+        row["category"] = category.name if category is not None else "No category"
+        row["low_stock_ratio"] = low_stock_ratio(row)
+    return rows
+
+
+# The analytics reports, read from the rollups: totals by category, the users with the most
+# items, overall totals and the items created and last edited on each of the last days
+def analytics_report(days=None):
+    days = days or settings.ANALYTICS_DAYS
+    totals = {"items": Sum("items"), "quantity": Sum("quantity"), "low_stock": Sum("low_stock")}
+    overall = CategoryRollup.objects.aggregate(**totals)
+    overall = {name: value or 0 for name, value in overall.items()}
+    overall["low_stock_ratio"] = low_stock_ratio(overall)
+    by_category = CategoryRollup.objects.values("category_id").annotate(**totals).order_by("-quantity", "category_id")
+    by_user = (
+        CategoryRollup.objects.values("user_id", "user__username").annotate(**totals)
+        .order_by("-items", "user_id")[:settings.ANALYTICS_TOP_USERS]
+    )
+    since = timezone.now().date() - timedelta(days=days - 1)
+    activity = (
+        ActivityRollup.objects.filter(day__gte=since).values("day")
+        .annotate(created=Sum("created"), edited=Sum("edited")).order_by("day")
+    )
+    users = [{**row, "low_stock_ratio": low_stock_ratio(row)} for row in by_user]
+    return {
+        "state": AnalyticsState.objects.filter(pk=1).first(),
+        "overall": overall,
+        "by_category": describe_categories(list(by_category)),
+        "by_user": users,
+        "activity": list(activity),
+    }
+
+
+# Totals by category of an ad hoc slice of the items, computed over the packed columns of the
+# rollups: the items of the given users and categories, all if None, optionally only those low
+# on stock and those created or last edited on or after a date. The rollups are chosen in SQL and
+# the conditions applied to whole arrays at once with map() and compress(), which loop in C.
+def slice_items(user_ids=None, category_ids=None, low_only=False, created_since=None, edited_since=None):
+    rollups = CategoryRollup.objects.all()
+    if user_ids is not None:
+        rollups = rollups.filter(user__in=user_ids)
+    if category_ids is not None:
+        condition = Q(category__in=[pk for pk in category_ids if pk is not None])
+        if None in category_ids:
+            condition |= Q(category__isnull=True)
+        rollups = rollups.filter(condition)
+
+    by_category = {}
+    for category_id, items, data in rollups.values_list("category_id", "items", "columns").iterator():
+        columns = by_category.setdefault(category_id, {name: array(TYPECODE) for name in COLUMNS})
+        unpack_columns(bytes(data), items, columns)
+
+    rows = []
+    for category_id, columns in by_category.items():
+        low = bytes(map(operator.le, columns["quantity"], columns["threshold"]))
+        masks = [low] if low_only else []
+        if created_since is not None:
+            masks.append(bytes(map(operator.ge, columns["created_day"], repeat(day_number(created_since)))))
+        if edited_since is not None:
+            masks.append(bytes(map(operator.ge, columns["edited_day"], repeat(day_number(edited_since)))))
+        if masks:
+            selected = bytes(reduce(lambda first, second: map(operator.and_, first, second), masks))
+            row = {
+                "items": sum(selected),
+                "quantity": sum(compress(columns["quantity"], selected)),
+                "low_stock": sum(compress(low, selected)),
+            }
+        else:
+            row = {"items": len(low), "quantity": sum(columns["quantity"]), "low_stock": sum(low)}
+        if row["items"]:
+            rows.append({"category_id": category_id, **row})
+    return describe_categories(sorted(rows, key=lambda row: (-row["quantity"], row["category_id"] or 0)))
@@ -0,0 +1,437 @@
+# api.py
+
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views import View
+
+from .alerts import record_threshold_alerts
+from .bulk import delete_items
+from .cache import categories_version, get_categories, make_token
+from .forms import ItemPayloadForm
+from .jobs import serialize_job
+from .ledger import record_movements
+from .models import InventoryItem, Job, StaleItemError, UserInventorySummary, low_stock_condition, sanitise_name
+from .pagination import InvalidCursor, paginate_keyset, parse_sort
+from .search import parse_page_number, search_page, search_terms
+
+# Fields an item can be serialised with, clients may pick a subset with ?fields=
+ITEM_FIELDS = (
+    "id", "name", "quantity", "category", "category_name", "low_stock_threshold", "date_created", "last_edited",
+    "assigned_date", "version",
+)
+
+# Fields a client may write
+WRITABLE_FIELDS = ("name", "quantity", "category", "low_stock_threshold")
+
+
+# Raised inside an API view to return a JSON error response
+class ApiError(Exception):
+    def __init__(self, status, detail, errors=None):
+        super().__init__(detail)
+        self.status = status
+        self.payload = {"detail": detail}
+        if errors:
+            self.payload["errors"] = errors
+
+
+# Serialise an item to a dict holding only the requested fields
+def serialize_item(item, fields=ITEM_FIELDS):
+    values = {
+        "id": lambda: item.id,
+        "name": lambda: item.name,
+        "quantity": lambda: item.quantity,
+        "category": lambda: item.category_id,
+        "category_name": lambda: item.category.name if item.category_id else None,
+        "low_stock_threshold": lambda: item.low_stock_threshold,
+        "date_created": lambda: item.date_created,
+        "last_edited": lambda: item.last_edited,
+        "assigned_date": lambda: item.assigned_date,
+        "version": lambda: item.version,
+    }
+    return {field: values[field]() for field in fields}
+
+
+# ETag of a single item, derived from its version
+def item_etag(item):
+    return quote_etag(f"{item.pk}-{item.version}")
+
+
+# Base view for the JSON API, it requires a logged in user and turns ApiErrors into JSON responses
+class ApiView(View):
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"detail": "Authentication required."}, status=401)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse(error.payload, status=error.status)
+
+    # Return the fields requested with ?fields=, defaulting to every field
+    def requested_fields(self):
+        raw = self.request.GET.get("fields")
+        if not raw:
+            return ITEM_FIELDS
+        fields = tuple(field.strip() for field in raw.split(",") if field.strip())
+        unknown = [field for field in fields if field not in ITEM_FIELDS]
+        if unknown:
+            raise ApiError(400, f"Unknown fields: {', '.join(unknown)}.")
+        return fields
+
+    # Parse the JSON request body
+    def json_body(self):
+        try:
+            return json.loads(self.request.body or b"null")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ApiError(400, "Request body is not valid JSON.")
+
+    # Items the API may touch, the same ownership rule as the dashboard: only the user's own items
+    def owned_items(self):
+        return InventoryItem.objects.filter(user=self.request.user.id)
+
+    # Validate item data, merged over the current values when partially updating an item
+    def validate(self, data, item=None):
+        if not isinstance(data, dict):
+            raise ApiError(400, "Item data must be a JSON object.")
+        if item is not None:
+            data = {
+                "name": item.name, "quantity": item.quantity, "category": item.category_id,
+                "low_stock_threshold": item.low_stock_threshold, **data,
+            }
+        form = ItemPayloadForm(data={field: data.get(field) for field in WRITABLE_FIELDS})
+        if not form.is_valid():
+            return None, form.errors.get_json_data()
+        values = form.cleaned_data
+        values["name"] = sanitise_name(values["name"])
+        return values, None
+
+
+# List the user's items with cursor pagination, or create a new item
+class ItemListApi(ApiView):
+    # Read the requested fields, the filtered items and the keyset page arguments from the query string
+    def list_query(self):
+        request = self.request
+        fields = self.requested_fields()
+        sort, descending = parse_sort(request.GET.get("sort", ""))
+        items = self.owned_items().select_related("category")
+        # The same filters as the dashboard
+        category = request.GET.get("category", "")
+        if category.isdigit():
+            items = items.filter(category=int(category))
+        if request.GET.get("low") == "1":
+            items = items.filter(low_stock_condition())
+        try:
+            limit = min(int(request.GET.get("limit", settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ApiError(400, "limit must be a whole number.")
+        arguments = {
+            "sort": sort,
+            "descending": descending,
+            "after": request.GET.get("after"),
+            "before": request.GET.get("before"),
+            "page_size": max(limit, 1),
+        }
+        return fields, items, arguments
+
+    # The user's summary version, it changes whenever any of their items change
+    def summary_version(self):
+        return UserInventorySummary.objects.filter(user=self.request.user.id).values_list("version", flat=True)
+
+    # ETag of a list response
+    def list_etag(self, version, categories_token):
+        return quote_etag(
+            make_token("api", self.request.user.id, version, categories_token, self.request.GET.urlencode())
+        )
+
+    # JSON response holding one page of items
+    def list_response(self, page, fields, etag):
+        response = JsonResponse({
+            "results": [serialize_item(item, fields) for item in page],
+            "next": page.next_cursor,
+            "previous": page.previous_cursor,
+        })
+        response.headers["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get(self, request):
+        fields, items, arguments = self.list_query()
+        etag = self.list_etag(self.summary_version().first(), categories_version())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        try:
+            page = paginate_keyset(items, **arguments)
+        except InvalidCursor as error:
+            raise ApiError(400, str(error))
+        return self.list_response(page, fields, etag)
+
+    def post(self, request):
+        values, errors = self.validate(self.json_body())
+        if errors:
+            raise ApiError(400, "Invalid item.", errors)
+        item = InventoryItem.objects.create(user=request.user, **values)
+        response = JsonResponse(serialize_item(item, self.requested_fields()), status=201)
+        response.headers["ETag"] = item_etag(item)
+        return response
+
+
+# Retrieve or partially update one of the user's items
+class ItemDetailApi(ApiView):
+    # Query for one of the user's items
+    def item_query(self, pk):
+        return self.owned_items().select_related("category").filter(pk=pk)
+
+    def get_item(self, pk):
+        item = self.item_query(pk).first()
+        if item is None:
+            raise ApiError(404, "Item not found.")
+        return item
+
+    # JSON response holding one item, unless the client already holds its current version
+    def item_response(self, item):
+        if item is None:
+            raise ApiError(404, "Item not found.")
+        etag = item_etag(item)
+        not_modified = get_conditional_response(self.request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = JsonResponse(serialize_item(item, self.requested_fields()))
+        response.headers["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get(self, request, pk):
+        return self.item_response(self.item_query(pk).first())
+
+    # 409 response telling the client its change was based on an old version of the item, with
+    # the current item so it can reapply the change on top of it
+    def conflict_response(self, pk):
+        item = self.get_item(pk)
+        response = JsonResponse(
+            {"detail": "The item was changed since you loaded it.", "current": serialize_item(item)}, status=409
+        )
+        response.headers["ETag"] = item_etag(item)
+        return response
+
+    def patch(self, request, pk):
+        item = self.get_item(pk)
+        # If-Match makes the update conditional on the client having seen the latest version
+        precondition = get_conditional_response(request, etag=item_etag(item))
+        if precondition is not None:
+            return precondition
+        body = self.json_body()
+        # A version in the body does the same for clients that do not keep ETags
+        if isinstance(body, dict) and "version" in body and body.pop("version") != item.version:
+            return self.conflict_response(pk)
+        values, errors = self.validate(body, item)
+        if errors:
+            raise ApiError(400, "Invalid item.", errors)
+        for field, value in values.items():
+            setattr(item, field, value)
+        # The save only applies to the version loaded above, a concurrent write in between is a conflict
+        try:
+            item.save()
+        except StaleItemError:
+            return self.conflict_response(pk)
+        response = JsonResponse(serialize_item(item, self.requested_fields()))
+        response.headers["ETag"] = item_etag(item)
+        return response
+
+
+# Add to or take from one of the user's items' quantity, with a body like {"delta": -3}. The
+# change is applied in the database on top of whatever the quantity is by then, so concurrent
+# stock movements never need a version and never overwrite each other.
+class ItemAdjustApi(ApiView):
+    def post(self, request, pk):
+        body = self.json_body()
+        delta = body.get("delta") if isinstance(body, dict) else None
+        if not is_integer(delta):
+            raise ApiError(400, "delta must be a whole number.")
+        try:
+            item = InventoryItem.adjust_quantity(pk, delta, user=request.user.id)
+        except ValueError as error:
+            raise ApiError(409, str(error))
+        if item is None:
+            raise ApiError(404, "Item not found.")
+        response = JsonResponse(serialize_item(item, self.requested_fields()))
+        response.headers["ETag"] = item_etag(item)
+        return response
+
+
+# Whether a JSON value is a whole number, which true and false are not although bool is an int
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Check the item ids of the entries of one part of a batch, adding an error for each entry
+# without an integer id or naming an item an earlier entry named, and return {index: id} of
+# the valid entries
+def batch_ids(part, ids, errors):
+    valid = {}
+    for index, pk in enumerate(ids):
+        if not is_integer(pk):
+            message, code = "Enter the item's id as a whole number.", "invalid"
+        elif pk in valid:
+            message, code = "The item is named more than once.", "duplicate"
+        else:
+            valid[pk] = index
+            continue
+        errors[f"{part}.{index}"] = {"id": [{"message": message, "code": code}]}
+    return {index: pk for pk, index in valid.items()}
+
+
+# Create, update and delete many of the user's items in one request and one transaction.
+# The body is {"create": [...], "update": [{"id": ..., ...}], "delete": [ids]}, and nothing is
+# written unless every entry is valid. Updates only apply to the versions of the items they
+# were loaded with, and to the version an entry names if it has one.
+class ItemBatchApi(ApiView):
+    def post(self, request):
+        body = self.json_body()
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        creates, updates, deletes = (body.get(key) or [] for key in ("create", "update", "delete"))
+        if not all(isinstance(entries, list) for entries in (creates, updates, deletes)):
+            raise ApiError(400, "create, update and delete must be lists.")
+        if len(creates) + len(updates) + len(deletes) > settings.API_MAX_BATCH_SIZE:
+            raise ApiError(400, f"A batch may hold at most {settings.API_MAX_BATCH_SIZE} entries.")
+
+        errors = {}
+        # Validate the new items
+        new_items = []
+        for index, data in enumerate(creates):
+            values, entry_errors = self.validate(data)
+            if entry_errors:
+                errors[f"create.{index}"] = entry_errors
+            else:
+                new_items.append(InventoryItem(user=request.user, **values))
+
+        # Every update and delete names an item by its id, and each item at most once
+        update_ids = batch_ids("update", [isinstance(data, dict) and data.get("id") for data in updates], errors)
+        delete_ids = batch_ids("delete", deletes, errors)
+
+        # Load every item to update in one query, then validate the changes
+        existing = self.owned_items().in_bulk(list(update_ids.values()))
+        now = timezone.now()
+        changed_items, changes, conflicts = [], [], {}
+        for index, pk in update_ids.items():
+            data, item = updates[index], existing.get(pk)
+            if item is None:
+                errors[f"update.{index}"] = {"id": [{"message": "Item not found.", "code": "not_found"}]}
+                continue
+            if "version" in data and data["version"] != item.version:
+                conflicts[f"update.{index}"] = serialize_item(item)
+                continue
+            values, entry_errors = self.validate({k: v for k, v in data.items() if k not in ("id", "version")}, item)
+            if entry_errors:
+                errors[f"update.{index}"] = entry_errors
+                continue
+            # Keep the loaded state, the quantity it held decides whether an alert is raised
+            changes.append((item._loaded_state, item))
+            for field, value in values.items():
+                setattr(item, field, value)
+            item.last_edited = now
+            changed_items.append(item)
+
+        if errors:
+            raise ApiError(400, "Invalid batch, nothing was changed.", errors)
+        if conflicts:
+            raise ApiError(409, "Items were changed since you loaded them, nothing was changed.", conflicts)
+
+        with transaction.atomic():
+            created = InventoryItem.objects.bulk_create(new_items)
+            # Write the next versions only where the rows still hold the loaded ones, any row
+            # changed since by another request leaves the update short and undoes the batch
+            loaded_versions = Q(pk__in=[])
+            for item in changed_items:
+                loaded_versions |= Q(pk=item.pk, version=item.version)
+                item.version += 1
+            updated = InventoryItem.objects.filter(loaded_versions).bulk_update(
+                changed_items, ["name", "quantity", "category", "low_stock_threshold", "last_edited", "version"]
+            )
+            if updated != len(changed_items):
+                raise ApiError(409, "Items were changed while the batch was applied, nothing was changed.")
+            # Bulk writes skip the signals, so write their movements in one insert, before the
+            # deletes write theirs so an item updated and deleted in the batch ends up deleted
+            record_movements(
+                [(item.pk, None, item.tracked_state(), True) for item in created]
+                + [(item.pk, old, item.tracked_state(), False) for old, item in changes]
+            )
+            # Deleting through the queryset would send a signal per item, each updating the
+            # summary and writing a movement, so the deletes take the bulk actions' path too
+            deleted = delete_items(self.owned_items().filter(pk__in=delete_ids.values()), now)
+            # Bring the user's summary up to date once and queue the batch's low stock alerts
+            UserInventorySummary.rebuild([request.user.id])
+            record_threshold_alerts([(None, item) for item in created] + changes)
+
+        fields = self.requested_fields()
+        return JsonResponse({
+            "created": [serialize_item(item, fields) for item in created],
+            "updated": [serialize_item(item, fields) for item in changed_items],
+            "deleted": deleted,
+        })
+
+
+# Search the user's items by item and category name, best matches first. Every word matches as
+# a prefix, so the endpoint also serves autocompletion while the user types. It takes the same
+# fields, filters and limit as the item list, with ?page= numbering the pages of results.
+class ItemSearchApi(ItemListApi):
+    http_method_names = ["get", "options"]
+
+    def get(self, request):
+        query = request.GET.get("q", "")
+        if not search_terms(query):
+            raise ApiError(400, "q must contain at least one word.")
+        fields, items, arguments = self.list_query()
+        etag = self.list_etag(self.summary_version().first(), categories_version())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        page = search_page(
+            items, request.user.id, query, parse_page_number(request.GET.get("page")), arguments["page_size"]
+        )
+        response = JsonResponse({
+            "results": [serialize_item(item, fields) for item in page],
+            "page": page.number,
+            "next_page": page.next_page_number,
+            "previous_page": page.previous_page_number,
+        })
+        response.headers["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+# List every category, read from the cached catalogue
+class CategoryListApi(ApiView):
+    # JSON response holding the categories, unless the client already holds this version
+    def categories_response(self, categories_token, categories):
+        etag = quote_etag(make_token("categories", categories_token))
+        not_modified = get_conditional_response(self.request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = JsonResponse({
+            "results": [
+                {"id": category.id, "name": category.name, "low_stock_threshold": category.low_stock_threshold}
+                for category in categories
+            ]
+        })
+        response.headers["ETag"] = etag
+        return response
+
+    def get(self, request):
+        return self.categories_response(categories_version(), get_categories())
+
+
+# Progress of one of the user's background jobs, polled by the jobs page
+class JobDetailApi(ApiView):
+    def get(self, request, pk):
+        job = Job.objects.filter(pk=pk, user=request.user.id).first()
+        if job is None:
+            raise ApiError(404, "Job not found.")
+        return JsonResponse(serialize_job(job))
@@ -10,3 +10,14 @@ class InventoryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     # Set the name of the app
     name = "inventory"
+
+    def ready(self):
+        # Connect the signal handlers that keep the inventory summaries up to date
+        from . import signals  # noqa: F401
+
+        # Count the queries of every request on each database connection as it connects
+        from django.db.backends.signals import connection_created
+
+        from .middleware import install_query_counter
+
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,202 @@
+# async_views.py
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache.utils import make_template_fragment_key
+from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import quote_etag
+from django.views import View
+
+from .api import ApiError, CategoryListApi, ItemDetailApi, ItemListApi
+from .cache import categories_version, get_cache, get_categories, make_token
+from .models import UserInventorySummary
+from .pagination import InvalidCursor, apaginate_keyset, parse_sort
+from .views import (
+    EMPTY_SUMMARY_STATE, add_low_stock_message, add_validators, admin_context, admin_fragment_key, admin_items,
+    admin_state_aggregates, admin_users, dashboard_context, dashboard_fragment_key, dashboard_items,
+    dashboard_page_arguments, dashboard_state, group_user_items, is_admin, load_admin_page, load_dashboard_page,
+    load_search_page, not_modified_response, record_fragment_cache, timed_render,
+)
+
+# These views serve the same pages as their counterparts in views.py using the async ORM, so
+# an ASGI server can keep other requests moving while one waits on the database. They are
+# routed instead of the sync views when INVENTORY_ASYNC_VIEWS is set.
+
+
+# Load the logged in user without blocking the event loop. The user is also stored on the
+# request, so the sync helpers and templates sharing it do not load the session a second time.
+async def authenticated_user(request):
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+# Whether a template fragment is already cached, in which case its rows need not be queried
+async def has_cached_fragment(name, key):
+    return await get_cache().ahas_key(make_template_fragment_key(name, [key]))
+
+
+# Whether flash messages are waiting to be shown, reading them may load the session
+@sync_to_async
+def has_pending_messages(request):
+    return bool(len(messages.get_messages(request)))
+
+
+# Async version of the Dashboard view
+class AsyncDashboard(View):
+    async def get(self, request):
+        user = await authenticated_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        # The summary row, the category catalogue and the pending messages do not depend on
+        # each other, so they are requested together
+        sort, descending = parse_sort(request.GET.get("sort", ""))
+        state, categories_token, categories, pending = await asyncio.gather(
+            dashboard_state(user.id).afirst(),
+            sync_to_async(categories_version)(),
+            sync_to_async(get_categories)(),
+            has_pending_messages(request),
+        )
+        state = state or EMPTY_SUMMARY_STATE
+        fragment_key = dashboard_fragment_key(request, state, categories_token)
+
+        # Pending flash messages are rendered into the page, so never answer with a 304 then
+        etag, last_modified = quote_etag(fragment_key), state["last_modified"]
+        if pending:
+            etag = last_modified = None
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Query the page only when the cached table fragment is missing, if the fragment expires
+        # before the template reads it the page is loaded then instead
+        items = dashboard_items(user.id, request.GET.get("category", ""), request.GET.get("low") == "1")
+        arguments = dashboard_page_arguments(request, sort, descending)
+        searching = bool(request.GET.get("q"))
+        if searching:
+            load_page = lambda: load_search_page(items, user.id, request)
+        else:
+            load_page = lambda: load_dashboard_page(items, arguments)
+        if await has_cached_fragment("dashboard_table", fragment_key):
+            page = SimpleLazyObject(load_page)
+        elif searching:
+            # The search index is queried with raw SQL, which has no async interface
+            page = await sync_to_async(load_page)()
+        else:
+            try:
+                page = await apaginate_keyset(items, **arguments)
+            except InvalidCursor:
+                page = await apaginate_keyset(items, **{**arguments, "after": None, "before": None})
+
+        add_low_stock_message(request, state["low_stock_count"])
+        context = dashboard_context(request, page, state, categories, sort, descending, fragment_key)
+        response = await sync_to_async(timed_render)(request, "inventory/dashboard.html", context)
+        record_fragment_cache("dashboard_table", page)
+        return add_validators(response, etag, last_modified)
+
+
+# Async version of the admin view, for superusers only
+async def async_admin_view(request):
+    user = await authenticated_user(request)
+    if not user.is_authenticated or not is_admin(user):
+        return redirect_to_login(request.get_full_path())
+
+    state, categories_token = await asyncio.gather(
+        UserInventorySummary.objects.aaggregate(**admin_state_aggregates()),
+        sync_to_async(categories_version)(),
+    )
+    page_number = request.GET.get("page", "1")
+    fragment_key = admin_fragment_key(state, categories_token, page_number)
+    etag, last_modified = quote_etag(make_token(fragment_key, user.id)), state["last_modified"]
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    # Load the users on the page and their items, only when the cached table fragment is missing
+    async def load_page():
+        paginator = Paginator(admin_users(), settings.ADMIN_VIEW_PAGE_SIZE)
+        # Count with the async ORM, the paginator then reuses the count instead of querying it
+        paginator.count = await admin_users().acount()
+        page = paginator.get_page(page_number)
+        page.object_list = [page_user async for page_user in page.object_list]
+        items = [item async for item in admin_items([page_user.id for page_user in page.object_list])]
+        page.user_items = group_user_items(page.object_list, items)
+        return page
+
+    if await has_cached_fragment("admin_view_table", fragment_key):
+        page = SimpleLazyObject(lambda: load_admin_page(page_number))
+    else:
+        page = await load_page()
+    response = await sync_to_async(timed_render)(
+        request, 'inventory/admin_view.html', admin_context(page, fragment_key)
+    )
+    record_fragment_cache("admin_view_table", page)
+    return add_validators(response, etag, last_modified)
+
+
+# Base of the async API views. Handlers that read are async, handlers that write stay sync and
+# are run in a worker thread, so they keep their transactions and signals unchanged.
+class AsyncApiMixin:
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await authenticated_user(request)
+        if not user.is_authenticated:
+            return JsonResponse({"detail": "Authentication required."}, status=401)
+        method = request.method.lower()
+        handler = getattr(self, method, None) if method in self.http_method_names else None
+        if handler is None:
+            return await self.http_method_not_allowed(request, *args, **kwargs)
+        if not asyncio.iscoroutinefunction(handler):
+            handler = sync_to_async(handler)
+        try:
+            response = await handler(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse(error.payload, status=error.status)
+        # View.options returns a coroutine when the view is async
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+# Async version of ItemListApi, creating items is left to the sync handler
+class AsyncItemListApi(AsyncApiMixin, ItemListApi):
+    async def get(self, request):
+        fields, items, arguments = self.list_query()
+        version, categories_token = await asyncio.gather(
+            self.summary_version().afirst(),
+            sync_to_async(categories_version)(),
+        )
+        etag = self.list_etag(version, categories_token)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        try:
+            page = await apaginate_keyset(items, **arguments)
+        except InvalidCursor as error:
+            raise ApiError(400, str(error))
+        return self.list_response(page, fields, etag)
+
+
+# Async version of ItemDetailApi, updates are left to the sync handler
+class AsyncItemDetailApi(AsyncApiMixin, ItemDetailApi):
+    async def get(self, request, pk):
+        return self.item_response(await self.item_query(pk).afirst())
+
+
+# Async version of CategoryListApi
+class AsyncCategoryListApi(AsyncApiMixin, CategoryListApi):
+    async def get(self, request):
+        categories_token, categories = await asyncio.gather(
+            sync_to_async(categories_version)(),
+            sync_to_async(get_categories)(),
+        )
+        return self.categories_response(categories_token, categories)
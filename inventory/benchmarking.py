@@ -0,0 +1,151 @@
+# benchmarking.py
+
+import statistics
+import time
+import tracemalloc
+
+from django.test import Client
+from django.urls import reverse
+
+from .cache import get_cache
+from .datagen import NOUNS
+from .models import Category, InventoryItem
+
+
+# Return the given percentile of a sorted list of timings
+def percentile(timings, percent):
+    index = min(len(timings) - 1, max(0, round(percent / 100 * len(timings)) - 1))
+    return timings[index]
+
+
+# Summarise a list of timings in milliseconds
+def summarise(timings):
+    timings = sorted(timings)
+    return {
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": timings[-1],
+    }
+
+
+# Drives the main views through the test client and measures latency, queries per request and
+# peak memory. Each scenario is a request to time, optionally preceded by an untimed preparation
+# step, and is run the same number of times as every other scenario.
+class ViewBenchmark:
+    def __init__(self, user, admin, requests=200, warmup=10, memory_runs=5):
+        self.user = user
+        self.requests = requests
+        self.warmup = warmup
+        self.memory_runs = memory_runs
+        self.client = Client()
+        self.client.force_login(user)
+        self.admin_client = Client()
+        self.admin_client.force_login(admin)
+        self.item_ids = list(InventoryItem.objects.filter(user=user).order_by("id").values_list("id", flat=True))
+        self.category_id = Category.objects.order_by("id").values_list("id", flat=True).first()
+
+    # Form data of an item written by the add and edit scenarios
+    def item_data(self, name, number):
+        return {"name": f"{name} {number}", "quantity": number % 9, "category": self.category_id or ""}
+
+    # The scenarios by name, each a (prepare, request) pair of functions taking the run number
+    def scenarios(self):
+        item_id = lambda number: self.item_ids[number % len(self.item_ids)]
+        item_changelist = reverse("admin:inventory_inventoryitem_changelist")
+        return {
+            "dashboard": (None, lambda number: self.client.get(reverse("dashboard"))),
+            "dashboard_uncached": (
+                lambda number: get_cache().clear(),
+                lambda number: self.client.get(reverse("dashboard")),
+            ),
+            "dashboard_sorted_low_stock": (
+                None, lambda number: self.client.get(reverse("dashboard"), {"sort": "-quantity", "low": "1"})
+            ),
+            "admin_view": (None, lambda number: self.admin_client.get(reverse("admin-view"))),
+            "analytics": (None, lambda number: self.admin_client.get(reverse("analytics"))),
+            "analytics_slice": (
+                None, lambda number: self.admin_client.get(reverse("analytics"), {"low_only": "on", "edited_within": 7})
+            ),
+            "admin_item_list": (None, lambda number: self.admin_client.get(item_changelist)),
+            "admin_item_list_page_50": (None, lambda number: self.admin_client.get(item_changelist, {"p": 50})),
+            "admin_item_list_category": (
+                None, lambda number: self.admin_client.get(item_changelist, {"category": self.category_id})
+            ),
+            "admin_item_list_low_stock": (None, lambda number: self.admin_client.get(item_changelist, {"low": "1"})),
+            "admin_item_list_search": (
+                None, lambda number: self.admin_client.get(item_changelist, {"q": NOUNS[number % len(NOUNS)]})
+            ),
+            "add_item": (
+                None,
+                lambda number: self.client.post(reverse("add-item"), self.item_data("Bench", number)),
+            ),
+            "edit_item": (
+                lambda number: self.load_version(item_id(number)),
+                lambda number: self.client.post(
+                    reverse("edit-item", args=[item_id(number)]),
+                    {**self.item_data("Edited", number), "version": self.version},
+                ),
+            ),
+            "delete_item": (
+                self.create_item,
+                lambda number: self.client.post(reverse("delete-item", args=[self.deletable])),
+            ),
+        }
+
+    # Read the version of the item the next edit_item run edits, which the edit form sends back
+    def load_version(self, item_id):
+        self.version = InventoryItem.objects.filter(pk=item_id).values_list("version", flat=True).get()
+
+    # Create an item for the next delete_item run
+    def create_item(self, number):
+        self.deletable = InventoryItem.objects.create(name=f"Delete {number}", quantity=1, user=self.user).id
+
+    # Run one request, returning its latency in milliseconds and the queries it ran
+    def timed(self, prepare, request, number):
+        if prepare:
+            prepare(number)
+        start = time.perf_counter()
+        response = request(number)
+        elapsed = (time.perf_counter() - start) * 1000
+        # Successful form posts redirect, a 200 means the form was rejected
+        expected = 302 if response.wsgi_request.method == "POST" else 200
+        if response.status_code != expected:
+            raise RuntimeError(f"{response.wsgi_request.path} answered {response.status_code}, expected {expected}")
+        return elapsed, getattr(response.wsgi_request, "query_count", None)
+
+    # Run every scenario, or the named ones, and return their results
+    def run(self, names=None):
+        results = {}
+        for name, (prepare, request) in self.scenarios().items():
+            if names and name not in names:
+                continue
+            for number in range(self.warmup):
+                self.timed(prepare, request, number)
+            timings, queries = [], []
+            for number in range(self.requests):
+                elapsed, query_count = self.timed(prepare, request, self.warmup + number)
+                timings.append(elapsed)
+                queries.append(query_count)
+
+            # Peak memory is measured in separate runs, as tracing allocations slows every request
+            peak = 0
+            tracemalloc.start()
+            try:
+                for number in range(self.warmup + self.requests, self.warmup + self.requests + self.memory_runs):
+                    if prepare:
+                        prepare(number)
+                    tracemalloc.reset_peak()
+                    self.timed(None, request, number)
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+            results[name] = {
+                "requests": self.requests,
+                **summarise(timings),
+                "queries_per_request": None if None in queries else statistics.fmean(queries),
+                "peak_memory_kb": peak / 1024,
+            }
+        return results
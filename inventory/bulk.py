@@ -0,0 +1,174 @@
+# bulk.py
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import DO_NOTHING, Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import get_categories_by_id
+from .ledger import insert_from_select
+from .models import InventoryMovement, LowStockAlert, UserInventorySummary, low_stock_threshold
+
+logger = logging.getLogger("inventory.bulk")
+
+# Actions that can be applied to many items at once, with their labels
+ACTIONS = {
+    "set_quantity": "Set quantity",
+    "set_category": "Change category",
+    "reassign": "Reassign to user",
+    "delete": "Delete",
+}
+
+# Error shown for a username items cannot be reassigned to, the same whether or not it exists
+REASSIGN_ERROR = "Enter the username of an active user to reassign the items to."
+
+
+# The bulk actions a user may run, reassigning items to another user is for staff
+def available_actions(user):
+    return {action: label for action, label in ACTIONS.items() if action != "reassign" or user.is_staff}
+
+
+# The user items may be reassigned to under a username, None if there is no such active user
+def reassign_target(username):
+    return User.objects.filter(username=username, is_active=True).first() if username else None
+
+
+# Insert one row into a model's table for every item of a queryset with one INSERT ... SELECT,
+# the columns given as {column: expression over the item}
+def insert_per_item(model, items, columns):
+    aliases = {f"bulk_{column}": expression for column, expression in columns.items()}
+    insert_from_select(model, list(columns), items.annotate(**aliases).values_list(*aliases))
+
+
+# Write the ledger rows of items changing to new quantity, category and owner expressions
+def record_bulk_movements(items, kind, now, user=F("user_id"), category=F("category_id"), quantity=F("quantity"),
+                          delta=Value(0)):
+    insert_per_item(InventoryMovement, items, {
+        "item_id": F("id"), "user_id": user, "category_id": category, "kind": Value(kind),
+        "quantity": quantity, "quantity_delta": delta, "created_at": Value(now),
+    })
+
+
+# Queue the alerts of the items whose quantity or threshold changes cross their low stock
+# threshold, comparing old and new in SQL so no item is loaded
+def record_bulk_alerts(items, now, quantity=F("quantity"), threshold=None):
+    items = items.annotate(
+        old_threshold=low_stock_threshold(), new_quantity=quantity, new_threshold=threshold or low_stock_threshold()
+    )
+    was_low = Q(quantity__lte=F("old_threshold"))
+    is_low = Q(new_quantity__lte=F("new_threshold"))
+    insert_per_item(LowStockAlert, items.filter((was_low & ~is_low) | (~was_low & is_low)), {
+        "user_id": F("user_id"), "item_id": F("id"), "item_name": F("name"),
+        "event": Case(When(is_low, then=Value(LowStockAlert.LOW)), default=Value(LowStockAlert.RESTOCKED)),
+        "quantity": F("new_quantity"), "previous_quantity": F("quantity"), "created_at": Value(now),
+        "status": Value(LowStockAlert.PENDING), "attempts": Value(0), "next_attempt_at": Value(now),
+        "last_error": Value(""),
+    })
+
+
+# Delete the rows of a queryset with one DELETE, without loading them to send their delete
+# signals or collect their related rows, and return how many were deleted. That is only safe
+# while every relation to the model leaves deleting to the database, so any relation whose
+# on_delete the ORM would have to run, such as CASCADE or PROTECT, is refused.
+def raw_delete(items):
+    for relation in items.model._meta.get_fields(include_hidden=True):
+        if relation.auto_created and not relation.concrete and relation.on_delete is not DO_NOTHING:
+            raise ValueError(
+                f"{relation.related_model._meta.label}.{relation.field.name} refers to "
+                f"{items.model._meta.label} with {relation.on_delete.__name__}, which a raw delete would skip."
+            )
+    return items._raw_delete(items.db)
+
+
+# Delete every item of a queryset with one DELETE after writing their ledger rows with one
+# INSERT ... SELECT, and return how many were deleted. The owners' summaries are left for the
+# caller to rebuild once.
+def delete_items(items, now):
+    record_bulk_movements(items, InventoryMovement.DELETED, now, quantity=Value(0), delta=-F("quantity"))
+    # Skipping the delete signals is safe, this writes the ledger rows of the item_deleted
+    # receiver above and its callers rebuild the summaries it would have updated
+    return raw_delete(items)
+
+
+# Apply an action to every item of a queryset with a fixed number of queries however many items
+# it holds, in one transaction: one UPDATE or DELETE of the items, INSERT ... SELECTs of their
+# ledger rows and alerts, and one rebuild of the owners' summaries. value is the new quantity,
+# category id or user id. Returns a summary of what changed, which is also logged with the
+# acting user and the item ids for auditing.
+def apply_bulk_action(items, action, value=None, actor=None):
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown bulk action {action!r}.")
+    now = timezone.now()
+    with transaction.atomic(using=items.db):
+        before = items.aggregate(items=Count("id"), quantity=Coalesce(Sum("quantity"), 0))
+        selected = list(items.values_list("id", "user_id"))
+        ids, owners = [pk for pk, _ in selected], {user_id for _, user_id in selected}
+        items = items.model.objects.using(items.db).filter(pk__in=ids)
+        bump = {"version": F("version") + 1, "last_edited": now}
+
+        if action == "set_quantity":
+            changed = items.exclude(quantity=value)
+            record_bulk_movements(
+                changed, InventoryMovement.UPDATED, now, quantity=Value(value), delta=Value(value) - F("quantity")
+            )
+            record_bulk_alerts(changed, now, quantity=Value(value))
+            updated = changed.update(quantity=value, **bump)
+        elif action == "set_category":
+            changed = items.filter(category__isnull=False) if value is None else items.exclude(category=value)
+            category = get_categories_by_id().get(value)
+            category_threshold = category.low_stock_threshold if category is not None else None
+            record_bulk_movements(
+                changed, InventoryMovement.UPDATED, now, category=Value(value, output_field=IntegerField())
+            )
+            record_bulk_alerts(changed, now, threshold=Coalesce(
+                F("low_stock_threshold"),
+                Value(settings.LOW_QUANTITY if category_threshold is None else category_threshold),
+            ))
+            updated = changed.update(category=value, **bump)
+        elif action == "reassign":
+            changed = items.exclude(user=value)
+            record_bulk_movements(
+                changed, InventoryMovement.TRANSFERRED_OUT, now, quantity=Value(0), delta=-F("quantity")
+            )
+            record_bulk_movements(
+                changed, InventoryMovement.TRANSFERRED_IN, now, user=Value(value), delta=F("quantity")
+            )
+            updated = changed.update(user=value, **bump)
+            owners.add(value)
+        else:
+            updated = delete_items(items, now)
+
+        UserInventorySummary.rebuild(sorted(owners))
+        after = items.aggregate(items=Count("id"), quantity=Coalesce(Sum("quantity"), 0))
+
+    summary = {
+        "action": action,
+        "value": value,
+        "selected": before["items"],
+        "changed": updated,
+        "owners": len(owners),
+        "quantity_before": before["quantity"],
+        "quantity_after": after["quantity"],
+    }
+    logger.info("%s applied %s to items %s: %s", actor or "system", action, ids, summary)
+    return summary
+
+
+# One line describing the outcome of a bulk action, for flash messages
+def describe_bulk_action(summary):
+    changed = summary["changed"]
+    items = f"{changed} item{'s' if changed != 1 else ''}"
+    unchanged = summary["selected"] - changed
+    text = {
+        "set_quantity": f"Set the quantity of {items} to {summary['value']}",
+        "set_category": f"Moved {items} to another category",
+        "reassign": f"Reassigned {items}",
+        "delete": f"Deleted {items}",
+    }[summary["action"]]
+    if unchanged and summary["action"] != "delete":
+        text += f", {unchanged} already matched"
+    return f"{text}. Total quantity went from {summary['quantity_before']} to {summary['quantity_after']}."
@@ -0,0 +1,76 @@
+# cache.py
+
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .metrics import record_cache
+
+# Cache key holding the current version of the category catalogue
+CATEGORY_VERSION_KEY = "inventory:categories:version"
+
+
+# Return the cache configured for the inventory app
+def get_cache():
+    return caches[settings.INVENTORY_CACHE_ALIAS]
+
+
+# Return the current version token stored under a key, creating one if there is none yet.
+# Tokens are random rather than counters, so a version evicted from the cache can never
+# come back with the same value and resurrect entries cached under the old one.
+def get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+# Replace the version token under a key, so every entry cached under the old one is ignored
+def bump_version(key):
+    get_cache().set(key, uuid4().hex, None)
+
+
+# Bump a version now and again once the current transaction commits, so readers that
+# cached the old rows while the transaction was still open are invalidated as well
+def bump_version_on_commit(key):
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+# Return every category ordered by name, read through the cache
+def get_categories():
+    from .models import Category
+
+    cache = get_cache()
+    key = f"inventory:categories:{get_version(CATEGORY_VERSION_KEY)}"
+    categories = cache.get(key)
+    record_cache("categories", categories is not None)
+    if categories is None:
+        categories = list(Category.objects.order_by("name", "id"))
+        cache.set(key, categories, settings.CATEGORY_CACHE_TIMEOUT)
+    return categories
+
+
+# Return the cached categories keyed by primary key
+def get_categories_by_id():
+    return {category.pk: category for category in get_categories()}
+
+
+# Invalidate the cached category catalogue after a category is saved or deleted
+def invalidate_categories():
+    bump_version_on_commit(CATEGORY_VERSION_KEY)
+
+
+# Return the current version token of the category catalogue
+def categories_version():
+    return get_version(CATEGORY_VERSION_KEY)
+
+
+# Build a cache key or ETag value from the parts that decide the content of a page
+def make_token(*parts):
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
@@ -0,0 +1,120 @@
+# datagen.py
+
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .bulk import raw_delete
+from .ledger import record_openings
+from .models import Category, InventoryItem, UserInventorySummary
+
+# Prefix of the usernames and category names created by the generator
+PREFIX = "gen-"
+
+# Words item names are built from
+ADJECTIVES = ("Black", "Compact", "Wireless", "Refurbished", "Spare", "Rugged", "Portable", "Backup")
+NOUNS = ("Laptop", "Monitor", "Keyboard", "Mouse", "Dock", "Cable", "Headset", "Router", "Phone", "Tablet")
+
+# Share of items generated without a category
+UNCATEGORISED_SHARE = 0.1
+
+# Mean of the exponential distribution quantities are drawn from, most items are near zero
+MEAN_QUANTITY = 20
+
+
+# Columns of the item rows written by the generator
+ITEM_COLUMNS = ("name", "quantity", "category", "user", "date_created", "last_edited", "assigned_date")
+
+
+# Insert rows of column values into a model's table with multi-row INSERT statements. This
+# skips building a model instance and preparing every value per row as bulk_create does,
+# which is most of its cost at this scale, so the values must already be in database form.
+def insert_rows(model, field_names, rows, using="default"):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(model._meta.get_field(name).column) for name in field_names)
+    row_placeholder = "(" + ", ".join(["%s"] * len(field_names)) + ")"
+    # Stay under the backend's limit on parameters per statement
+    per_statement = max(1, (connection.features.max_query_params or 30_000) // len(field_names))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_statement):
+            chunk = rows[start:start + per_statement]
+            cursor.execute(
+                f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES "
+                + ", ".join([row_placeholder] * len(chunk)),
+                [value for row in chunk for value in row],
+            )
+
+
+# Cumulative Zipf weights for count ranks, the item at rank r gets weight 1 / r ** skew, so a
+# skew of 0 spreads evenly and higher values pile more of the items onto the first ranks
+def zipf_weights(count, skew):
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+# Create users, categories and items with skewed distributions using batched bulk inserts, and
+# return the ids of the generated users. The users share one password hash, and their summaries
+# and the items' opening movements are written once at the end, as bulk inserts do not send the
+# signals that maintain them. Low stock alerts are not queued, the generated users are not
+# people to alert and the items low from the start would fill the outbox.
+def generate_inventory(users=100, categories=20, items=100_000, skew=1.1, seed=42, batch_size=5000,
+                       password=None, prefix=PREFIX, using="default"):
+    rng = random.Random(seed)
+    password_hash = make_password(password)
+    with transaction.atomic(using=using):
+        User.objects.using(using).bulk_create(
+            [User(username=f"{prefix}user-{i}", password=password_hash) for i in range(users)],
+            batch_size=batch_size,
+        )
+        Category.objects.using(using).bulk_create(
+            [Category(name=f"{prefix}category-{i}") for i in range(categories)], batch_size=batch_size
+        )
+    # Rank users and categories in creation order, so the first ones hold the most items
+    user_ids = list(
+        User.objects.using(using).filter(username__startswith=prefix).order_by("id").values_list("id", flat=True)
+    )
+    category_ids = list(
+        Category.objects.using(using).filter(name__startswith=prefix).order_by("id").values_list("id", flat=True)
+    )
+    user_weights = zipf_weights(len(user_ids), skew)
+    category_weights = zipf_weights(len(category_ids), skew)
+
+    # Every generated item is stamped with the same creation time
+    now = connections[using].ops.adapt_datetimefield_value(timezone.now())
+    for start in range(0, items, batch_size):
+        count = min(batch_size, items - start)
+        owners = rng.choices(user_ids, cum_weights=user_weights, k=count)
+        categorised = category_ids and rng.choices(category_ids, cum_weights=category_weights, k=count)
+        rows = [
+            (
+                f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randrange(10_000):04d}",
+                int(rng.expovariate(1 / MEAN_QUANTITY)),
+                categorised[index] if categorised and rng.random() >= UNCATEGORISED_SHARE else None,
+                owner,
+                now,
+                now,
+                now,
+            )
+            for index, owner in enumerate(owners)
+        ]
+        with transaction.atomic(using=using):
+            insert_rows(InventoryItem, ITEM_COLUMNS, rows, using)
+
+    UserInventorySummary.rebuild(user_ids)
+    with transaction.atomic(using=using):
+        record_openings(InventoryItem.objects.using(using).filter(user__in=user_ids))
+    return user_ids
+
+
+# Delete everything the generator created, the items and summaries go with their users
+def delete_generated(prefix=PREFIX, using="default"):
+    with transaction.atomic(using=using):
+        # Skipping the delete signals is safe, the summaries they would update are deleted with
+        # the users below, and tearing down benchmark data writes no deletions to the ledger
+        raw_delete(InventoryItem.objects.using(using).filter(user__username__startswith=prefix))
+        User.objects.using(using).filter(username__startswith=prefix).delete()
+        Category.objects.using(using).filter(name__startswith=prefix).delete()
@@ -0,0 +1,91 @@
+# exporters.py
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Columns written by every export, with the model lookups they are read from. Reading
+# category and user names through values_list joins them in the same query.
+EXPORT_COLUMNS = (
+    ("id", "id"),
+    ("name", "name"),
+    ("quantity", "quantity"),
+    ("category", "category__name"),
+    ("username", "user__username"),
+    ("date_created", "date_created"),
+    ("last_edited", "last_edited"),
+)
+
+# Content types of the supported export formats
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+}
+
+# Number of rows joined into each chunk written to the response
+ROWS_PER_WRITE = 500
+
+
+# Pseudo buffer that hands back what is written to it, so csv.writer can build lines for streaming
+class Echo:
+    def write(self, value):
+        return value
+
+
+# Iterate over the export rows of a queryset as tuples, fetching chunk_size rows at a time
+# so memory use stays flat no matter how many items are exported
+def export_rows(queryset, chunk_size=2000):
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.order_by("id").values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+# Group the encoded rows into larger chunks, so the response is not written a line at a time
+def batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= ROWS_PER_WRITE:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+# Stream the rows as CSV with a header line
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    yield from batched(writer.writerow(row) for row in rows)
+
+
+# Encode one row as a JSON object
+def encode_row(row):
+    return json.dumps(dict(zip((column for column, _ in EXPORT_COLUMNS), row)), cls=DjangoJSONEncoder)
+
+
+# Stream the rows as a single JSON array
+def stream_json(rows):
+    yield "["
+    yield from batched(("," if index else "") + encode_row(row) for index, row in enumerate(rows))
+    yield "]"
+
+
+# Stream the rows as JSON Lines, one object per line
+def stream_json_lines(rows):
+    yield from batched(encode_row(row) + "\n" for row in rows)
+
+
+# Return the generator encoding export rows in a format
+def encode_export(rows, export_format):
+    if export_format == "json":
+        return stream_json(rows)
+    if export_format == "jsonl":
+        return stream_json_lines(rows)
+    return stream_csv(rows)
+
+
+# Return the streaming generator for an export format
+def stream_export(queryset, export_format, chunk_size=2000):
+    return encode_export(export_rows(queryset, chunk_size), export_format)
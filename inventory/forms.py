@@ -1,7 +1,11 @@
 # forms.py
+from datetime import timedelta
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.forms.models import ModelChoiceIterator
+from .bulk import ACTIONS, REASSIGN_ERROR, available_actions, reassign_target
+from .cache import get_categories, get_categories_by_id
 from .models import Category, InventoryItem
 
 
@@ -17,13 +21,150 @@ class UserRegisterForm(UserCreationForm):
         fields = ["username", "email", "password1", "password2"]
 
 
+# Choice iterator that lists the categories from the cached catalogue instead of a query
+class CachedCategoryIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in get_categories():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(get_categories()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(get_categories())
+
+
+# Category choice field backed by the cached catalogue, used by the item forms and the admin
+class CategoryChoiceField(forms.ModelChoiceField):
+    iterator = CachedCategoryIterator
+
+    def __init__(self, queryset=None, **kwargs):
+        super().__init__(queryset=Category.objects.all() if queryset is None else queryset, **kwargs)
+
+    # Resolve the submitted id against the cached catalogue
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Category):
+            value = value.pk
+        try:
+            return get_categories_by_id()[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value}
+            )
+
+
 # Form for inventory item creation/update
 class InventoryItemForm(forms.ModelForm):
-    category = forms.ModelChoiceField(queryset=Category.objects.all(), initial=0)
+    category = CategoryChoiceField(initial=0)
     quantity = forms.IntegerField(min_value=0, widget=forms.NumberInput(attrs={'min': 0}))
 
     class Meta:
         # Define the model for the form
         model = InventoryItem
         # Define the fields to be included in the form
-        fields = ["name", "quantity", "category"]
+        fields = ["name", "quantity", "category", "low_stock_threshold"]
+        help_texts = {"low_stock_threshold": "Leave empty to use the category's threshold."}
+
+
+# Form for editing an item, it carries the version of the item the form was filled in from so
+# saving it cannot overwrite a change saved by someone else in the meantime
+class InventoryItemEditForm(InventoryItemForm):
+    class Meta(InventoryItemForm.Meta):
+        fields = InventoryItemForm.Meta.fields + ["version"]
+        widgets = {"version": forms.HiddenInput}
+
+
+# Form for uploading a CSV, JSON or JSON Lines file of inventory items
+class ItemImportForm(forms.Form):
+    file = forms.FileField(help_text="Columns: name, quantity and category (the category name).")
+    format = forms.ChoiceField(
+        choices=[("", "Detect from file name"), ("csv", "CSV"), ("json", "JSON array"), ("jsonl", "JSON Lines")],
+        required=False,
+    )
+    create_categories = forms.BooleanField(required=False, help_text="Create categories that do not exist yet.")
+    background = forms.BooleanField(
+        required=False, help_text="Import the file in the background, for large files. Progress is shown on the jobs page."
+    )
+
+
+# Form validating the item fields sent to the JSON API, checks run without touching the
+# database so a batch of items can be validated without one query per item
+class ItemPayloadForm(forms.Form):
+    name = forms.CharField(max_length=InventoryItem._meta.get_field("name").max_length)
+    quantity = forms.IntegerField(min_value=0)
+    category = CategoryChoiceField(required=False)
+    low_stock_threshold = forms.IntegerField(min_value=0, required=False)
+
+
+# Form applying one bulk action to items the user selected from their own inventory, the value
+# the action needs is checked in clean() so the other actions can leave it empty
+class BulkActionForm(forms.Form):
+    items = forms.ModelMultipleChoiceField(queryset=InventoryItem.objects.none(), widget=forms.MultipleHiddenInput)
+    action = forms.ChoiceField(choices=list(ACTIONS.items()))
+    quantity = forms.IntegerField(min_value=0, required=False)
+    category = CategoryChoiceField(required=False, empty_label="No category")
+    username = forms.CharField(max_length=150, required=False, label="Reassign to")
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["items"].queryset = InventoryItem.objects.filter(user=user)
+        self.fields["action"].choices = list(available_actions(user).items())
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get("action")
+        if action == "set_quantity" and cleaned_data.get("quantity") is None:
+            self.add_error("quantity", "Enter the quantity to set.")
+        if action == "reassign":
+            cleaned_data["user"] = reassign_target(cleaned_data.get("username"))
+            if cleaned_data["user"] is None:
+                self.add_error("username", REASSIGN_ERROR)
+        return cleaned_data
+
+    # The value apply_bulk_action() needs for the chosen action
+    def action_value(self):
+        action, data = self.cleaned_data["action"], self.cleaned_data
+        if action == "set_quantity":
+            return data["quantity"]
+        if action == "set_category":
+            return data["category"].pk if data["category"] else None
+        if action == "reassign":
+            return data["user"].pk
+        return None
+
+
+# Categories to slice the analytics by, items without a category are chosen as "none"
+def slice_category_choices():
+    return [("none", "No category"), *((str(category.pk), category.name) for category in get_categories())]
+
+
+# Form choosing an ad hoc slice of every user's items on the analytics page
+class AnalyticsSliceForm(forms.Form):
+    username = forms.CharField(max_length=150, required=False, label="User")
+    categories = forms.MultipleChoiceField(choices=slice_category_choices, required=False)
+    low_only = forms.BooleanField(required=False, label="Low stock only")
+    created_within = forms.IntegerField(min_value=1, required=False, label="Created in the last days")
+    edited_within = forms.IntegerField(min_value=1, required=False, label="Last edited in the last days")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username:
+            self.cleaned_data["user"] = User.objects.filter(username=username).first()
+            if self.cleaned_data["user"] is None:
+                raise forms.ValidationError("No user has this username.")
+        return username
+
+    # The keyword arguments of inventory.analytics.slice_items() for the chosen slice, as of today
+    def slice_arguments(self, today):
+        data = self.cleaned_data
+        return {
+            "user_ids": [data["user"].pk] if data["username"] else None,
+            "category_ids": [None if pk == "none" else int(pk) for pk in data["categories"]] or None,
+            "low_only": data["low_only"],
+            "created_since": today - timedelta(days=data["created_within"] - 1) if data["created_within"] else None,
+            "edited_since": today - timedelta(days=data["edited_within"] - 1) if data["edited_within"] else None,
+        }
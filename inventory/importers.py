@@ -0,0 +1,264 @@
+# importers.py
+
+import csv
+import io
+import json
+import time
+
+from django.db import transaction
+
+from .alerts import record_threshold_alerts
+from .cache import get_categories
+from .ledger import record_movements
+from .models import Category, InventoryItem, UserInventorySummary, sanitise_name
+
+# Maximum length of an item name, taken from the model field
+NAME_MAX_LENGTH = InventoryItem._meta.get_field("name").max_length
+
+# Whitespace allowed between JSON values
+JSON_WHITESPACE = " \t\r\n"
+
+
+# Raised when an import file cannot be parsed at all
+class ImportFormatError(ValueError):
+    pass
+
+
+# Work out the file format from a file name, defaulting to CSV
+def detect_format(filename):
+    lowered = (filename or "").lower()
+    if lowered.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if lowered.endswith(".json"):
+        return "json"
+    return "csv"
+
+
+# Wrap a binary stream in a text stream, text streams are returned unchanged
+def as_text(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+# Message of a file that is not UTF-8 text. The file is decoded in chunks, so the position is
+# where the chunk holding the bad bytes starts rather than the row holding them.
+def decode_error(position):
+    return f"{position}: the file is not UTF-8 encoded text."
+
+
+# Yield the rows of a CSV file one at a time, the header row names the columns
+def iter_csv(stream):
+    number = 0
+    try:
+        for number, row in enumerate(csv.DictReader(as_text(stream)), start=1):
+            yield row
+    except UnicodeDecodeError:
+        raise ImportFormatError(decode_error(f"Row {number + 1}"))
+    except csv.Error as error:
+        raise ImportFormatError(f"Row {number + 1}: {error}")
+
+
+# Yield the rows of a JSON Lines file one at a time, blank lines are skipped
+def iter_json_lines(stream):
+    number = 0
+    try:
+        for number, line in enumerate(as_text(stream), start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise ImportFormatError(f"Line {number}: {error}")
+    except UnicodeDecodeError:
+        raise ImportFormatError(decode_error(f"Line {number + 1}"))
+
+
+# Yield the values of a top level JSON array one at a time, reading the stream in chunks
+# so only the value being decoded is held in memory rather than the whole document
+def iter_json_array(stream, chunk_size=64 * 1024):
+    stream = as_text(stream)
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+    values = 0
+
+    # Read the next chunk of the stream
+    def read():
+        try:
+            return stream.read(chunk_size)
+        except UnicodeDecodeError:
+            raise ImportFormatError(decode_error(f"Value {values + 1}"))
+
+    # Return the next non whitespace character, reading more of the stream when needed
+    def peek():
+        nonlocal buffer, position, eof
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position] if position < len(buffer) else ""
+            chunk = read()
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+
+    if peek() != "[":
+        raise ImportFormatError("Expected a JSON array.")
+    position += 1
+    if peek() == "]":
+        return
+    while True:
+        # Decode the next value, reading more data until it is complete
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof:
+                    raise ImportFormatError(f"Invalid JSON: {error}")
+            else:
+                # A value running to the end of the buffer may be cut short, unless the stream ended
+                if end < len(buffer) or eof:
+                    break
+            chunk = read()
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+        position = end
+        values += 1
+        yield value
+        separator = peek()
+        position += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ImportFormatError("Expected ',' or ']' in JSON array.")
+
+
+# Yield the rows of an import file in the given format
+def iter_rows(stream, file_format):
+    if file_format == "json":
+        return iter_json_array(stream)
+    if file_format == "jsonl":
+        return iter_json_lines(stream)
+    return iter_csv(stream)
+
+
+# Outcome of an import, with the per-row error report
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+        self.seconds = 0.0
+        # Why the file could not be read to the end, the rows before it are imported
+        self.format_error = None
+
+    # Total number of rows read from the file
+    @property
+    def rows(self):
+        return self.created + len(self.errors)
+
+    # Import throughput in rows per second
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+# Streams rows into InventoryItem with batched bulk_create calls, one transaction per batch
+class ItemImporter:
+    def __init__(self, user, batch_size=1000, create_categories=False):
+        self.user = user
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        # Load every category once from the cached catalogue, rows are resolved against
+        # this case insensitive lookup
+        self.categories = {category.name.lower(): category.pk for category in get_categories()}
+
+    # Resolve a category name to its id, creating the category if allowed
+    def category_id(self, name):
+        key = name.strip().lower()
+        if key in self.categories:
+            return self.categories[key]
+        if not self.create_categories:
+            raise ValueError(f"Unknown category '{name}'.")
+        category = Category.objects.create(name=name.strip())
+        self.categories[category.name.lower()] = category.pk
+        return category.pk
+
+    # Validate a batch of (row number, row) pairs with the same rules as InventoryItem.save,
+    # returning the items to insert and the errors of the rows that were rejected
+    def prepare_batch(self, batch):
+        items, errors = [], []
+        names = [
+            sanitise_name(str(row.get("name") or "").strip()) if isinstance(row, dict) else ""
+            for _, row in batch
+        ]
+        for (number, row), name in zip(batch, names):
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("Row is not an object.")
+                if not name:
+                    raise ValueError("Name is required.")
+                if len(name) > NAME_MAX_LENGTH:
+                    raise ValueError(f"Name is longer than {NAME_MAX_LENGTH} characters.")
+                try:
+                    quantity = int(row.get("quantity"))
+                except (TypeError, ValueError):
+                    raise ValueError("Quantity must be a whole number.")
+                if quantity < 0:
+                    raise ValueError("Quantity cannot be negative.")
+                category = str(row.get("category") or "").strip()
+                category_id = self.category_id(category) if category else None
+            except ValueError as error:
+                errors.append((number, str(error)))
+                continue
+            items.append(
+                InventoryItem(name=name, quantity=quantity, category_id=category_id, user=self.user)
+            )
+        return items, errors
+
+    # Insert one batch of rows with their ledger movements and the alerts of the items that
+    # start at or below their low stock threshold, inside its own transaction
+    def import_batch(self, batch, result):
+        items, errors = self.prepare_batch(batch)
+        with transaction.atomic():
+            InventoryItem.objects.bulk_create(items, batch_size=self.batch_size)
+            record_movements([(item.pk, None, item.tracked_state(), True) for item in items])
+            record_threshold_alerts([(None, item) for item in items])
+        result.created += len(items)
+        result.errors.extend(errors)
+
+    # Import every row, bulk_create bypasses the signals so the summary is rebuilt at the end.
+    # progress is called with the result after every batch. A file that stops parsing part way
+    # stops the import, the batches already committed stay and the error is kept on the result.
+    def run(self, rows, progress=None):
+        result = ImportResult()
+        start = time.perf_counter()
+        batch = []
+        try:
+            try:
+                for number, row in enumerate(rows, start=1):
+                    batch.append((number, row))
+                    if len(batch) >= self.batch_size:
+                        self.import_batch(batch, result)
+                        batch = []
+                        if progress:
+                            progress(result)
+            except ImportFormatError as error:
+                result.format_error = str(error)
+            if batch:
+                self.import_batch(batch, result)
+        finally:
+            UserInventorySummary.rebuild([self.user.pk])
+            result.seconds = time.perf_counter() - start
+        return result
+
+    # Import the same rows one save() at a time, used as the baseline when benchmarking
+    def run_one_by_one(self, rows):
+        result = ImportResult()
+        start = time.perf_counter()
+        for number, row in enumerate(rows, start=1):
+            items, errors = self.prepare_batch([(number, row)])
+            for item in items:
+                item.save()
+            result.created += len(items)
+            result.errors.extend(errors)
+        result.seconds = time.perf_counter() - start
+        return result
@@ -0,0 +1,326 @@
+# jobs.py
+
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .alerts import AlertDispatcher
+from .analytics import refresh_analytics
+from .exporters import encode_export, export_rows
+from .importers import ItemImporter, iter_rows
+from .ledger import prune_snapshots, take_snapshot
+from .models import InventoryItem, Job, JobClaimLost, UserInventorySummary
+
+logger = logging.getLogger("inventory.jobs")
+
+# Job functions by the name they are queued under. A job function is called with the Job and
+# its arguments, may report progress through job.report_progress(), and returns a JSON result.
+JOBS = {}
+
+
+# Register a job function under a name. max_attempts overrides JOB_MAX_ATTEMPTS, for jobs that
+# must not run again once they have partly written their changes.
+def register_job(name, max_attempts=None):
+    def decorator(function):
+        function.max_attempts = max_attempts
+        JOBS[name] = function
+        return function
+    return decorator
+
+
+# Storage of the files handed to and from jobs, workers must share it with the web servers
+def job_storage():
+    return FileSystemStorage(location=settings.JOB_FILES_DIR)
+
+
+# Queue a job to run as soon as a worker is free, or not before run_at
+def enqueue(name, user=None, run_at=None, **arguments):
+    if name not in JOBS:
+        raise ValueError(f"Unknown job {name!r}.")
+    return Job.objects.create(name=name, user=user, arguments=arguments, run_at=run_at or timezone.now())
+
+
+# Serialise a job for the progress API and the jobs page
+def serialize_job(job):
+    return {
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "progress": job.progress,
+        "progress_total": job.progress_total,
+        "percent": job.percent,
+        "attempts": job.attempts,
+        "result": job.result,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# The jobs a worker may claim: queued jobs that are due, and running jobs whose claim expired
+def due_jobs(now):
+    return Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING], run_at__lte=now)
+
+
+# Most runs of a job, JOB_MAX_ATTEMPTS unless its function was registered with its own
+def max_attempts(name):
+    function = JOBS.get(name)
+    return (function and function.max_attempts) or settings.JOB_MAX_ATTEMPTS
+
+
+# Claim the given due jobs with a token. A running job whose claim expired lost its worker part
+# way through, which counts as a failed attempt: it is claimed again with one more attempt, or
+# failed if that was its last. The UPDATEs repeat the due condition, which leaves out the jobs
+# another worker claimed since they were read.
+def claim_rows(rows, token, now):
+    exhausted = [
+        pk for pk, name, status, attempts in rows if status == Job.RUNNING and attempts + 1 >= max_attempts(name)
+    ]
+    due = due_jobs(now).filter(id__in=[row[0] for row in rows])
+    due.filter(id__in=exhausted, status=Job.RUNNING).update(
+        status=Job.FAILED, claim_token=token, attempts=F("attempts") + 1, finished_at=now,
+        last_error="The claim on the job expired before it finished.",
+    )
+    due.exclude(id__in=exhausted).update(
+        status=Job.RUNNING,
+        claim_token=token,
+        attempts=Case(When(status=Job.RUNNING, then=F("attempts") + 1), default=F("attempts")),
+        run_at=now + timedelta(seconds=settings.JOB_CLAIM_TIMEOUT),
+        started_at=now,
+    )
+
+
+# Claim up to limit due jobs, oldest first, and return them. Where the database supports SELECT
+# ... FOR UPDATE SKIP LOCKED, workers claiming at the same time skip each other's rows instead of
+# waiting for them. SQLite has no row locks but runs one write at a time, so there the candidates
+# are claimed with UPDATEs repeating the due condition.
+def claim_jobs(limit, now=None):
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    candidates = due_jobs(now).order_by("run_at", "id").values_list("id", "name", "status", "attempts")
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claim_rows(list(candidates.select_for_update(skip_locked=True)[:limit]), token, now)
+    else:
+        claim_rows(list(candidates[:limit]), token, now)
+    return list(Job.objects.filter(status=Job.RUNNING, claim_token=token).order_by("id"))
+
+
+# Record a failed run, scheduling a retry after a delay that doubles with every attempt or
+# failing the job once it used up its attempts. Returns the job's new status.
+def record_failure(job, error, now):
+    attempts = job.attempts + 1
+    claimed = Job.objects.filter(pk=job.pk, claim_token=job.claim_token)
+    if attempts >= max_attempts(job.name):
+        claimed.update(status=Job.FAILED, attempts=attempts, last_error=error, finished_at=now)
+        return Job.FAILED
+    delay = timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+    claimed.update(status=Job.QUEUED, attempts=attempts, last_error=error, run_at=now + delay)
+    return "retrying"
+
+
+# Run a function writing a run's outcome, again after a short pause if the database was briefly
+# unavailable, such as a table locked by another worker or a dropped connection, so a finished
+# job is not run again once its claim expires for want of one write
+def write_outcome(write, attempts=3):
+    for attempt in range(attempts):
+        try:
+            return write()
+        except OperationalError:
+            if attempt + 1 == attempts:
+                raise
+            close_old_connections()
+            time.sleep(0.05 * 2 ** attempt)
+
+
+# Run a claimed job and record its outcome, returning "succeeded", "retrying", "failed" or
+# "lost" when the claim was taken over. Runs on the worker's pool threads or processes, each
+# with its own database connection, which is closed once it is past its age like after a request.
+def run_job(job_id, claim_token):
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, status=Job.RUNNING, claim_token=claim_token).first()
+        if job is None:
+            return "lost"
+        try:
+            if job.name not in JOBS:
+                raise LookupError(f"No job is registered as {job.name!r}.")
+            result = JOBS[job.name](job, **job.arguments)
+        except JobClaimLost:
+            logger.warning("%s was taken over by another worker", job)
+            return "lost"
+        except Exception as error:
+            logger.exception("%s failed", job)
+            message = f"{type(error).__name__}: {error}"
+            return write_outcome(lambda: record_failure(job, message, timezone.now()))
+        updated = write_outcome(lambda: Job.objects.filter(pk=job.pk, claim_token=claim_token).update(
+            status=Job.SUCCEEDED, result=result, last_error="", finished_at=timezone.now()
+        ))
+        return Job.SUCCEEDED if updated else "lost"
+    finally:
+        close_old_connections()
+
+
+# Runs queued jobs on a pool of threads or processes. The worker claims as many jobs as it has
+# free slots, hands them to the pool and claims more as they finish, waiting poll_interval
+# seconds between looks at an empty queue. Threads suit jobs waiting on the database or the
+# network; processes suit jobs that keep the CPU busy in Python.
+class Worker:
+    def __init__(self, pool="thread", concurrency=4, poll_interval=None):
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unknown pool {pool!r}, use thread or process.")
+        self.pool = pool
+        self.concurrency = concurrency
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+
+    def executor(self):
+        if self.pool == "process":
+            # Processes are spawned rather than forked, so none shares the parent's connections,
+            # and set up Django before they import this module to unpickle their first job
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job")
+
+    # Run jobs until interrupted, or with once=True until no job is due and none is running.
+    # Returns how many runs ended in each outcome, "error" counting the runs that failed outside
+    # the job function, such as a lost database connection or a pool process that died, whose
+    # jobs are run again once their claim expires.
+    def run(self, once=False):
+        counts = Counter()
+        running = set()
+        with self.executor() as executor:
+            while True:
+                free = self.concurrency - len(running)
+                try:
+                    claimed = claim_jobs(free) if free else []
+                except OperationalError:
+                    # A busy database is tried again after a pause rather than stopping the worker
+                    logger.warning("Claiming jobs failed, trying again", exc_info=True)
+                    close_old_connections()
+                    time.sleep(self.poll_interval)
+                    continue
+                for job in claimed:
+                    running.add(executor.submit(run_job, job.pk, job.claim_token))
+                if not running:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        outcome = future.result()
+                    except Exception:
+                        logger.exception("A job run failed outside the job")
+                        outcome = "error"
+                    counts[outcome] += 1
+        return counts
+
+
+# Write the export of a user's items, or every item when user_id is None, to a file
+@register_job("export_items")
+def export_items_job(job, export_format, user_id=None):
+    items = InventoryItem.objects.all() if user_id is None else InventoryItem.objects.filter(user=user_id)
+    total = items.count()
+    job.report_progress(0, total)
+    exported = 0
+
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            yield row
+            exported += 1
+            if exported % settings.EXPORT_CHUNK_SIZE == 0:
+                job.report_progress(exported)
+
+    name = f"exports/job-{job.pk}.{export_format}"
+    path = job_storage().path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as output:
+        for chunk in encode_export(counted(export_rows(items, settings.EXPORT_CHUNK_SIZE)), export_format):
+            output.write(chunk)
+    job.report_progress(exported, exported)
+    return {"file": name, "rows": exported}
+
+
+# Import an uploaded file into a user's inventory, reporting progress in bytes read. Batches are
+# committed as they go, so a failed import is not run again.
+@register_job("import_items", max_attempts=1)
+def import_items_job(job, user_id, file, file_format, create_categories=False):
+    storage = job_storage()
+    importer = ItemImporter(
+        User.objects.get(pk=user_id), batch_size=settings.IMPORT_BATCH_SIZE, create_categories=create_categories
+    )
+    size = storage.size(file)
+    try:
+        with storage.open(file, "rb") as upload:
+            result = importer.run(
+                iter_rows(upload, file_format), progress=lambda result: job.report_progress(upload.tell(), size)
+            )
+    finally:
+        storage.delete(file)
+    job.report_progress(size, size)
+    return {
+        "created": result.created,
+        "rows": result.rows,
+        "rejected": len(result.errors),
+        "errors": result.errors[:100],
+        "seconds": result.seconds,
+        "error": result.format_error,
+    }
+
+
+# Recompute the inventory summaries of some users, or every user
+@register_job("rebuild_summaries")
+def rebuild_summaries_job(job, user_ids=None):
+    return {"users": len(UserInventorySummary.rebuild(user_ids))}
+
+
+# Deliver every low stock alert that is due
+@register_job("deliver_alerts")
+def deliver_alerts_job(job):
+    dispatcher = AlertDispatcher()
+    totals = Counter()
+    while True:
+        counts = dispatcher.run_once()
+        totals.update(counts)
+        if counts["claimed"] < dispatcher.batch_size:
+            return dict(totals)
+
+
+# Take a ledger snapshot, keeping the newest keep snapshots if given
+@register_job("take_snapshot")
+def take_snapshot_job(job, keep=None):
+    snapshot = take_snapshot()
+    pruned = prune_snapshots(keep) if keep else 0
+    return {"snapshot": snapshot.pk, "items": snapshot.item_count, "pruned": pruned}
+
+
+# Bring the analytics rollups up to date, or rebuild them all
+@register_job("refresh_analytics")
+def refresh_analytics_job(job, full=False):
+    return refresh_analytics(full)
+
+
+# Sleep for a number of seconds, used to measure the queue's own throughput
+@register_job("wait")
+def wait_job(job, seconds=0):
+    time.sleep(seconds)
+    return {"seconds": seconds}
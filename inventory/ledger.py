@@ -0,0 +1,205 @@
+# ledger.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import Count, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value
+from django.utils import timezone
+
+from .models import InventoryMovement, InventorySnapshot, InventorySnapshotLine
+
+
+# Return the unsaved movements of one item changing from its old tracked state to its new one,
+# either of which is None when the item is created or deleted. old is also None when an existing
+# item was saved without its previous state loaded, the movement's delta is unknown then.
+def item_movements(item_id, old, new, created=False, now=None):
+    now = now or timezone.now()
+
+    def movement(kind, state, quantity, delta):
+        return InventoryMovement(
+            item_id=item_id, user_id=state["user_id"], category_id=state["category_id"], kind=kind,
+            quantity=quantity, quantity_delta=delta, created_at=now,
+        )
+
+    if new is None:
+        return [movement(InventoryMovement.DELETED, old, 0, -old["quantity"])] if old else []
+    if old is None:
+        if created:
+            return [movement(InventoryMovement.CREATED, new, new["quantity"], new["quantity"])]
+        return [movement(InventoryMovement.UPDATED, new, new["quantity"], None)]
+    if old["user_id"] != new["user_id"]:
+        return [
+            movement(InventoryMovement.TRANSFERRED_OUT, old, 0, -old["quantity"]),
+            movement(InventoryMovement.TRANSFERRED_IN, new, new["quantity"], new["quantity"]),
+        ]
+    if old["quantity"] == new["quantity"] and old["category_id"] == new["category_id"]:
+        return []
+    return [movement(InventoryMovement.UPDATED, new, new["quantity"], new["quantity"] - old["quantity"])]
+
+
+# The state of an item as the ledger last recorded it, for saves where the previous state was not
+# loaded, None if the ledger holds no movement of the item
+def recorded_state(item_id):
+    latest = (
+        InventoryMovement.objects.filter(item_id=item_id)
+        .order_by("-created_at", "-id")
+        .values("kind", "user_id", "category_id", "quantity")
+        .first()
+    )
+    if latest is None or latest.pop("kind") == InventoryMovement.DELETED:
+        return None
+    return latest
+
+
+# Write the movements of a list of (item id, old state, new state, created) changes in one
+# insert, for bulk writes that send no signals
+def record_movements(changes):
+    now = timezone.now()
+    movements = [movement for change in changes for movement in item_movements(*change, now=now)]
+    return InventoryMovement.objects.bulk_create(movements)
+
+
+# Insert the rows selected by a values_list queryset into a model's table with one
+# INSERT ... SELECT, so they never travel through Python
+def insert_from_select(model, columns, queryset):
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        # The queryset can match no row, such as a filter on an empty list of ids
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(column) for column in columns)}) {sql}",
+            params,
+        )
+
+
+# Columns of the opening movements, in the order record_openings selects their values, which is
+# the item fields followed by the annotations
+OPENING_COLUMNS = ["item_id", "user_id", "category_id", "quantity", "quantity_delta", "kind", "created_at"]
+
+
+# Record the current state of the items of a queryset as opening balances with one INSERT ...
+# SELECT, for items written by bulk inserts that send no signals
+def record_openings(items, now=None):
+    rows = items.order_by().annotate(
+        quantity_delta=F("quantity"),
+        kind=Value(InventoryMovement.OPENING),
+        created_at=Value(now or timezone.now(), output_field=DateTimeField()),
+    ).values_list("id", "user_id", "category_id", "quantity", "quantity_delta", "kind", "created_at")
+    insert_from_select(InventoryMovement, OPENING_COLUMNS, rows)
+
+
+# Columns of the snapshot lines, in the order the selects building them return their values, which
+# is the model fields followed by the annotated snapshot id
+LINE_COLUMNS = ["item_id", "user_id", "category_id", "quantity", "snapshot_id"]
+
+
+# Take a snapshot of every item's state at a point in time, LEDGER_SNAPSHOT_SETTLE seconds ago by
+# default. Movements are stamped before their transaction commits, so the settle time leaves long
+# transactions time to commit before the snapshot covers them. The lines are the previous
+# snapshot's lines of the items without movements since, plus the latest state of every item that
+# moved, so building a snapshot reads the movements since the last one rather than the whole ledger.
+def take_snapshot(taken_at=None):
+    taken_at = taken_at or timezone.now() - timedelta(seconds=settings.LEDGER_SNAPSHOT_SETTLE)
+    with transaction.atomic():
+        if InventorySnapshot.objects.filter(taken_at__gte=taken_at).exists():
+            raise ValueError(f"A snapshot at or after {taken_at} already exists.")
+        previous = InventorySnapshot.objects.filter(taken_at__lt=taken_at).order_by("-taken_at").first()
+        snapshot = InventorySnapshot.objects.create(taken_at=taken_at)
+
+        window = InventoryMovement.objects.filter(created_at__lte=taken_at)
+        if previous is not None:
+            window = window.filter(created_at__gt=previous.taken_at)
+            carried = (
+                InventorySnapshotLine.objects.filter(snapshot=previous)
+                .exclude(item_id__in=window.values("item_id"))
+                .annotate(new_snapshot=Value(snapshot.pk))
+                .values_list("item_id", "user_id", "category_id", "quantity", "new_snapshot")
+            )
+            insert_from_select(InventorySnapshotLine, LINE_COLUMNS, carried)
+        latest = window.filter(item_id=OuterRef("item_id")).order_by("-created_at", "-id").values("id")[:1]
+        moved = (
+            window.filter(id=Subquery(latest))
+            .exclude(kind__in=InventoryMovement.REMOVING_KINDS)
+            .annotate(new_snapshot=Value(snapshot.pk))
+            .values_list("item_id", "user_id", "category_id", "quantity", "new_snapshot")
+        )
+        insert_from_select(InventorySnapshotLine, LINE_COLUMNS, moved)
+
+        totals = snapshot.lines.aggregate(items=Count("id"), quantity=Sum("quantity"))
+        snapshot.item_count, snapshot.total_quantity = totals["items"], totals["quantity"] or 0
+        snapshot.save(update_fields=["item_count", "total_quantity"])
+    return snapshot
+
+
+# Delete all but the newest keep snapshots and return how many were deleted, the ledger itself is
+# never pruned
+def prune_snapshots(keep):
+    stale = InventorySnapshot.objects.order_by("-taken_at").values_list("id", flat=True)[keep:]
+    _, deleted = InventorySnapshot.objects.filter(id__in=list(stale)).delete()
+    return deleted.get(InventorySnapshot._meta.label, 0)
+
+
+# Apply (kind, item id, category id, quantity) movement rows in order to {item id: (category id,
+# quantity)} levels
+def apply_movements(levels, rows):
+    for kind, item_id, category_id, quantity in rows:
+        if kind in InventoryMovement.REMOVING_KINDS:
+            levels.pop(item_id, None)
+        else:
+            levels[item_id] = (category_id, quantity)
+    return levels
+
+
+# Return {item id: (category id, quantity)} for the items a user held at a point in time, read
+# from the latest snapshot before it and the user's movements between the two
+def levels_at(user_id, at):
+    snapshot = InventorySnapshot.objects.filter(taken_at__lte=at).order_by("-taken_at").first()
+    levels = {}
+    movements = InventoryMovement.objects.filter(user_id=user_id, created_at__lte=at)
+    if snapshot is not None:
+        lines = snapshot.lines.filter(user_id=user_id).values_list("item_id", "category_id", "quantity")
+        levels = {item_id: (category_id, quantity) for item_id, category_id, quantity in lines}
+        movements = movements.filter(created_at__gt=snapshot.taken_at)
+    return apply_movements(
+        levels, movements.order_by("created_at", "id").values_list("kind", "item_id", "category_id", "quantity")
+    )
+
+
+# Quantity of one item at a point in time, None if it did not exist then
+def item_quantity_at(item_id, at):
+    latest = (
+        InventoryMovement.objects.filter(item_id=item_id, created_at__lte=at)
+        .order_by("-created_at", "-id")
+        .values_list("kind", "quantity")
+        .first()
+    )
+    if latest is None or latest[0] == InventoryMovement.DELETED:
+        return None
+    return latest[1]
+
+
+# Net change of each of a user's items since a point in time, from the movements since then
+def changes_since(user_id, since):
+    return (
+        InventoryMovement.objects.filter(user_id=user_id, created_at__gt=since)
+        .values("item_id")
+        .annotate(net_change=Sum("quantity_delta"), movements=Count("id"), last_movement=Max("created_at"))
+        .order_by("item_id")
+    )
+
+
+# Return {item id: (category id, quantity)} for a user at a point in time by replaying the
+# user's whole history, the baseline point in time queries are benchmarked against
+def replay_levels_at(user_id, at):
+    rows = (
+        InventoryMovement.objects.filter(user_id=user_id, created_at__lte=at)
+        .order_by("created_at", "id")
+        .values_list("kind", "item_id", "category_id", "quantity")
+    )
+    return apply_movements({}, rows)
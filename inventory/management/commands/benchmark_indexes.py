@@ -0,0 +1,142 @@
+# benchmark_indexes.py
+
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from inventory.bulk import raw_delete
+from inventory.models import Category, InventoryItem, low_stock_condition
+
+# Prefix used for the usernames and category names created by the benchmark
+PREFIX = "bench-index-"
+
+
+# Management command that seeds a large item table and compares query plans and latencies
+# of the dashboard's hot filters with and without the InventoryItem indexes
+class Command(BaseCommand):
+    help = "Benchmark InventoryItem query plans and latencies before and after adding its indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to benchmark against.")
+        parser.add_argument("--items", type=int, default=1_000_000, help="Number of items to seed.")
+        parser.add_argument("--users", type=int, default=100, help="Number of users to spread the items over.")
+        parser.add_argument("--repeat", type=int, default=20, help="Number of timed runs per query.")
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per bulk_create batch.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--keep-data", action="store_true", help="Keep the seeded rows afterwards.")
+        parser.add_argument(
+            "--noinput", "--no-input", action="store_false", dest="interactive",
+            help="Do not ask for confirmation before dropping and recreating the indexes.",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        connection = connections[using]
+        if options["interactive"]:
+            answer = input(
+                f"This drops and recreates the InventoryItem indexes on '{connection.settings_dict['NAME']}'.\n"
+                "Type 'yes' to continue: "
+            )
+            if answer != "yes":
+                raise CommandError("Benchmark cancelled.")
+
+        user_ids = self.seed(using, options["items"], options["users"], options["batch_size"])
+        target = user_ids[len(user_ids) // 2]
+        results = {"vendor": connection.vendor, "items": options["items"], "users": len(user_ids)}
+        try:
+            # Measure without the indexes first, then restore them and measure again
+            indexes = InventoryItem._meta.indexes
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(InventoryItem, index)
+            results["before"] = self.measure(using, target, options["repeat"])
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(InventoryItem, index)
+            results["after"] = self.measure(using, target, options["repeat"])
+        finally:
+            if not options["keep_data"]:
+                self.cleanup(using)
+
+        for name, before in results["before"].items():
+            after = results["after"][name]
+            self.stdout.write(
+                f"{name:<24} before {before['median_ms']:>9.3f} ms   after {after['median_ms']:>9.3f} ms"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def seed(self, using, item_count, user_count, batch_size):
+        # Create the benchmark users, categories and items with batched bulk inserts
+        rng = random.Random(42)
+        password = make_password(None)
+        with transaction.atomic(using=using):
+            User.objects.using(using).bulk_create(
+                [User(username=f"{PREFIX}{i}", password=password) for i in range(user_count)]
+            )
+            Category.objects.using(using).bulk_create([Category(name=f"{PREFIX}{i}") for i in range(20)])
+        user_ids = list(
+            User.objects.using(using).filter(username__startswith=PREFIX).values_list("id", flat=True)
+        )
+        category_ids = list(
+            Category.objects.using(using).filter(name__startswith=PREFIX).values_list("id", flat=True)
+        )
+        for start in range(0, item_count, batch_size):
+            with transaction.atomic(using=using):
+                InventoryItem.objects.using(using).bulk_create(
+                    [
+                        InventoryItem(
+                            name=f"Asset {rng.randrange(100_000):05d}",
+                            quantity=rng.randrange(50),
+                            category_id=rng.choice(category_ids),
+                            user_id=rng.choice(user_ids),
+                        )
+                        for _ in range(min(batch_size, item_count - start))
+                    ],
+                    batch_size=batch_size,
+                )
+        return user_ids
+
+    def hot_queries(self, using, user_id):
+        # The queries the dashboard and admin pages run against the item table
+        items = InventoryItem.objects.using(using)
+        return {
+            "dashboard_page_by_id": items.filter(user=user_id).order_by("id")[:50],
+            "dashboard_page_by_name": items.filter(user=user_id).order_by("name", "id")[:50],
+            "recently_edited": items.filter(user=user_id).order_by("-last_edited", "-id")[:50],
+            "low_stock_rows": items.filter(low_stock_condition(), user=user_id).order_by("quantity"),
+            "name_lookup": items.filter(name="Asset 04242"),
+        }
+
+    def measure(self, using, user_id, repeat):
+        # Record the query plan and the latency distribution of every hot query
+        results = {}
+        for name, queryset in self.hot_queries(using, user_id).items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "plan": queryset.explain(),
+                "median_ms": statistics.median(timings),
+                "max_ms": max(timings),
+            }
+        return results
+
+    def cleanup(self, using):
+        # Delete everything the benchmark created, the items go with their users
+        with transaction.atomic(using=using):
+            # Skipping the delete signals is safe, the summaries they would update are deleted
+            # with the users below, and tearing down benchmark data writes no deletions to the ledger
+            raw_delete(InventoryItem.objects.using(using).filter(user__username__startswith=PREFIX))
+            User.objects.using(using).filter(username__startswith=PREFIX).delete()
+            Category.objects.using(using).filter(name__startswith=PREFIX).delete()
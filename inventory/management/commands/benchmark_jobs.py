@@ -0,0 +1,74 @@
+# benchmark_jobs.py
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from inventory.jobs import Worker, due_jobs
+from inventory.models import Job
+
+
+# Management command that measures the throughput of the job queue. For every pool and
+# concurrency it queues a batch of jobs that sleep for a while, runs a worker until they are done
+# and reports the jobs finished per second, then deletes the jobs. Jobs that only sleep show the
+# cost of claiming and recording jobs; longer sleeps stand in for jobs waiting on I/O.
+class Command(BaseCommand):
+    help = "Benchmark job queue throughput on thread and process pools of different sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=200, help="Jobs queued for each run.")
+        parser.add_argument("--seconds", type=float, default=0.05, help="Seconds each job sleeps.")
+        parser.add_argument(
+            "--pools", nargs="+", choices=["thread", "process"], default=["thread", "process"], help="Pools to measure."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Numbers of jobs run at the same time."
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        # The worker would run any other due job along with the benchmark's and skew the numbers
+        if due_jobs(timezone.now()).exists():
+            raise CommandError("Jobs are due, run the benchmark against a queue with no other jobs.")
+        results = {
+            "vendor": connection.vendor,
+            "jobs": options["jobs"],
+            "seconds": options["seconds"],
+            "runs": [],
+        }
+        for pool in options["pools"]:
+            for concurrency in options["concurrency"]:
+                run = self.measure(pool, concurrency, options["jobs"], options["seconds"])
+                results["runs"].append(run)
+                self.stdout.write(
+                    f"{pool:<8} x{concurrency:<3} {run['jobs_per_second']:>9.1f} jobs/s   "
+                    f"{run['elapsed_seconds']:>7.2f} s   {run['succeeded']} succeeded"
+                )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def measure(self, pool, concurrency, count, seconds):
+        # The jobs are committed so the pool's own connections see them, and deleted afterwards
+        now = timezone.now()
+        jobs = Job.objects.bulk_create(
+            [Job(name="wait", arguments={"seconds": seconds}, run_at=now) for _ in range(count)]
+        )
+        try:
+            started = time.perf_counter()
+            counts = Worker(pool=pool, concurrency=concurrency, poll_interval=0.01).run(once=True)
+            elapsed = time.perf_counter() - started
+        finally:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+        return {
+            "pool": pool,
+            "concurrency": concurrency,
+            "elapsed_seconds": elapsed,
+            "jobs_per_second": count / elapsed,
+            "succeeded": counts["succeeded"],
+            "outcomes": dict(counts),
+        }
@@ -0,0 +1,148 @@
+# benchmark_ledger.py
+
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory.ledger import levels_at, replay_levels_at, take_snapshot
+from inventory.models import InventoryMovement, InventorySnapshot
+
+# Prefix of the usernames created for a benchmark run
+PREFIX = "bench-ledger-"
+
+# Share of the daily movements that move an item to another user
+TRANSFER_SHARE = 0.05
+
+
+# Management command that writes a synthetic movement history with a snapshot every day, then
+# compares point in time queries answered from the latest snapshot plus the movements since with
+# replaying the whole ledger, at points early and late in the history
+class Command(BaseCommand):
+    help = "Benchmark point in time stock queries from snapshots against replaying the movement ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Number of users owning the items.")
+        parser.add_argument("--items", type=int, default=20_000, help="Number of items in the history.")
+        parser.add_argument("--days", type=int, default=30, help="Days of history to write.")
+        parser.add_argument("--movements-per-day", type=int, default=10_000, help="Movements written per day.")
+        parser.add_argument("--repeat", type=int, default=10, help="Timed runs per query.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed of the history.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options["days"] < 2:
+            raise CommandError("--days must be at least 2.")
+        # Write the history and run the queries in one transaction that is rolled back, existing
+        # snapshots are set aside inside it so the synthetic ones can be taken in the past
+        with transaction.atomic():
+            InventorySnapshot.objects.all().delete()
+            user_ids, start, write_seconds, snapshot_seconds = self.write_history(options)
+            # The first user holds the most items, so the queries show the worst case
+            user_id = user_ids[0]
+            results = {
+                "vendor": connection.vendor,
+                "items": options["items"],
+                "movements": options["items"] + options["days"] * options["movements_per_day"],
+                "write_seconds": write_seconds,
+                "snapshot_median_ms": statistics.median(snapshot_seconds) * 1000,
+                "points": {},
+            }
+            # Query half a day after a snapshot, so both ways read that day's movements
+            for day in sorted({1, options["days"] // 4, options["days"] // 2, options["days"] - 1}):
+                at = start + timedelta(days=day, hours=12)
+                results["points"][f"day {day}"] = self.measure(user_id, at, options["repeat"])
+            transaction.set_rollback(True)
+
+        for name, point in results["points"].items():
+            self.stdout.write(
+                f"{name:<8} snapshot {point['snapshot_median_ms']:>9.3f} ms   "
+                f"replay {point['replay_median_ms']:>9.3f} ms   {point['items']} items"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def write_history(self, options):
+        # Open every item on the first day, then move random items every day and snapshot the
+        # ledger at the end of each day, returning the users, the start time and the timings
+        rng = random.Random(options["seed"])
+        password = make_password(None)
+        User.objects.bulk_create([User(username=f"{PREFIX}{i}", password=password) for i in range(options["users"])])
+        user_ids = list(User.objects.filter(username__startswith=PREFIX).order_by("id").values_list("id", flat=True))
+        weights = [1 / rank for rank in range(1, len(user_ids) + 1)]
+        # Item ids above any real item, the ledger's references are not constrained
+        first_id = (InventoryMovement.objects.order_by("-item_id").values_list("item_id", flat=True).first() or 0) + 1
+        start = timezone.now() - timedelta(days=options["days"] + 1)
+
+        state = {}
+        movements = []
+        for offset, user_id in enumerate(rng.choices(user_ids, weights=weights, k=options["items"])):
+            state[first_id + offset] = (user_id, rng.randrange(50))
+        for item_id, (user_id, quantity) in state.items():
+            movements.append(InventoryMovement(
+                item_id=item_id, user_id=user_id, kind=InventoryMovement.OPENING, quantity=quantity,
+                quantity_delta=quantity, created_at=start,
+            ))
+
+        write_seconds, snapshot_seconds = 0.0, []
+        item_ids = list(state)
+        for day in range(options["days"]):
+            day_start = start + timedelta(days=day)
+            for second in sorted(rng.randrange(1, 86_400) for _ in range(options["movements_per_day"])):
+                at = day_start + timedelta(seconds=second)
+                item_id = rng.choice(item_ids)
+                user_id, quantity = state[item_id]
+                if rng.random() < TRANSFER_SHARE:
+                    owner = rng.choices(user_ids, weights=weights)[0]
+                    movements.append(InventoryMovement(
+                        item_id=item_id, user_id=user_id, kind=InventoryMovement.TRANSFERRED_OUT, quantity=0,
+                        quantity_delta=-quantity, created_at=at,
+                    ))
+                    movements.append(InventoryMovement(
+                        item_id=item_id, user_id=owner, kind=InventoryMovement.TRANSFERRED_IN, quantity=quantity,
+                        quantity_delta=quantity, created_at=at,
+                    ))
+                    state[item_id] = (owner, quantity)
+                else:
+                    new_quantity = max(0, quantity + rng.randint(-5, 5))
+                    movements.append(InventoryMovement(
+                        item_id=item_id, user_id=user_id, kind=InventoryMovement.UPDATED, quantity=new_quantity,
+                        quantity_delta=new_quantity - quantity, created_at=at,
+                    ))
+                    state[item_id] = (user_id, new_quantity)
+            began = time.perf_counter()
+            InventoryMovement.objects.bulk_create(movements, batch_size=5000)
+            write_seconds += time.perf_counter() - began
+            movements = []
+
+            began = time.perf_counter()
+            take_snapshot(day_start + timedelta(days=1))
+            snapshot_seconds.append(time.perf_counter() - began)
+        return user_ids, start, write_seconds, snapshot_seconds
+
+    def measure(self, user_id, at, repeat):
+        # Time both ways of answering the query and check they agree
+        timings = {"snapshot": [], "replay": []}
+        for _ in range(repeat):
+            for name, query in (("snapshot", levels_at), ("replay", replay_levels_at)):
+                began = time.perf_counter()
+                levels = query(user_id, at)
+                timings[name].append((time.perf_counter() - began) * 1000)
+                if name == "snapshot":
+                    expected = levels
+                elif levels != expected:
+                    raise CommandError(f"Snapshot and replay disagree at {at}.")
+        return {
+            "items": len(expected),
+            "snapshot_median_ms": statistics.median(timings["snapshot"]),
+            "replay_median_ms": statistics.median(timings["replay"]),
+        }
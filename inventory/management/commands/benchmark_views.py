@@ -0,0 +1,113 @@
+# benchmark_views.py
+
+import json
+import platform
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from inventory.analytics import refresh_analytics
+from inventory.benchmarking import ViewBenchmark
+from inventory.datagen import generate_inventory
+from inventory.models import InventoryItem
+
+# Prefix of the data generated for a benchmark run
+PREFIX = "bench-views-"
+
+
+# Management command that drives the main views through the test client on generated data, and
+# reports latency percentiles, queries per request and peak memory, optionally against an earlier run
+class Command(BaseCommand):
+    help = "Benchmark the dashboard, admin view and item forms on generated data, writing JSON results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50, help="Number of users to generate.")
+        parser.add_argument("--categories", type=int, default=20, help="Number of categories to generate.")
+        parser.add_argument("--items", type=int, default=50_000, help="Number of items to generate.")
+        parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the generated data.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed of the generated data.")
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=10, help="Untimed requests run before each scenario.")
+        parser.add_argument("--scenario", action="append", dest="scenarios", help="Only run this scenario.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="JSON results of an earlier run to compare with.")
+        parser.add_argument(
+            "--max-regression", type=float,
+            help="Fail if any scenario's p95 latency grew by more than this percentage over --compare.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as previous:
+                baseline = json.load(previous)
+
+        # Generate the data and run the scenarios in one transaction that is rolled back, so the
+        # database is left as it was and every run starts from the same data
+        with transaction.atomic(), override_settings(
+            ALLOWED_HOSTS=["testserver"], QUERY_BUDGET_ACTION="log"
+        ):
+            start = time.perf_counter()
+            user_ids = generate_inventory(
+                users=options["users"], categories=options["categories"], items=options["items"],
+                skew=options["skew"], seed=options["seed"], prefix=PREFIX,
+            )
+            generated_seconds = time.perf_counter() - start
+            # Record the table statistics the planner and the admin's estimated counts read
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(InventoryItem._meta.db_table)}")
+            # Build the rollups the analytics scenarios read
+            refresh_analytics(full=True)
+            # The first generated user holds the most items, so the user scenarios show the worst case
+            user = User.objects.get(pk=user_ids[0])
+            admin = User.objects.create_superuser(username=f"{PREFIX}admin", password=None)
+            benchmark = ViewBenchmark(user, admin, requests=options["requests"], warmup=options["warmup"])
+            scenarios = benchmark.run(options["scenarios"])
+            transaction.set_rollback(True)
+
+        results = {
+            "meta": {
+                "vendor": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "users": options["users"],
+                "categories": options["categories"],
+                "items": options["items"],
+                "skew": options["skew"],
+                "seed": options["seed"],
+                "requests": options["requests"],
+                "user_items": len(benchmark.item_ids),
+                "generate_seconds": generated_seconds,
+            },
+            "scenarios": scenarios,
+        }
+        regressions = self.report(scenarios, baseline["scenarios"] if baseline else {}, options["max_regression"])
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if regressions:
+            raise CommandError(f"p95 latency regressed by more than {options['max_regression']}% in: {', '.join(regressions)}")
+
+    def report(self, scenarios, baseline, max_regression):
+        # Print one line per scenario, with the change from the baseline run when there is one
+        regressions = []
+        for name, result in scenarios.items():
+            queries = result["queries_per_request"]
+            line = (
+                f"{name:<28} p50 {result['p50_ms']:>8.2f} ms   p95 {result['p95_ms']:>8.2f} ms   "
+                f"p99 {result['p99_ms']:>8.2f} ms   queries {queries if queries is None else f'{queries:.1f}':>5}   "
+                f"peak {result['peak_memory_kb']:>8.0f} KiB"
+            )
+            before = baseline.get(name)
+            if before:
+                change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+                line += f"   p95 {change:+.1f}%"
+                if max_regression is not None and change > max_regression:
+                    regressions.append(name)
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,34 @@
+# deliver_alerts.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.alerts import AlertDispatcher
+
+
+# Management command that runs the low stock alert worker, delivering the alerts queued in the
+# outbox to the sinks configured in ALERT_SINKS
+class Command(BaseCommand):
+    help = "Deliver queued low stock alerts to the configured sinks, polling until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Deliver the alerts due now, then exit.")
+        parser.add_argument("--batch-size", type=int, help="Alerts claimed per round, ALERT_BATCH_SIZE by default.")
+        parser.add_argument("--workers", type=int, default=4, help="Threads delivering to the sinks.")
+        parser.add_argument("--interval", type=float, default=5, help="Seconds to wait when no alert is due.")
+
+    def handle(self, *args, **options):
+        dispatcher = AlertDispatcher(batch_size=options["batch_size"], workers=options["workers"])
+        try:
+            while True:
+                counts = dispatcher.run_once()
+                if counts["claimed"]:
+                    self.stdout.write(", ".join(f"{count} {state}" for state, count in counts.items()))
+                # A full batch means more alerts may be waiting, so only wait once the outbox is drained
+                if counts["claimed"] < dispatcher.batch_size:
+                    if options["once"]:
+                        return
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
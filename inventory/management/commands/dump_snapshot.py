@@ -0,0 +1,42 @@
+# dump_snapshot.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.snapshots import detect_snapshot_format, iter_dump, open_snapshot, resolve_models, write_snapshot
+
+
+# Management command that streams the database into a dumpdata style snapshot
+class Command(BaseCommand):
+    help = (
+        "Dump models as a dumpdata compatible JSON array or as JSON Lines, optionally gzipped, "
+        "reading each table in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("labels", nargs="*", help="Apps or app.Model labels to dump, every model by default.")
+        parser.add_argument("--output", "-o", help="File to write, the format and gzip are detected from its name.")
+        parser.add_argument("--format", choices=["json", "jsonl"], help="Output format, overriding the file name.")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output even without a .gz name.")
+        parser.add_argument("--exclude", "-e", action="append", default=[], help="App or app.Model label to leave out.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows read from the database per chunk.")
+        parser.add_argument("--database", default="default", help="Database alias to dump.")
+
+    def handle(self, *args, **options):
+        try:
+            models = resolve_models(options["labels"])
+            excluded = set(resolve_models(options["exclude"])) if options["exclude"] else set()
+        except LookupError as error:
+            raise CommandError(str(error))
+        models = [model for model in models if model not in excluded]
+
+        snapshot_format, gzipped = detect_snapshot_format(options["output"])
+        snapshot_format = options["format"] or snapshot_format
+        objects = iter_dump(models, options["database"], options["chunk_size"])
+        if not options["output"]:
+            # Write the snapshot to stdout as it is, without a newline after every chunk
+            self.stdout.ending = ""
+            write_snapshot(objects, self.stdout, snapshot_format)
+        else:
+            with open_snapshot(options["output"], "w", gzipped or options["gzip"]) as output:
+                count = write_snapshot(objects, output, snapshot_format)
+            self.stderr.write(f"Dumped {count} objects to {options['output']}.")
@@ -0,0 +1,48 @@
+# generate_inventory.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.datagen import PREFIX, delete_generated, generate_inventory
+
+
+# Management command that generates synthetic users, categories and items at a chosen scale
+class Command(BaseCommand):
+    help = "Generate synthetic users, categories and items with skewed distributions, much faster than loaddata."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Number of users to create.")
+        parser.add_argument("--categories", type=int, default=20, help="Number of categories to create.")
+        parser.add_argument("--items", type=int, default=100_000, help="Number of items to create.")
+        parser.add_argument(
+            "--skew", type=float, default=1.1,
+            help="Zipf exponent of the items per user and per category, 0 spreads them evenly.",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed, the same seed generates the same data.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk_create batch.")
+        parser.add_argument("--password", help="Password of the generated users, unusable by default.")
+        parser.add_argument("--prefix", default=PREFIX, help="Prefix of the generated usernames and category names.")
+        parser.add_argument("--database", default="default", help="Database alias to generate the data in.")
+        parser.add_argument("--clear", action="store_true", help="Delete previously generated data first.")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            delete_generated(options["prefix"], options["database"])
+        start = time.perf_counter()
+        user_ids = generate_inventory(
+            users=options["users"],
+            categories=options["categories"],
+            items=options["items"],
+            skew=options["skew"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            password=options["password"],
+            prefix=options["prefix"],
+            using=options["database"],
+        )
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            f"Generated {len(user_ids)} users, {options['categories']} categories and {options['items']} items "
+            f"in {seconds:.2f}s ({options['items'] / seconds if seconds else 0:,.0f} items/s)."
+        )
@@ -0,0 +1,46 @@
+# load_snapshot.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.base import DeserializationError
+from django.db import DatabaseError, IntegrityError
+
+from inventory.importers import ImportFormatError
+from inventory.snapshots import (
+    DEFAULT_BATCH_SIZE, SnapshotLoader, detect_snapshot_format, exclude_objects, iter_snapshot, open_snapshot,
+)
+
+
+# Management command that loads a dumpdata style snapshot much faster than loaddata
+class Command(BaseCommand):
+    help = (
+        "Load a dumpdata style JSON array or JSON Lines snapshot, optionally gzipped, by streaming it "
+        "and bulk inserting each model's objects in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot file, such as data.json, snapshot.jsonl or snapshot.json.gz.")
+        parser.add_argument("--format", choices=["json", "jsonl"], help="File format, detected from the name by default.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Objects per model per insert batch.")
+        parser.add_argument("--database", default="default", help="Database alias to load the snapshot into.")
+        parser.add_argument("--exclude", "-e", action="append", default=[], help="App or app.Model label to skip.")
+        parser.add_argument(
+            "--ignorenonexistent", "-i", action="store_true",
+            help="Ignore models and fields that no longer exist, like loaddata.",
+        )
+
+    def handle(self, *args, **options):
+        snapshot_format, gzipped = detect_snapshot_format(options["path"])
+        loader = SnapshotLoader(options["database"], options["batch_size"], options["ignorenonexistent"])
+        try:
+            with open_snapshot(options["path"], "r", gzipped) as stream:
+                objects = iter_snapshot(stream, options["format"] or snapshot_format)
+                result = loader.load(exclude_objects(objects, options["exclude"]))
+        except (OSError, ImportFormatError, DeserializationError, IntegrityError, DatabaseError, ValueError) as error:
+            raise CommandError(f"Could not load {options['path']}: {error}")
+
+        for label, count in sorted(result.counts.items()):
+            self.stdout.write(f"{label:<32} {count}")
+        self.stdout.write(
+            f"Loaded {result.objects} objects in {result.seconds:.2f}s "
+            f"({result.objects / result.seconds if result.seconds else 0:,.0f} objects/s)."
+        )
@@ -0,0 +1,103 @@
+# loadtest.py
+
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.benchmarking import summarise
+
+# Pages requested by default, the dashboard and the API reads served by the async views
+DEFAULT_PATHS = ["/dashboard/", "/api/items/", "/api/categories/"]
+
+
+# Management command that loads a running server with concurrent logged in users and reports
+# the latency distribution, used to compare the WSGI stack with the ASGI stack and async views
+class Command(BaseCommand):
+    help = "Send concurrent requests as a logged in user to a running server and report tail latencies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running server.")
+        parser.add_argument("--user", required=True, help="Username the requests are made as.")
+        parser.add_argument("--path", action="append", dest="paths", help="Path to request, may be repeated.")
+        parser.add_argument("--concurrency", type=int, default=20, help="Number of simultaneous users.")
+        parser.add_argument("--requests", type=int, default=500, help="Number of requests per path.")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds before a request is abandoned.")
+        parser.add_argument("--label", default="", help="Name of this run in the JSON output, such as wsgi or asgi.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--compare", help="JSON output of an earlier run to compare the latencies with.")
+
+    def handle(self, *args, **options):
+        session = self.login(options["user"])
+        try:
+            results = {"label": options["label"], "concurrency": options["concurrency"], "paths": {}}
+            for path in options["paths"] or DEFAULT_PATHS:
+                results["paths"][path] = self.load(
+                    options["url"].rstrip("/") + path, session.session_key, options
+                )
+        finally:
+            session.delete()
+
+        baseline = {}
+        if options["compare"]:
+            with open(options["compare"]) as previous:
+                baseline = json.load(previous)["paths"]
+        for path, result in results["paths"].items():
+            line = (
+                f"{path:<24} {result['requests_per_second']:>8.1f} req/s   p50 {result['p50_ms']:>8.1f} ms   "
+                f"p95 {result['p95_ms']:>8.1f} ms   p99 {result['p99_ms']:>8.1f} ms   errors {result['errors']}"
+            )
+            if path in baseline:
+                line += f"   p99 was {baseline[path]['p99_ms']:.1f} ms"
+            self.stdout.write(line)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def login(self, username):
+        # Create a session for the user directly, as the server shares this database
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User '{username}' does not exist.")
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session
+
+    def load(self, url, session_key, options):
+        # Request the URL from concurrent workers and record the latency of every request
+        cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+
+        def fetch(_):
+            request = urllib.request.Request(url, headers={"Cookie": cookie})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options["timeout"]) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, TimeoutError):
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            outcomes = list(executor.map(fetch, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+
+        return {
+            "requests": len(outcomes),
+            "errors": sum(1 for _, ok in outcomes if not ok),
+            "requests_per_second": len(outcomes) / elapsed if elapsed else 0.0,
+            **summarise(timing for timing, _ in outcomes),
+        }
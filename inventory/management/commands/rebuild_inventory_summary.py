@@ -0,0 +1,45 @@
+# rebuild_inventory_summary.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import UserInventorySummary
+
+
+# Management command that rebuilds the per-user inventory summaries, or checks them for drift
+class Command(BaseCommand):
+    help = "Rebuild the per-user inventory summaries from scratch, or check them for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report drift, do not rebuild.")
+        parser.add_argument("--user", action="append", type=int, dest="user_ids", help="Limit to this user id.")
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not options["check"]:
+            summaries = UserInventorySummary.rebuild(user_ids)
+            self.stdout.write(f"Rebuilt {len(summaries)} inventory summaries.")
+            return
+
+        # Compare every stored summary with a fresh computation from the item table
+        expected = UserInventorySummary.compute(user_ids)
+        stored = UserInventorySummary.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        stored = {summary.user_id: summary for summary in stored}
+
+        drifted = 0
+        for user_id, values in expected.items():
+            summary = stored.get(user_id)
+            if summary is None:
+                drifted += 1
+                self.stdout.write(f"User {user_id}: summary missing")
+                continue
+            for field in UserInventorySummary.summary_fields:
+                if getattr(summary, field) != values[field]:
+                    drifted += 1
+                    self.stdout.write(
+                        f"User {user_id}: {field} is {getattr(summary, field)!r}, expected {values[field]!r}"
+                    )
+        if drifted:
+            raise CommandError(f"Found {drifted} drifted summary values, run without --check to rebuild.")
+        self.stdout.write(f"Checked {len(expected)} inventory summaries, no drift found.")
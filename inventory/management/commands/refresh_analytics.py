@@ -0,0 +1,22 @@
+# refresh_analytics.py
+
+from django.core.management.base import BaseCommand
+
+from inventory.analytics import refresh_analytics
+
+
+# Management command that brings the analytics rollups up to date, meant to be run periodically,
+# for example every few minutes from cron. Only the users whose items changed since the last
+# refresh are read again.
+class Command(BaseCommand):
+    help = "Refresh the analytics rollups from the items changed since the last refresh."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild the rollups of every user.")
+
+    def handle(self, *args, **options):
+        result = refresh_analytics(full=options["full"])
+        self.stdout.write(
+            f"{'Rebuilt' if result['full'] else 'Refreshed'} the rollups of {result['users']} "
+            f"user{'s' if result['users'] != 1 else ''} in {result['seconds']:.2f} s"
+        )
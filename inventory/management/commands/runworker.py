@@ -0,0 +1,28 @@
+# runworker.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import Worker
+
+
+# Management command that runs queued background jobs, such as exports, imports and summary
+# rebuilds, on a pool of threads or processes. Any number of workers may run side by side.
+class Command(BaseCommand):
+    help = "Run queued background jobs on a thread or process pool, polling until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread", help="Kind of pool jobs run on.")
+        parser.add_argument("--concurrency", type=int, default=4, help="Jobs run at the same time.")
+        parser.add_argument(
+            "--interval", type=float, help=f"Seconds to wait when no job is due, {settings.JOB_POLL_INTERVAL} by default."
+        )
+        parser.add_argument("--once", action="store_true", help="Run the jobs due now, then exit.")
+
+    def handle(self, *args, **options):
+        worker = Worker(pool=options["pool"], concurrency=options["concurrency"], poll_interval=options["interval"])
+        try:
+            counts = worker.run(once=options["once"])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items())) or "No jobs were due.")
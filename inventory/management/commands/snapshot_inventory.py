@@ -0,0 +1,28 @@
+# snapshot_inventory.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.ledger import prune_snapshots, take_snapshot
+
+
+# Management command that compacts the movement ledger into a new snapshot, meant to be run
+# periodically, for example hourly from cron
+class Command(BaseCommand):
+    help = "Take a snapshot of every item's stock from the movement ledger, optionally pruning old snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep", type=int, help="Delete all but this many of the newest snapshots.")
+
+    def handle(self, *args, **options):
+        if options["keep"] is not None and options["keep"] < 1:
+            raise CommandError("--keep must be at least 1.")
+        try:
+            snapshot = take_snapshot()
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            f"Snapshot at {snapshot.taken_at}: {snapshot.item_count} items, {snapshot.total_quantity} in stock"
+        )
+        if options["keep"] is not None:
+            pruned = prune_snapshots(options["keep"])
+            self.stdout.write(f"Pruned {pruned} snapshot{'s' if pruned != 1 else ''}")
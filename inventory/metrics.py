@@ -0,0 +1,164 @@
+# metrics.py
+
+import threading
+from bisect import bisect_left
+
+# Metrics recorded by the app, with their Prometheus type and help text
+METRICS = {
+    "inventory_requests_total": ("counter", "Requests served, by view, method and status code."),
+    "inventory_request_duration_seconds": ("histogram", "Time spent serving a request, by view."),
+    "inventory_db_queries_total": ("counter", "Database queries run while serving requests, by view."),
+    "inventory_db_duration_seconds_total": ("counter", "Time spent in the database while serving requests, by view."),
+    "inventory_template_render_seconds": ("histogram", "Time spent rendering a template, by template."),
+    "inventory_cache_requests_total": ("counter", "Cache lookups, by cache and result (hit or miss)."),
+}
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# The metrics recorded by one thread. Only the owning thread writes to a shard, so recording a
+# value needs no lock, and the shards are only summed when the metrics are read.
+class Shard:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.thread = threading.current_thread()
+
+    def increment(self, key, value):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, key, value):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            # One count per bucket plus the +Inf bucket, then the sum of the observed values
+            histogram = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+    # Add the values of another shard into this one
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.increment(key, value)
+        for key, histogram in list(other.histograms.items()):
+            mine = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+            for index, value in enumerate(histogram):
+                mine[index] += value
+
+
+# In-process metrics registry made of per-thread shards
+class Registry:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        # Values of shards whose thread has finished, so short lived threads do not pile up
+        self.retired = Shard()
+        # Only taken when a thread records its first value and when the metrics are read
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = Shard()
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    # Add to a counter
+    def increment(self, name, labels=(), value=1):
+        self.shard().increment((name, labels), value)
+
+    # Record a value in a histogram
+    def observe(self, name, value, labels=()):
+        self.shard().observe((name, labels), value)
+
+    # Sum every shard into one, folding the shards of finished threads into the retired values
+    def collect(self):
+        total = Shard()
+        with self.lock:
+            alive = []
+            for shard in self.shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self.retired.merge(shard)
+            self.shards = alive
+            total.merge(self.retired)
+            for shard in alive:
+                total.merge(shard)
+        return total
+
+    # Forget every recorded value
+    def reset(self):
+        with self.lock:
+            for shard in self.shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+            self.retired = Shard()
+
+
+registry = Registry()
+
+
+# Format a label set for the text format
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+# Render every metric in the Prometheus text exposition format
+def render_text():
+    total = registry.collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(total.counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            continue
+        for (metric, labels), histogram in sorted(total.histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# Record a cache lookup
+def record_cache(cache, hit):
+    registry.increment("inventory_cache_requests_total", (("cache", cache), ("result", "hit" if hit else "miss")))
+
+
+# Add an entry to the Server-Timing header of the response to this request
+def add_server_timing(request, name, seconds, description=""):
+    if not hasattr(request, "server_timing"):
+        request.server_timing = []
+    request.server_timing.append((name, seconds, description))
+
+
+# Record the time spent rendering a template, for the metrics and the Server-Timing header
+def record_render(request, template_name, seconds):
+    registry.observe("inventory_template_render_seconds", seconds, (("template", template_name),))
+    add_server_timing(request, "render", seconds, template_name)
+
+
+# Build the Server-Timing header value, durations are given in milliseconds
+def server_timing_header(entries):
+    parts = []
+    for name, seconds, description in entries:
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ", ".join(parts)
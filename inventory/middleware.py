@@ -0,0 +1,174 @@
+# middleware.py
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import add_server_timing, record_render, registry, server_timing_header
+
+logger = logging.getLogger("inventory.queries")
+
+
+# Raised when a view runs more queries than its budget allows and QUERY_BUDGET_ACTION is "raise"
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Counts the queries run on a connection and the time spent in the database
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    # Execute wrapper installed with connection.execute_wrapper
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+# The counter of the request being handled. A context variable follows each request into the
+# thread its ORM calls run in, so async requests overlapping on the one thread of sync_to_async
+# still count only their own queries.
+current_counter = ContextVar("current_counter", default=None)
+
+
+# Execute wrapper installed on every connection, adding each query to the current request's counter
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+# Receiver of connection_created, connected in InventoryConfig.ready. The wrapper stays for the
+# life of the connection: a connection.execute_wrapper block removes the last wrapper on the list
+# when it ends, which overlapping requests would do in the wrong order. It goes first on the list
+# so such blocks opened before the connection connected still remove their own wrapper.
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+# Count the queries run in the current context with counter
+@contextmanager
+def count_queries(counter):
+    token = current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        current_counter.reset(token)
+
+
+# Counts the queries and database time of every request, and logs or raises when a view runs
+# more queries than the budget configured for its URL name in QUERY_BUDGETS. Views whose query
+# count grows with the data, such as an N+1 loop, exceed their fixed budget as soon as they
+# render more than a handful of rows. It runs in the mode of the handler, so async views under
+# ASGI are not switched to a thread and back for it.
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with count_queries(counter):
+            response = self.get_response(request)
+        return self.check_budget(request, response, counter)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        with count_queries(counter):
+            response = await self.get_response(request)
+        return self.check_budget(request, response, counter)
+
+    # Compare the queries counted for a request with the budget of its view
+    def check_budget(self, request, response, counter):
+        # Kept on the request so other middleware can report the numbers
+        request.query_count, request.query_seconds = counter.count, counter.seconds
+
+        match = request.resolver_match
+        budget = settings.QUERY_BUDGETS.get(match.view_name) if match else None
+        if budget is None:
+            budget = settings.QUERY_BUDGET_DEFAULT
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path} ran {counter.count} queries in "
+                f"{counter.seconds * 1000:.1f} ms, over its budget of {budget}"
+            )
+            if settings.QUERY_BUDGET_ACTION == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+# Records the latency, status and database use of every request in the metrics registry and
+# reports where the time went in a Server-Timing header. It should come first in MIDDLEWARE so
+# the time spent in the other middleware is included, and like QueryBudgetMiddleware it runs in
+# the mode of the handler.
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, time.perf_counter() - start)
+
+    # Record a request that took seconds in the registry and the Server-Timing header
+    def record(self, request, response, seconds):
+        # Label by URL name rather than path, so the number of series stays bounded
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        labels = (("view", view),)
+        registry.observe("inventory_request_duration_seconds", seconds, labels)
+        registry.increment(
+            "inventory_requests_total", (*labels, ("method", request.method), ("status", str(response.status_code)))
+        )
+        # The query counts are left on the request by QueryBudgetMiddleware
+        query_count = getattr(request, "query_count", None)
+        if query_count is not None:
+            registry.increment("inventory_db_queries_total", labels, query_count)
+            registry.increment("inventory_db_duration_seconds_total", labels, request.query_seconds)
+            add_server_timing(request, "db", request.query_seconds, f"{query_count} queries")
+        add_server_timing(request, "total", seconds)
+        response.headers["Server-Timing"] = server_timing_header(request.server_timing)
+        return response
+
+    # Time the rendering of template responses, which happens after the view returns
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+        template_name = response.template_name
+        if isinstance(template_name, (list, tuple)):
+            template_name = template_name[0] if template_name else ""
+        response.add_post_render_callback(
+            lambda rendered: record_render(request, str(template_name), time.perf_counter() - start)
+        )
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_inventoryitem_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="inventoryitem",
+            index=models.Index(fields=["name"], name="item_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="inventoryitem",
+            index=models.Index(condition=models.Q(("quantity__lte", 3)), fields=["user", "quantity"], name="item_low_stock_idx"),
+        ),
+    ]
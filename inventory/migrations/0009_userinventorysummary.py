@@ -0,0 +1,54 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+# Build a summary row for every existing user from their current items
+def build_summaries(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    InventoryItem = apps.get_model("inventory", "InventoryItem")
+    UserInventorySummary = apps.get_model("inventory", "UserInventorySummary")
+    summaries = {user_id: UserInventorySummary(user_id=user_id) for user_id in User.objects.values_list("id", flat=True)}
+    totals = InventoryItem.objects.values("user_id").annotate(
+        total_items=Count("id"),
+        total_quantity=Sum("quantity"),
+        low_stock_count=Count("id", filter=Q(quantity__lte=settings.LOW_QUANTITY)),
+    )
+    for row in totals:
+        summary = summaries[row["user_id"]]
+        summary.total_items = row["total_items"]
+        summary.total_quantity = row["total_quantity"]
+        summary.low_stock_count = row["low_stock_count"]
+    for row in InventoryItem.objects.values("user_id", "category_id").annotate(count=Count("id")):
+        key = "none" if row["category_id"] is None else str(row["category_id"])
+        summaries[row["user_id"]].category_counts[key] = row["count"]
+    UserInventorySummary.objects.bulk_create(summaries.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_inventoryitem_hot_filter_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserInventorySummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("total_items", models.IntegerField(default=0)),
+                ("total_quantity", models.BigIntegerField(default=0)),
+                ("low_stock_count", models.IntegerField(default=0)),
+                ("category_counts", models.JSONField(default=dict)),
+                ("user", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="inventory_summary", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name_plural": "user inventory summaries",
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0009_userinventorysummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userinventorysummary",
+            name="last_modified",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="userinventorysummary",
+            name="version",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
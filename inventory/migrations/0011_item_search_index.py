@@ -0,0 +1,135 @@
+# Generated by Django 5.0.3 on 2026-10-18 15:40
+
+from django.db import migrations
+
+# SQLite keeps an FTS5 table with one row per item, its rowid being the item id. The owner
+# column holds a "u<user id>" token, so matching it narrows the search to one user's items
+# inside the full text index instead of filtering the matches afterwards. Triggers keep the
+# table in step with every write, including bulk inserts, queryset updates and raw SQL.
+SQLITE_INSTALL = [
+    """CREATE VIRTUAL TABLE inventory_item_search USING fts5(
+        name, category, owner, prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER inventory_item_search_insert AFTER INSERT ON inventory_inventoryitem BEGIN
+        INSERT INTO inventory_item_search (rowid, name, category, owner) VALUES (
+            new.id, new.name,
+            coalesce((SELECT name FROM inventory_category WHERE id = new.category_id), ''),
+            'u' || new.user_id
+        );
+    END""",
+    """CREATE TRIGGER inventory_item_search_update AFTER UPDATE OF name, category_id, user_id
+        ON inventory_inventoryitem BEGIN
+        UPDATE inventory_item_search SET
+            name = new.name,
+            category = coalesce((SELECT name FROM inventory_category WHERE id = new.category_id), ''),
+            owner = 'u' || new.user_id
+        WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER inventory_item_search_delete AFTER DELETE ON inventory_inventoryitem BEGIN
+        DELETE FROM inventory_item_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER inventory_item_search_category AFTER UPDATE OF name ON inventory_category BEGIN
+        UPDATE inventory_item_search SET category = new.name
+        WHERE rowid IN (SELECT id FROM inventory_inventoryitem WHERE category_id = new.id);
+    END""",
+    """INSERT INTO inventory_item_search (rowid, name, category, owner)
+        SELECT item.id, item.name, coalesce(category.name, ''), 'u' || item.user_id
+        FROM inventory_inventoryitem item LEFT JOIN inventory_category category ON category.id = item.category_id""",
+]
+
+SQLITE_REMOVE = [
+    "DROP TRIGGER IF EXISTS inventory_item_search_category",
+    "DROP TRIGGER IF EXISTS inventory_item_search_delete",
+    "DROP TRIGGER IF EXISTS inventory_item_search_update",
+    "DROP TRIGGER IF EXISTS inventory_item_search_insert",
+    "DROP TABLE IF EXISTS inventory_item_search",
+]
+
+# Postgres keeps a table of weighted tsvectors, the item name weighing more than its category
+# name, with a GIN index for the full text match and a btree index on the owner, which the
+# planner combines in one bitmap scan. Triggers keep it in step with every write.
+POSTGRES_INSTALL = [
+    """CREATE TABLE inventory_item_search (
+        item_id bigint PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL
+    )""",
+    "CREATE INDEX inventory_item_search_document ON inventory_item_search USING gin (document)",
+    "CREATE INDEX inventory_item_search_user ON inventory_item_search (user_id)",
+    """CREATE FUNCTION inventory_item_search_item() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM inventory_item_search WHERE item_id = OLD.id;
+            RETURN OLD;
+        END IF;
+        INSERT INTO inventory_item_search (item_id, user_id, document) VALUES (
+            NEW.id, NEW.user_id,
+            setweight(to_tsvector('simple', NEW.name), 'A')
+            || setweight(to_tsvector('simple', coalesce(
+                (SELECT name FROM inventory_category WHERE id = NEW.category_id), ''
+            )), 'B')
+        ) ON CONFLICT (item_id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER inventory_item_search_item
+        AFTER INSERT OR UPDATE OF name, category_id, user_id OR DELETE ON inventory_inventoryitem
+        FOR EACH ROW EXECUTE FUNCTION inventory_item_search_item()""",
+    """CREATE FUNCTION inventory_item_search_category() RETURNS trigger AS $$
+    BEGIN
+        UPDATE inventory_item_search SET document =
+            setweight(to_tsvector('simple', item.name), 'A')
+            || setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'B')
+        FROM inventory_inventoryitem item
+        WHERE item.category_id = NEW.id AND inventory_item_search.item_id = item.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER inventory_item_search_category AFTER UPDATE OF name ON inventory_category
+        FOR EACH ROW EXECUTE FUNCTION inventory_item_search_category()""",
+    """INSERT INTO inventory_item_search (item_id, user_id, document)
+        SELECT item.id, item.user_id,
+            setweight(to_tsvector('simple', item.name), 'A')
+            || setweight(to_tsvector('simple', coalesce(category.name, '')), 'B')
+        FROM inventory_inventoryitem item LEFT JOIN inventory_category category ON category.id = item.category_id""",
+]
+
+POSTGRES_REMOVE = [
+    "DROP TRIGGER IF EXISTS inventory_item_search_category ON inventory_category",
+    "DROP TRIGGER IF EXISTS inventory_item_search_item ON inventory_inventoryitem",
+    "DROP FUNCTION IF EXISTS inventory_item_search_category()",
+    "DROP FUNCTION IF EXISTS inventory_item_search_item()",
+    "DROP TABLE IF EXISTS inventory_item_search",
+]
+
+# Statements per backend, other backends search without an index
+STATEMENTS = {
+    "sqlite": {"install": SQLITE_INSTALL, "remove": SQLITE_REMOVE},
+    "postgresql": {"install": POSTGRES_INSTALL, "remove": POSTGRES_REMOVE},
+}
+
+
+# The SQL is kept here rather than imported from inventory/search.py, so later changes to the
+# search code cannot change what this migration does
+def run_statements(schema_editor, name):
+    for sql in STATEMENTS.get(schema_editor.connection.vendor, {}).get(name, []):
+        schema_editor.execute(sql, params=None)
+
+
+# Create the search index and its triggers, then fill it with the existing items
+def install(apps, schema_editor):
+    run_statements(schema_editor, "install")
+
+
+# Drop the search index and its triggers
+def remove(apps, schema_editor):
+    run_statements(schema_editor, "remove")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0010_userinventorysummary_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
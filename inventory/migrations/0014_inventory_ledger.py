@@ -0,0 +1,83 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Record every existing item as an opening balance, so the ledger accounts for the whole
+# inventory, with one INSERT ... SELECT rather than reading the items into Python
+def record_opening_balances(apps, schema_editor):
+    InventoryItem = apps.get_model("inventory", "InventoryItem")
+    InventoryMovement = apps.get_model("inventory", "InventoryMovement")
+    connection = schema_editor.connection
+    rows = InventoryItem.objects.using(connection.alias).order_by().annotate(
+        quantity_delta=models.F("quantity"),
+        kind=models.Value("opening"),
+        created_at=models.Value(django.utils.timezone.now(), output_field=models.DateTimeField()),
+    ).values_list("id", "user_id", "category_id", "quantity", "quantity_delta", "kind", "created_at")
+    sql, params = rows.query.get_compiler(connection=connection).as_sql()
+    quote = connection.ops.quote_name
+    columns = ["item_id", "user_id", "category_id", "quantity", "quantity_delta", "kind", "created_at"]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(InventoryMovement._meta.db_table)} "
+            f"({', '.join(quote(column) for column in columns)}) {sql}",
+            params,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_low_stock_thresholds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(unique=True)),
+                ('item_count', models.IntegerField(default=0)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('created', 'Created'), ('updated', 'Updated'), ('transferred_out', 'Transferred out'), ('transferred_in', 'Transferred in'), ('deleted', 'Deleted')], max_length=16)),
+                ('quantity', models.IntegerField()),
+                ('quantity_delta', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('category', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory.category')),
+                ('item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory.inventoryitem')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'created_at', 'id'], name='movement_item_idx'), models.Index(fields=['user', 'created_at', 'id'], name='movement_user_idx'), models.Index(fields=['created_at', 'id'], name='movement_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshotLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('category', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory.category')),
+                ('item', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventory.inventoryitem')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='inventory.inventorysnapshot')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['snapshot', 'user', 'item'], name='snapshot_line_user_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inventorysnapshotline',
+            constraint=models.UniqueConstraint(fields=('snapshot', 'item'), name='snapshot_line_unique_item'),
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:15
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+# SQLite adds a column with a database default by rebuilding the table, which breaks the search
+# triggers on it, so the search index of migration 0011 is dropped around the change and rebuilt
+# afterwards. Other backends add the column in place and keep their index.
+search_index = import_module("inventory.migrations.0011_item_search_index")
+
+
+def install_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        search_index.install(apps, schema_editor)
+
+
+def remove_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        search_index.remove(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_search, install_search),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='version',
+            field=models.PositiveIntegerField(db_default=1, default=1),
+        ),
+        migrations.RunPython(install_search, remove_search),
+    ]
@@ -1,11 +1,164 @@
 # models.py
 
-from django.db import models
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.html import strip_tags
+from .cache import get_categories_by_id
+
+# Strip tags from a name if it contains potentially harmful HTML or JavaScript code
+def sanitise_name(name):
+    if "<script>" in name or "<img" in name:
+        return strip_tags(name)  # Only strip if potentially harmful content
+    return name
+
+
+# SQL expression of an item's low stock threshold: its own override, else its category's
+# threshold, else LOW_QUANTITY. prefix reaches the item through a relation, such as "inventoryitem__".
+def low_stock_threshold(prefix=""):
+    return Coalesce(
+        F(f"{prefix}low_stock_threshold"),
+        F(f"{prefix}category__low_stock_threshold"),
+        Value(settings.LOW_QUANTITY),
+        output_field=models.IntegerField(),
+    )
+
+
+# Condition matching the items at or below their low stock threshold, evaluated in the database.
+# It is a lookup rather than a Q so filtering on it keeps the category join a LEFT JOIN, a Q
+# would turn it into an INNER JOIN and drop the items without a category.
+def low_stock_condition(prefix=""):
+    return LessThanOrEqual(F(f"{prefix}quantity"), low_stock_threshold(prefix))
+
+
+# Python counterpart of low_stock_threshold() for an item's override and category id, reading
+# the category thresholds from the cached catalogue so no query is needed
+def effective_threshold(item_threshold, category_id):
+    if item_threshold is not None:
+        return item_threshold
+    category = get_categories_by_id().get(category_id) if category_id is not None else None
+    if category is not None and category.low_stock_threshold is not None:
+        return category.low_stock_threshold
+    return settings.LOW_QUANTITY
+
+
+# Whether a tracked item state is at or below its low stock threshold
+def is_low_state(state):
+    return state["quantity"] <= effective_threshold(state["low_stock_threshold"], state["category_id"])
+
+
+# The rules save() enforces on an item or category, for a dict of field values about to be
+# written: a quantity may not be negative and a name is sanitised. Values that are SQL
+# expressions, such as F("quantity") + 1, are left to the database. Returns the values.
+def validate_values(values):
+    quantity = values.get("quantity")
+    if isinstance(quantity, int) and quantity < 0:
+        raise ValueError("Quantity cannot be negative.")
+    if isinstance(values.get("name"), str):
+        values["name"] = sanitise_name(values["name"])
+    return values
+
+
+# Apply validate_values to the given fields of many objects, all of their fields by default
+def validate_objects(objs, fields=None):
+    names = [name for name in ("name", "quantity") if fields is None or name in fields]
+    for obj in objs:
+        values = validate_values({name: obj.__dict__[name] for name in names if name in obj.__dict__})
+        obj.__dict__.update(values)
+
+
+# Queryset whose bulk writes enforce the rules of save() without calling it for every object
+class ValidatedQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        validate_objects(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        validate_objects(objs, fields)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        return super().update(**validate_values(kwargs))
+
+
+# Mixin for models that remember the values they were loaded with, so saving a loaded instance
+# only writes the columns that changed (plus auto_now columns), and rules tied to a field only
+# run when it changed. Edits of different fields of the same row then no longer undo each other.
+class ChangeTrackingMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    # Store the current values of the fields that are not deferred, or only of the given fields,
+    # by name or attname, keeping the values stored for the others
+    def remember_state(self, fields=None):
+        deferred = self.get_deferred_fields()
+        values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields)
+        }
+        if fields is not None:
+            values = {**getattr(self, "_loaded_values", {}), **values}
+        self._loaded_values = values
+
+    # The reloaded fields now hold what the row holds, so later saves compare against them rather
+    # than the values the instance was first loaded with, which would drop writes of a field set
+    # back to its first value and apply stale deltas to the summaries
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.remember_state(fields)
+
+    # Names of the fields changed since the instance was loaded or last saved, None for an
+    # instance that was not loaded from the database or whose primary key was changed since, as
+    # when copying it. Fields set while deferred count as changed.
+    def changed_fields(self):
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None or self.pk is None or loaded.get(self._meta.pk.attname) != self.pk:
+            return None
+        deferred = self.get_deferred_fields()
+        return {
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+            and (field.attname not in loaded or getattr(self, field.attname) != loaded[field.attname])
+        }
+
+    # Whether a field may have changed since the instance was loaded
+    def has_changed(self, name):
+        changed = self.changed_fields()
+        return changed is None or name in changed
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get("force_insert") and kwargs.get("update_fields") is None:
+            changed = self.changed_fields()
+            if changed is not None:
+                auto_now = {field.name for field in self._meta.concrete_fields if getattr(field, "auto_now", False)}
+                kwargs["update_fields"] = changed | auto_now
+        super().save(*args, **kwargs)
+        self.remember_state()
+
+
+# Raised when an item is saved over a newer version of its row, which would silently undo the
+# change someone else saved since the item was loaded
+class StaleItemError(Exception):
+    def __init__(self, item_id):
+        super().__init__(f"Item {item_id} was changed by someone else since it was loaded.")
+        self.item_id = item_id
+
 
 # Model representing an inventory item
-class InventoryItem(models.Model):
+class InventoryItem(ChangeTrackingMixin, models.Model):
     # Field to store the name of the item
     name = models.CharField(max_length=200)
     # Field to store the quantity of the item
@@ -25,31 +178,139 @@ class InventoryItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     # Field to store the date when the item was assigned to a user
     assigned_date = models.DateTimeField(auto_now_add=True)
+    # Quantity at or below which this item is low on stock, overriding its category's threshold
+    low_stock_threshold = models.PositiveIntegerField(blank=True, null=True)
+    # Number of times the row was written, starting at 1 also for rows inserted with raw SQL. An
+    # update only applies to the version it was loaded with, so concurrent edits cannot overwrite
+    # each other.
+    version = models.PositiveIntegerField(default=1, db_default=1)
+
+    objects = ValidatedQuerySet.as_manager()
+
+    # Fields whose previous values are remembered so summaries can be updated incrementally
+    tracked_fields = ("user_id", "quantity", "category_id", "low_stock_threshold")
+
+    # Also store the stored values of the tracked fields, or None if any of them was not loaded
+    def remember_state(self, fields=None):
+        super().remember_state(fields)
+        if all(field in self._loaded_values for field in self.tracked_fields):
+            self._loaded_state = {field: self._loaded_values[field] for field in self.tracked_fields}
+        else:
+            self._loaded_state = None
+
+    # Return the current values of the tracked fields
+    def tracked_state(self):
+        return {field: getattr(self, field) for field in self.tracked_fields}
 
     # Override save method to add custom logic before saving an InventoryItem
     def save(self, *args, **kwargs):
-        if self.quantity < 0:
-            raise ValueError("Quantity cannot be negative.")
-        # Sanitise name input if it contains potentially harmful HTML or JavaScript code
-        if "<script>" in self.name or "<img" in self.name:
-            self.name = strip_tags(self.name)   # Strip tags to avoid XSS
-        # Call the parent class save method to actually save the item to the database
-        super().save(*args, **kwargs)
+        # Reject a negative quantity, and sanitise the name if it changed, as it may contain
+        # potentially harmful HTML or JavaScript code
+        fields = ["quantity", "name"] if self.has_changed("name") else ["quantity"]
+        self.__dict__.update(validate_values({field: getattr(self, field) for field in fields}))
+        # Saving a loaded item writes the next version, on the condition checked by _do_update
+        # that the row still holds the version it was loaded with
+        expected = None
+        if not self._state.adding and "version" not in self.get_deferred_fields():
+            expected = self.version
+            self.version = expected + 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        self._expected_version = expected
+        # Call the parent class save method inside a transaction, so the post_save handlers
+        # that maintain the user's summary commit or roll back together with the item
+        try:
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+        except BaseException:
+            if expected is not None:
+                self.version = expected
+            raise
+        finally:
+            self._expected_version = None
+
+    # Run the UPDATE of a save as UPDATE ... WHERE version = <loaded version>. When it matches
+    # no row, tell a stale item apart from a deleted one, which Django goes on to insert again.
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, "_expected_version", None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            return True
+        if base_qs.filter(pk=pk_val).exists():
+            raise StaleItemError(pk_val)
+        return False
+
+    # Add delta to an item's quantity with one UPDATE ... SET quantity = quantity + delta, which
+    # the database applies atomically however many adjustments of the item run at once. Returns
+    # the updated item, or None if no item matches the filters, and raises ValueError if the
+    # quantity would go below zero. The post_save handlers run as they do for a save.
+    @classmethod
+    def adjust_quantity(cls, pk, delta, **filters):
+        items = cls.objects.filter(pk=pk, **filters)
+        with transaction.atomic(using=items.db):
+            updated = items.filter(quantity__gte=-delta).update(
+                quantity=F("quantity") + delta, version=F("version") + 1, last_edited=timezone.now()
+            )
+            if not updated:
+                if items.exists():
+                    raise ValueError("Quantity cannot be negative.")
+                return None
+            # The updated row stays locked until the transaction ends, so the state before the
+            # change is the current state less delta
+            item = items.select_related("category").get()
+            old = item.tracked_state()
+            old["quantity"] -= delta
+            item._loaded_state = old
+            models.signals.post_save.send(
+                sender=cls, instance=item, created=False, raw=False, using=items.db,
+                update_fields=frozenset(["quantity", "version", "last_edited"]),
+            )
+        return item
+
+    # Metadata for the model
+    class Meta:
+        # Composite indexes backing the dashboard's keyset pagination, each one covers
+        # a user's items ordered by (sort key, id) so every page is a single range scan
+        indexes = [
+            models.Index(fields=["user", "name", "id"], name="item_user_name_idx"),
+            models.Index(fields=["user", "quantity", "id"], name="item_user_quantity_idx"),
+            models.Index(fields=["user", "last_edited", "id"], name="item_user_edited_idx"),
+            models.Index(fields=["user", "category", "id"], name="item_user_category_idx"),
+            # Plain index for looking items up by name across all users
+            models.Index(fields=["name"], name="item_name_idx"),
+            # The items edited since the analytics watermark, across all users
+            models.Index(fields=["last_edited"], name="item_edited_idx"),
+            # Low stock rows are found by comparing each of a user's items with its threshold,
+            # reading the quantity and override from this index and the category threshold by
+            # primary key, so only the item table's index is scanned
+            models.Index(
+                fields=["user", "quantity", "low_stock_threshold", "category"], name="item_user_low_stock_idx"
+            ),
+        ]
 
     # Method returning a string representation of the item
     def __str__(self):
         return self.name
 
 # Model representing a category for inventory items
-class Category(models.Model):
+class Category(ChangeTrackingMixin, models.Model):
     # Field to store the name of the category
     name = models.CharField(max_length=200)
+    # Quantity at or below which items in this category are low on stock, LOW_QUANTITY if empty
+    low_stock_threshold = models.PositiveIntegerField(blank=True, null=True)
+
+    objects = ValidatedQuerySet.as_manager()
+
+    # Whether the threshold differs from the one loaded, or may do because it was never loaded
+    def threshold_changed(self):
+        return self.has_changed("low_stock_threshold")
 
     # Sanitise input by overriding save method to remove harmful content
     def save(self, *args, **kwargs):
-        # Strip harmful HTML or JavaScript tags from the category name before saving
-        if "<script>" in self.name or "<img" in self.name:
-            self.name = strip_tags(self.name)  # Only strip if potentially harmful content
+        # Strip harmful HTML or JavaScript tags from the category name before saving, if it changed
+        if self.has_changed("name"):
+            self.name = sanitise_name(self.name)
         # Call the parent class save method to save the category to the database
         super().save(*args, **kwargs)
 
@@ -61,3 +322,432 @@ class Category(models.Model):
     # Method returning a string representation of the category
     def __str__(self):
         return self.name
+
+
+# Model holding a denormalised summary of a user's inventory, so pages can read one row
+# instead of aggregating the whole item table. It is updated incrementally whenever an item
+# is saved or deleted, and can be rebuilt from scratch with the rebuild_inventory_summary command.
+class UserInventorySummary(models.Model):
+    # The user the summary belongs to
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="inventory_summary")
+    # Number of items the user owns
+    total_items = models.IntegerField(default=0)
+    # Sum of the quantities of the user's items
+    total_quantity = models.BigIntegerField(default=0)
+    # Number of the user's items at or below the low stock threshold
+    low_stock_count = models.IntegerField(default=0)
+    # Item counts keyed by category id, items without a category are counted under "none"
+    category_counts = models.JSONField(default=dict)
+    # Counter bumped by every change to the user's items or their categories, used to key page caches
+    version = models.BigIntegerField(default=0)
+    # Time of the last change to the user's items, including deletions
+    last_modified = models.DateTimeField(blank=True, null=True)
+
+    # Fields holding the aggregated figures, recomputed by rebuild()
+    summary_fields = ("total_items", "total_quantity", "low_stock_count", "category_counts")
+
+    # Metadata for the model
+    class Meta:
+        verbose_name_plural = "user inventory summaries"
+
+    # Method returning a string representation of the summary
+    def __str__(self):
+        return f"Inventory summary for {self.user}"
+
+    # Key used in category_counts for a category id
+    @staticmethod
+    def category_key(category_id):
+        return "none" if category_id is None else str(category_id)
+
+    # Apply the change from an item's old state to its new state, either of which may be None
+    # when the item is created or deleted. Must run inside the transaction that wrote the item.
+    @classmethod
+    def apply_item_change(cls, old, new):
+        # Work out the per-user deltas of removing the old state and adding the new one
+        deltas = {}
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            delta = deltas.setdefault(
+                state["user_id"], {"items": 0, "quantity": 0, "low": 0, "categories": Counter()}
+            )
+            delta["items"] += sign
+            delta["quantity"] += sign * state["quantity"]
+            delta["low"] += sign if is_low_state(state) else 0
+            delta["categories"][cls.category_key(state["category_id"])] += sign
+
+        for user_id, delta in deltas.items():
+            categories = {key: value for key, value in delta["categories"].items() if value}
+            # Lock the summary row so concurrent writers apply their deltas one after another
+            summary = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if summary is None:
+                # Never recreate a summary while deleting, the user may be being deleted too
+                if new is not None and new["user_id"] == user_id:
+                    cls.rebuild([user_id])
+                continue
+            summary.total_items += delta["items"]
+            summary.total_quantity += delta["quantity"]
+            summary.low_stock_count += delta["low"]
+            for key, value in categories.items():
+                count = summary.category_counts.get(key, 0) + value
+                if count:
+                    summary.category_counts[key] = count
+                else:
+                    summary.category_counts.pop(key, None)
+            # Every change bumps the version, even a rename that leaves the counts unchanged
+            summary.version += 1
+            summary.last_modified = timezone.now()
+            summary.save()
+
+    # Bump the version of the given users' summaries, or of every user owning items in a category
+    @classmethod
+    def touch(cls, user_ids=None, category_id=None):
+        summaries = cls.objects.all()
+        if user_ids is not None:
+            summaries = summaries.filter(user_id__in=user_ids)
+        if category_id is not None:
+            summaries = summaries.filter(category_counts__has_key=cls.category_key(category_id))
+        summaries.update(version=F("version") + 1, last_modified=timezone.now())
+
+    # Move the counts of a deleted category to "none", its items now have no category
+    @classmethod
+    def forget_category(cls, category_id):
+        key = cls.category_key(category_id)
+        for summary in cls.objects.select_for_update().filter(category_counts__has_key=key):
+            count = summary.category_counts.pop(key)
+            summary.category_counts["none"] = summary.category_counts.get("none", 0) + count
+            summary.version += 1
+            summary.last_modified = timezone.now()
+            summary.save(update_fields=["category_counts", "version", "last_modified"])
+
+    # Recompute the summaries of the users owning items in a category, whose low stock counts
+    # change with the category's threshold
+    @classmethod
+    def rebuild_category(cls, category_id):
+        user_ids = list(
+            cls.objects.filter(category_counts__has_key=cls.category_key(category_id)).values_list("user_id", flat=True)
+        )
+        if user_ids:
+            cls.rebuild(user_ids)
+
+    # Compute summaries from scratch for the given users, or every user if user_ids is None
+    @classmethod
+    def compute(cls, user_ids=None):
+        users = User.objects.all() if user_ids is None else User.objects.filter(id__in=user_ids)
+        items = InventoryItem.objects.filter(user__in=users)
+        summaries = {
+            user_id: {"total_items": 0, "total_quantity": 0, "low_stock_count": 0, "category_counts": {}}
+            for user_id in users.values_list("id", flat=True)
+        }
+        totals = items.values("user_id").annotate(
+            total_items=Count("id"),
+            total_quantity=Sum("quantity"),
+            low_stock_count=Count("id", filter=low_stock_condition()),
+        )
+        for row in totals:
+            summaries[row.pop("user_id")].update(row)
+        for row in items.values("user_id", "category_id").annotate(count=Count("id")):
+            summaries[row["user_id"]]["category_counts"][cls.category_key(row["category_id"])] = row["count"]
+        return summaries
+
+    # Recompute and store summaries for the given users, or every user if user_ids is None
+    @classmethod
+    def rebuild(cls, user_ids=None):
+        summaries = cls.compute(user_ids)
+        now = timezone.now()
+        with transaction.atomic():
+            existing = cls.objects.select_for_update()
+            if user_ids is not None:
+                existing = existing.filter(user_id__in=user_ids)
+            existing = {summary.user_id: summary for summary in existing}
+            # Update the rows in place so their versions keep increasing
+            changed, created = [], []
+            for user_id, values in summaries.items():
+                summary = existing.get(user_id) or cls(user_id=user_id)
+                for field, value in values.items():
+                    setattr(summary, field, value)
+                summary.version += 1
+                summary.last_modified = now
+                (changed if summary.pk else created).append(summary)
+            cls.objects.bulk_update(changed, [*cls.summary_fields, "version", "last_modified"], batch_size=500)
+            cls.objects.bulk_create(created)
+        return summaries
+
+
+# Outbox of low stock alerts. A row is written in the same transaction as the item change that
+# crossed the low stock threshold, so no alert is lost or sent for a change that rolled back,
+# and the deliver_alerts command delivers the rows later, away from the request.
+class LowStockAlert(models.Model):
+    # Events: the item dropped to or below the threshold, or came back above it
+    LOW = "low"
+    RESTOCKED = "restocked"
+    EVENT_CHOICES = [(LOW, "Low stock"), (RESTOCKED, "Restocked")]
+
+    # Delivery states, an alert is "sending" while a worker holds it and "superseded" when a
+    # later alert for the same item made it pointless
+    PENDING = "pending"
+    SENDING = "sending"
+    DELIVERED = "delivered"
+    SUPERSEDED = "superseded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (DELIVERED, "Delivered"),
+        (SUPERSEDED, "Superseded"),
+        (FAILED, "Failed"),
+    ]
+
+    # The owner of the item, who is alerted
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="low_stock_alerts")
+    # The item, alerts outlive it so deleting an item neither touches nor blocks on its alerts
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    # Name of the item when the alert was raised
+    item_name = models.CharField(max_length=200)
+    event = models.CharField(max_length=16, choices=EVENT_CHOICES)
+    # Quantity after the change, and before it unless the item was new
+    quantity = models.IntegerField()
+    previous_quantity = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # Failed deliveries so far
+    attempts = models.IntegerField(default=0)
+    # When a pending alert may next be delivered, or when a worker's claim on it expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    # Metadata for the model
+    class Meta:
+        indexes = [
+            # Finding the alerts due for delivery
+            models.Index(fields=["status", "next_attempt_at", "id"], name="alert_due_idx"),
+            # Finding when each user was last alerted, for rate limiting
+            models.Index(fields=["user", "status", "delivered_at"], name="alert_user_delivered_idx"),
+        ]
+
+    # Method returning a string representation of the alert
+    def __str__(self):
+        return f"{self.get_event_display()}: {self.item_name} ({self.quantity})"
+
+
+# Append-only ledger of changes to the stock of items. A row is written in the same transaction
+# as every item save or delete that changes an item's quantity, category or owner, and holds the
+# item's state after the change, so the state at any time is the latest row before it.
+class InventoryMovement(models.Model):
+    # Kinds of movement, "opening" rows record the items that existed when the ledger started
+    # and an owner change is written as a transfer out of one user and into the other
+    OPENING = "opening"
+    CREATED = "created"
+    UPDATED = "updated"
+    TRANSFERRED_OUT = "transferred_out"
+    TRANSFERRED_IN = "transferred_in"
+    DELETED = "deleted"
+    KIND_CHOICES = [
+        (OPENING, "Opening balance"),
+        (CREATED, "Created"),
+        (UPDATED, "Updated"),
+        (TRANSFERRED_OUT, "Transferred out"),
+        (TRANSFERRED_IN, "Transferred in"),
+        (DELETED, "Deleted"),
+    ]
+    # Kinds after which the item no longer belongs to the row's user
+    REMOVING_KINDS = (TRANSFERRED_OUT, DELETED)
+
+    # The ledger outlives items, users and categories, so none of its references are constrained
+    item = models.ForeignKey(InventoryItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name="+"
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Quantity the user holds after the movement, 0 once the item left them
+    quantity = models.IntegerField()
+    # Change of the user's quantity, unknown when the previous state was not loaded
+    quantity_delta = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # Metadata for the model
+    class Meta:
+        indexes = [
+            # An item's history, and its state at a point in time
+            models.Index(fields=["item", "created_at", "id"], name="movement_item_idx"),
+            # A user's movements since a point in time
+            models.Index(fields=["user", "created_at", "id"], name="movement_user_idx"),
+            # Movements between two snapshots
+            models.Index(fields=["created_at", "id"], name="movement_created_idx"),
+        ]
+
+    # Movements are never changed once written
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Inventory movements are append-only.")
+        super().save(*args, **kwargs)
+
+    # Method returning a string representation of the movement
+    def __str__(self):
+        return f"{self.get_kind_display()} item {self.item_id}: {self.quantity}"
+
+
+# Compacted state of every item at a point in time, built from the previous snapshot and the
+# movements since, so point in time queries only replay the movements after the latest snapshot
+class InventorySnapshot(models.Model):
+    # Movements created up to this time are included
+    taken_at = models.DateTimeField(unique=True)
+    # Number of items and their total quantity at that time
+    item_count = models.IntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+
+    # Method returning a string representation of the snapshot
+    def __str__(self):
+        return f"Inventory snapshot at {self.taken_at}"
+
+
+# The state of one item in a snapshot
+class InventorySnapshotLine(models.Model):
+    snapshot = models.ForeignKey(InventorySnapshot, on_delete=models.CASCADE, related_name="lines")
+    item = models.ForeignKey(InventoryItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    category = models.ForeignKey(
+        Category, on_delete=models.DO_NOTHING, db_constraint=False, blank=True, null=True, related_name="+"
+    )
+    quantity = models.IntegerField()
+
+    # Metadata for the model
+    class Meta:
+        indexes = [models.Index(fields=["snapshot", "user", "item"], name="snapshot_line_user_idx")]
+        constraints = [models.UniqueConstraint(fields=["snapshot", "item"], name="snapshot_line_unique_item")]
+
+
+# Raised by a running job that lost its claim, because it went longer than JOB_CLAIM_TIMEOUT
+# without reporting progress and another worker took it over
+class JobClaimLost(Exception):
+    pass
+
+
+# Queue of background jobs, such as exports, imports and summary rebuilds, run by the runworker
+# command away from the request. Jobs are claimed like the alert outbox: a running job's run_at
+# is when its claim expires, and a job whose worker died is claimed again once it has.
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    # Name the job function was registered under in inventory.jobs, and its keyword arguments
+    name = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict, blank=True)
+    # The user who queued the job and may follow its progress
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="jobs")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    # Failed runs so far
+    attempts = models.IntegerField(default=0)
+    # When a queued job may next run, or when a worker's claim on a running job expires
+    run_at = models.DateTimeField(default=timezone.now)
+    # Token of the current claim, so a worker that lost its claim cannot record an outcome
+    claim_token = models.CharField(max_length=32, blank=True)
+    # Units of work done out of the total, which is empty while it is unknown
+    progress = models.IntegerField(default=0)
+    progress_total = models.IntegerField(blank=True, null=True)
+    # What the job returned, and the error of its last failed run
+    result = models.JSONField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    # Metadata for the model
+    class Meta:
+        indexes = [
+            # Finding the jobs due to run
+            models.Index(fields=["status", "run_at", "id"], name="job_due_idx"),
+            # A user's latest jobs
+            models.Index(fields=["user", "created_at"], name="job_user_idx"),
+        ]
+
+    # Progress as a whole percentage, None while the total is unknown
+    @property
+    def percent(self):
+        if self.status == self.SUCCEEDED:
+            return 100
+        if not self.progress_total:
+            return None
+        return min(100, self.progress * 100 // self.progress_total)
+
+    # Record how much of the job is done, at most once every JOB_PROGRESS_INTERVAL seconds unless
+    # the job is complete. Every write also extends the claim, so a job reporting progress is
+    # never taken over however long it runs. Raises JobClaimLost if it was taken over already.
+    def report_progress(self, progress, total=None):
+        self.progress, self.progress_total = progress, total if total is not None else self.progress_total
+        now = timezone.now()
+        written_at = getattr(self, "_progress_written_at", None)
+        if written_at and (now - written_at).total_seconds() < settings.JOB_PROGRESS_INTERVAL and (
+            self.progress_total is None or progress < self.progress_total
+        ):
+            return
+        self._progress_written_at = now
+        claimed = Job.objects.filter(pk=self.pk, status=self.RUNNING, claim_token=self.claim_token).update(
+            progress=self.progress,
+            progress_total=self.progress_total,
+            run_at=now + timedelta(seconds=settings.JOB_CLAIM_TIMEOUT),
+        )
+        if not claimed:
+            raise JobClaimLost(f"Job {self.pk} was claimed by another worker.")
+
+    # Method returning a string representation of the job
+    def __str__(self):
+        return f"{self.name} job {self.pk} ({self.get_status_display()})"
+
+
+# Analytics rollup of the items of one user in one category, the rows of every user summed up
+# give the reports' totals by category and by user. A user's rows are rewritten by
+# inventory.analytics.refresh_analytics whenever their items changed since the last refresh.
+class CategoryRollup(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    # Items of a deleted category have no category any more, and neither do their rows
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    # Number of items, their total quantity and how many are at or below their threshold
+    items = models.IntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    low_stock = models.IntegerField(default=0)
+    # The items as packed column arrays, one machine integer per item and column in the order of
+    # inventory.analytics.COLUMNS, which ad hoc slices are computed over instead of the item rows
+    columns = models.BinaryField(default=bytes)
+
+    # Metadata for the model
+    class Meta:
+        indexes = [models.Index(fields=["user", "category"], name="category_rollup_user_idx")]
+
+
+# Analytics rollup of one user's items created and last edited on a day, in UTC
+class ActivityRollup(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    day = models.DateField()
+    created = models.IntegerField(default=0)
+    edited = models.IntegerField(default=0)
+
+    # Metadata for the model
+    class Meta:
+        indexes = [models.Index(fields=["day"], name="activity_rollup_day_idx")]
+        constraints = [models.UniqueConstraint(fields=["user", "day"], name="activity_rollup_unique_day")]
+
+
+# Watermark of the analytics refreshes: the rollups cover every change made before it
+class AnalyticsState(models.Model):
+    watermark = models.DateTimeField(blank=True, null=True)
+    refreshed_at = models.DateTimeField(blank=True, null=True)
+    # Users whose rollups the last refresh rewrote, and how long it took
+    refreshed_users = models.IntegerField(default=0)
+    seconds = models.FloatField(default=0)
+
+    # Method returning a string representation of the state
+    def __str__(self):
+        return f"Analytics up to {self.watermark}"
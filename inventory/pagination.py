@@ -0,0 +1,188 @@
+# pagination.py
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.utils.functional import cached_property
+
+# Sort keys the item table can be ordered by, mapped to the column used as the keyset column.
+# Every key is paired with the item id so the ordering is total and cursors are unambiguous, and
+# every pair is served by one of the item table's (user, key, id) indexes. Categories are sorted
+# by id, ordering by their names would need a join no index can serve.
+SORT_FIELDS = {
+    "id": F("id"),
+    "name": F("name"),
+    "quantity": F("quantity"),
+    "category": F("category_id"),
+    "last_edited": F("last_edited"),
+}
+
+# Sort keys whose column may be NULL, NULL sorts before every other value in both directions
+NULLABLE_SORTS = {"category"}
+
+
+# Raised when a cursor taken from the query string cannot be decoded
+class InvalidCursor(ValueError):
+    pass
+
+
+# Encode a (sort value, id) pair into an opaque, URL safe cursor string
+def encode_cursor(value, pk):
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps([value, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# Decode a cursor back into its (sort value, id) pair
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        return value, int(pk)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+# Parse a sort parameter such as "name" or "-quantity" into (key, descending)
+def parse_sort(sort, default="id"):
+    descending = sort.startswith("-") if sort else False
+    key = sort.lstrip("-") if sort else default
+    if key not in SORT_FIELDS:
+        return default, False
+    return key, descending
+
+
+# A single page of keyset paginated results
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Row value in SQL, such as ("name", "id") or (%s, %s)
+def row_value(*expressions):
+    return Func(*expressions, template="(%(expressions)s)")
+
+
+# Condition matching the rows after a cursor's (sort key, id) pair in the direction of travel, as
+# the row value comparison (sort key, id) > (value, pk). The database seeks to it in the (user,
+# key, id) index, even within a long run of rows sharing the same key, where an OR of the key
+# and id comparisons would read every row from the start of the run or the user's items.
+def after_cursor(value, pk, reverse, nullable=False):
+    lookup = "lt" if reverse else "gt"
+    if value is None:
+        # Rows with no key come first, so walking forwards every row with a key follows them
+        same = Q(sort_key__isnull=True, **{f"id__{lookup}": pk})
+        return same if reverse else same | Q(sort_key__isnull=False)
+    condition = Q(Func(
+        row_value(F("sort_key"), F("id")), row_value(Value(value), Value(pk)),
+        template="%(expressions)s", arg_joiner=" < " if reverse else " > ", output_field=BooleanField(),
+    ))
+    if reverse and nullable:
+        condition |= Q(sort_key__isnull=True)
+    return condition
+
+
+# Build the query for one page of the queryset ordered by (sort key, id), starting after or
+# before a cursor. Each page is a single indexed range scan limited to page_size + 1 rows, so
+# its cost does not depend on how deep the user has paged.
+def keyset_query(queryset, sort="id", descending=False, after=None, before=None, page_size=50):
+    queryset = queryset.annotate(sort_key=SORT_FIELDS[sort])
+    backwards = before is not None
+    cursor = decode_cursor(before if backwards else after) if (after or before) else None
+
+    # Walking backwards reverses both the ordering and the comparison used for the cursor
+    reverse = descending != backwards
+    nullable = sort in NULLABLE_SORTS
+    if cursor is not None:
+        queryset = queryset.filter(after_cursor(*cursor, reverse, nullable))
+    if reverse:
+        key = F("sort_key").desc(nulls_last=True) if nullable else F("sort_key").desc()
+        return queryset.order_by(key, "-id")[: page_size + 1]
+    key = F("sort_key").asc(nulls_first=True) if nullable else F("sort_key").asc()
+    return queryset.order_by(key, "id")[: page_size + 1]
+
+
+# Turn the rows fetched by keyset_query into a page with its cursors
+def build_page(rows, after=None, before=None, page_size=50):
+    # The extra row only tells us whether another page exists in the direction of travel
+    backwards = before is not None
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    first = encode_cursor(rows[0].sort_key, rows[0].id) if rows else None
+    last = encode_cursor(rows[-1].sort_key, rows[-1].id) if rows else None
+    if backwards:
+        return KeysetPage(rows, next_cursor=last, previous_cursor=first if has_more else None)
+    return KeysetPage(rows, next_cursor=last if has_more else None, previous_cursor=first if after else None)
+
+
+# Return one page of the queryset ordered by (sort key, id), starting after or before a cursor
+def paginate_keyset(queryset, sort="id", descending=False, after=None, before=None, page_size=50):
+    rows = list(keyset_query(queryset, sort, descending, after, before, page_size))
+    return build_page(rows, after, before, page_size)
+
+
+# Async version of paginate_keyset, fetching the rows with the async ORM
+async def apaginate_keyset(queryset, sort="id", descending=False, after=None, before=None, page_size=50):
+    rows = [row async for row in keyset_query(queryset, sort, descending, after, before, page_size)]
+    return build_page(rows, after, before, page_size)
+
+
+# The planner's estimate of how many rows a queryset returns, or None where the backend has none.
+# Postgres estimates any query with EXPLAIN. SQLite only knows the row count of a whole table,
+# and only once ANALYZE has recorded it in sqlite_stat1, so filtered querysets get no estimate.
+def estimate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        plan = json.loads(queryset.order_by().explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+    if connection.vendor == "sqlite" and not queryset.query.has_filters():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of a table's statistics is its row count
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0].split()[0]) if row else None
+    return None
+
+
+# Paginator that reads the number of rows from the planner's estimate rather than counting them,
+# once the estimate reaches ESTIMATED_COUNT_MIN rows. Counting a large table reads every row of
+# it, while the estimate costs one planner call. Smaller results, and queries the backend cannot
+# estimate, are counted exactly. The last page numbers of an estimated count may be empty.
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ESTIMATED_COUNT_MIN:
+            return super().count
+        return estimate
@@ -0,0 +1,167 @@
+# search.py
+
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BigIntegerField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Category, InventoryItem
+
+# Name of the search index table
+SEARCH_TABLE = "inventory_item_search"
+
+# Most words of a query that are searched for, the rest are ignored
+MAX_TERMS = 8
+
+# Queries whose words are all shorter than this match so many items that scoring every match
+# would take longer than the search itself, so only their newest matches are ranked
+MIN_RANKED_LENGTH = 2
+
+ITEM_TABLE = InventoryItem._meta.db_table
+CATEGORY_TABLE = Category._meta.db_table
+
+# The index table and the triggers keeping it in step with every write are created by migration
+# 0011_item_search_index. SQLite keeps an FTS5 table whose rowid is the item id and whose owner
+# column holds a "u<user id>" token, Postgres a table of weighted tsvectors keyed by item_id.
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', {name}), 'A') || setweight(to_tsvector('simple', coalesce({category}, '')), 'B')"
+)
+
+# Statements refilling the index from the item table, per backend
+REBUILD = {
+    "sqlite": [
+        f"DELETE FROM {SEARCH_TABLE}",
+        f"""INSERT INTO {SEARCH_TABLE} (rowid, name, category, owner)
+            SELECT item.id, item.name, coalesce(category.name, ''), 'u' || item.user_id
+            FROM {ITEM_TABLE} item LEFT JOIN {CATEGORY_TABLE} category ON category.id = item.category_id""",
+    ],
+    "postgresql": [
+        f"TRUNCATE {SEARCH_TABLE}",
+        f"""INSERT INTO {SEARCH_TABLE} (item_id, user_id, document)
+            SELECT item.id, item.user_id, {POSTGRES_DOCUMENT.format(name="item.name", category="category.name")}
+            FROM {ITEM_TABLE} item LEFT JOIN {CATEGORY_TABLE} category ON category.id = item.category_id""",
+    ],
+}
+
+
+# Refill the search index from the item table, for when it was written around the triggers
+def rebuild_search_index(using="default"):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for sql in REBUILD.get(connection.vendor, []):
+            cursor.execute(sql)
+
+
+# Split a query into lowercase words, dropping the punctuation and operators of the index syntax
+def search_terms(query):
+    return re.findall(r"\w+", (query or "").lower())[:MAX_TERMS]
+
+
+# SQL condition keeping the index rows whose item is a row of the items queryset, given the
+# column of the index holding the item id. It is checked for each match by primary key, so the
+# queryset's filters, such as a category or low stock, apply before the matches are limited.
+def candidate_condition(items, column, connection):
+    subquery = items.filter(id=RawSQL(column, (), output_field=BigIntegerField())).order_by().values("id")
+    sql, params = subquery.query.get_compiler(connection=connection).as_sql()
+    return f" AND EXISTS ({sql})", list(params)
+
+
+# Ids of the user's items matching every word of the query, each word as a prefix so partial
+# words match while typing, best matches first. Every match is ranked in the index and the best
+# limit are returned, except for queries of single letters, whose matches are cut to the newest
+# limit before ranking. A user_id of None searches the items of every user, as the admin does,
+# and an items queryset narrows the matches to its rows.
+def ranked_item_ids(user_id, query, limit, using="default", items=None):
+    terms = search_terms(query)
+    if not terms:
+        return []
+    connection = connections[using]
+    rank_all = max(len(term) for term in terms) >= MIN_RANKED_LENGTH
+    condition, condition_params = "", []
+    if connection.vendor == "sqlite":
+        if items is not None:
+            condition, condition_params = candidate_condition(items, f"{SEARCH_TABLE}.rowid", connection)
+        # Words are quoted so they are never read as FTS5 operators
+        expression = "{name category} : (" + " AND ".join(f'"{term}"*' for term in terms) + ")"
+        if user_id is not None:
+            expression = f"owner : u{int(user_id)} AND {expression}"
+        matches = f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s{condition}"
+        score = f"bm25({SEARCH_TABLE}, 10.0, 2.0, 0.0)"
+        if rank_all:
+            sql = f"SELECT rowid {matches} ORDER BY {score}, rowid DESC LIMIT %s"
+        else:
+            sql = (
+                f"SELECT rowid FROM (SELECT rowid, {score} AS score {matches} ORDER BY rowid DESC LIMIT %s) "
+                f"ORDER BY score, rowid DESC"
+            )
+        params = [expression, *condition_params, limit]
+    elif connection.vendor == "postgresql":
+        if items is not None:
+            condition, condition_params = candidate_condition(items, f"{SEARCH_TABLE}.item_id", connection)
+        expression = " & ".join(f"'{term}':*" for term in terms)
+        owner = "" if user_id is None else "user_id = %s AND "
+        matches = f"FROM {SEARCH_TABLE} WHERE {owner}document @@ to_tsquery('simple', %s){condition}"
+        score = "ts_rank(document, to_tsquery('simple', %s))"
+        if rank_all:
+            sql = f"SELECT item_id {matches} ORDER BY {score} DESC, item_id DESC LIMIT %s"
+            params = ([] if user_id is None else [user_id]) + [expression, *condition_params, expression, limit]
+        else:
+            sql = (
+                f"SELECT item_id FROM (SELECT item_id, document {matches} ORDER BY item_id DESC LIMIT %s) matches "
+                f"ORDER BY {score} DESC, item_id DESC"
+            )
+            params = ([] if user_id is None else [user_id]) + [expression, *condition_params, limit, expression]
+    else:
+        items = (InventoryItem.objects.all() if items is None else items).using(using)
+        if user_id is not None:
+            items = items.filter(user=user_id)
+        for term in terms:
+            items = items.filter(Q(name__icontains=term) | Q(category__name__icontains=term))
+        return list(items.order_by("-id").values_list("id", flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+# A single page of search results, numbered from 1
+class SearchPage:
+    def __init__(self, items, number, has_next):
+        self.items = items
+        self.number = number
+        self.has_next = has_next
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def next_page_number(self):
+        return self.number + 1 if self.has_next else None
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1 if self.has_previous else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Parse a page number from the query string, falling back to the first page
+def parse_page_number(value):
+    return int(value) if value and value.isdigit() and int(value) > 0 else 1
+
+
+# Search the user's items and return one page of the rows of the items queryset that match, in
+# rank order. At most SEARCH_MAX_RESULTS ranked ids of rows of the queryset are read from the
+# index, and only the page's rows are loaded.
+def search_page(items, user_id, query, number=1, page_size=50):
+    ids = ranked_item_ids(user_id, query, settings.SEARCH_MAX_RESULTS, using=items.db, items=items)
+    start = (number - 1) * page_size
+    page_ids = ids[start:start + page_size]
+    rows = items.in_bulk(page_ids) if page_ids else {}
+    return SearchPage([rows[pk] for pk in page_ids if pk in rows], number, len(ids) > start + page_size)
@@ -0,0 +1,77 @@
+# signals.py
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .alerts import threshold_alert
+from .cache import invalidate_categories
+from .ledger import item_movements, recorded_state
+from .models import Category, InventoryItem, InventoryMovement, UserInventorySummary
+
+
+# Give every new user an empty inventory summary, and bump the version of an edited user's
+# summary since their username is shown on the cached pages
+@receiver(post_save, sender=User)
+def create_inventory_summary(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        UserInventorySummary.objects.get_or_create(user=instance)
+    else:
+        UserInventorySummary.touch(user_ids=[instance.pk])
+
+
+# Apply an item's change to the owners' summaries, write it to the ledger and queue an alert if
+# it crossed the low stock threshold, inside the transaction opened by InventoryItem.save
+@receiver(post_save, sender=InventoryItem)
+def item_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, "_loaded_state", None)
+    new = instance.tracked_state()
+    if not created and old is None:
+        # The previous values are unknown (deferred fields), so recompute the owner's summary,
+        # no alert can be raised without knowing the previous quantity
+        UserInventorySummary.rebuild([instance.user_id])
+        movements = item_movements(instance.pk, recorded_state(instance.pk), new)
+    else:
+        UserInventorySummary.apply_item_change(old, new)
+        alert = threshold_alert(old, instance)
+        if alert is not None:
+            alert.save()
+        movements = item_movements(instance.pk, old, new, created)
+    InventoryMovement.objects.bulk_create(movements)
+    instance.remember_state()
+
+
+# Remove a deleted item from its owner's summary and write its deletion to the ledger, this also
+# covers queryset and cascade deletes
+@receiver(post_delete, sender=InventoryItem)
+def item_deleted(sender, instance, **kwargs):
+    old = getattr(instance, "_loaded_state", None) or instance.tracked_state()
+    UserInventorySummary.apply_item_change(old, None)
+    InventoryMovement.objects.bulk_create(item_movements(instance.pk, old, None))
+
+
+# A saved category invalidates the cached category catalogue and the pages of every user
+# owning items in it, and a new threshold changes those users' low stock counts
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    invalidate_categories()
+    if not created:
+        if instance.threshold_changed():
+            UserInventorySummary.rebuild_category(instance.pk)
+        else:
+            UserInventorySummary.touch(category_id=instance.pk)
+
+
+# Items of a deleted category are set to no category, so move their counts accordingly. If the
+# category had its own threshold the items now fall back to LOW_QUANTITY, so recount them.
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    invalidate_categories()
+    if instance.low_stock_threshold is None:
+        UserInventorySummary.forget_category(instance.pk)
+    else:
+        UserInventorySummary.rebuild_category(instance.pk)
@@ -0,0 +1,236 @@
+# snapshots.py
+
+import gzip
+import json
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer
+from django.db import connections, transaction
+from django.db.models.constants import OnConflict
+
+from .cache import invalidate_categories
+from .importers import iter_json_array, iter_json_lines
+from .ledger import record_openings
+from .models import InventoryItem, UserInventorySummary
+from .search import rebuild_search_index
+
+# Objects buffered per model before they are written
+DEFAULT_BATCH_SIZE = 1000
+
+
+# Work out the format of a snapshot file from its name, returning (format, gzipped)
+def detect_snapshot_format(filename):
+    lowered = (filename or "").lower()
+    gzipped = lowered.endswith(".gz")
+    if gzipped:
+        lowered = lowered[:-3]
+    return ("jsonl" if lowered.endswith((".jsonl", ".ndjson")) else "json"), gzipped
+
+
+# Open a snapshot file for reading or writing text, through gzip when it is compressed
+def open_snapshot(path, mode, gzipped):
+    if gzipped:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+# Yield the serialized objects of a snapshot one at a time
+def iter_snapshot(stream, snapshot_format):
+    if snapshot_format == "jsonl":
+        return iter_json_lines(stream)
+    return iter_json_array(stream)
+
+
+# Leave out the objects of excluded apps or app.model labels, matched like loaddata --exclude
+def exclude_objects(objects, labels):
+    excluded = {label.lower() for label in labels}
+    for data in objects:
+        label = str(data.get("model", "")).lower() if isinstance(data, dict) else ""
+        if label not in excluded and label.split(".")[0] not in excluded:
+            yield data
+
+
+# Return the models in an order where every model comes after the models it depends on
+def dependency_order(models):
+    by_app = defaultdict(list)
+    for model in models:
+        by_app[model._meta.app_config].append(model)
+    return serializers.sort_dependencies(by_app.items(), allow_cycles=True)
+
+
+# Outcome of loading a snapshot
+class LoadResult:
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.seconds = 0.0
+
+    @property
+    def objects(self):
+        return sum(self.counts.values())
+
+
+# Loads dumpdata style snapshots without reading the whole file into memory or saving objects
+# one at a time. Objects are streamed, buffered per model and written with multi-row inserts
+# once a model's buffer is full, inside one transaction with foreign key checks deferred, so
+# the file order does not matter. Buffers left at the end are written in dependency order,
+# then the constraints are checked once. Existing rows with the same primary key are updated,
+# like loaddata does.
+class SnapshotLoader:
+    def __init__(self, using="default", batch_size=DEFAULT_BATCH_SIZE, ignorenonexistent=False):
+        self.using = using
+        self.batch_size = batch_size
+        self.ignorenonexistent = ignorenonexistent
+        self.buffers = defaultdict(list)
+        self.models = set()
+        self.item_ids = []
+        self.result = LoadResult()
+
+    def load(self, objects):
+        connection = connections[self.using]
+        start = time.perf_counter()
+        with transaction.atomic(using=self.using):
+            with connection.constraint_checks_disabled():
+                deserialized = Deserializer(objects, using=self.using, ignorenonexistent=self.ignorenonexistent)
+                for item in deserialized:
+                    model = type(item.object)
+                    self.buffers[model].append(item)
+                    if len(self.buffers[model]) >= self.batch_size:
+                        self.flush(model)
+                for model in dependency_order(list(self.buffers)):
+                    self.flush(model)
+            models = list(self.models)
+            connection.check_constraints(table_names=[model._meta.db_table for model in models])
+            self.reset_sequences(models)
+            self.refresh_derived_data(models)
+        self.result.seconds = time.perf_counter() - start
+        return self.result
+
+    # Write the buffered objects of a model, then their many to many relations
+    def flush(self, model):
+        items = self.buffers.pop(model, [])
+        if not items:
+            return
+        meta = model._meta
+        if meta.parents:
+            raise ValueError(f"{meta.label} uses multi-table inheritance, which cannot be bulk loaded.")
+        # Insert the rows as they are, like a raw save() does, so auto_now fields keep their
+        # saved values, and update the rows that already exist with the same primary key
+        objects = [item.object for item in items]
+        fields = meta.concrete_fields
+        update_fields = [field for field in fields if not field.primary_key]
+        queryset = model._base_manager.using(self.using)
+        batch_size = max(1, min(self.batch_size, connections[self.using].ops.bulk_batch_size(fields, objects)))
+        for start in range(0, len(objects), batch_size):
+            queryset._insert(
+                objects[start:start + batch_size],
+                fields=fields,
+                raw=True,
+                using=self.using,
+                on_conflict=OnConflict.UPDATE if update_fields else OnConflict.IGNORE,
+                update_fields=update_fields or None,
+                unique_fields=[meta.pk] if update_fields else None,
+            )
+        for field in meta.many_to_many:
+            self.write_m2m(field, [item for item in items if field.name in item.m2m_data])
+        if model is InventoryItem:
+            self.item_ids.extend(instance.pk for instance in objects if instance.pk is not None)
+        self.models.add(model)
+        self.result.counts[meta.label] += len(items)
+
+    # Replace the many to many rows of the loaded objects with the ones in the snapshot
+    def write_m2m(self, field, items):
+        if not items:
+            return
+        through = field.remote_field.through
+        source = field.m2m_field_name() + "_id"
+        target = field.m2m_reverse_field_name() + "_id"
+        manager = through._base_manager.using(self.using)
+        manager.filter(**{f"{source}__in": [item.object.pk for item in items]}).delete()
+        manager.bulk_create(
+            [
+                through(**{source: item.object.pk, target: related})
+                for item in items
+                for related in item.m2m_data[field.name]
+            ],
+            batch_size=self.batch_size,
+        )
+
+    # Move the primary key sequences past the loaded ids, where the backend uses sequences
+    def reset_sequences(self, models):
+        connection = connections[self.using]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    # Bulk inserts send no signals, so rebuild what the signal handlers would have maintained
+    def refresh_derived_data(self, models):
+        labels = {model._meta.label for model in models}
+        if labels & {"auth.User", "inventory.InventoryItem", "inventory.Category"}:
+            UserInventorySummary.rebuild()
+        # Items may have been indexed before the categories they refer to were loaded
+        if labels & {"inventory.InventoryItem", "inventory.Category"}:
+            rebuild_search_index(self.using)
+        if "inventory.Category" in labels:
+            invalidate_categories()
+        # The loaded states of the items open their history in the ledger. No low stock alerts
+        # are queued: a snapshot restores the alert outbox as it was dumped, so items that were
+        # already low have had their alert, and queuing more would alert the owners again.
+        items = InventoryItem.objects.using(self.using)
+        for start in range(0, len(self.item_ids), self.batch_size):
+            record_openings(items.filter(pk__in=self.item_ids[start:start + self.batch_size]))
+
+
+# Resolve dumpdata style labels, "app" or "app.Model", into models, every model by default
+def resolve_models(labels):
+    if not labels:
+        return [model for model in apps.get_models() if model._meta.managed and not model._meta.proxy]
+    models = []
+    for label in labels:
+        if "." in label:
+            models.append(apps.get_model(label))
+        else:
+            models.extend(apps.get_app_config(label).get_models())
+    return models
+
+
+# Yield the serialized form of every object of the models, in dependency order, reading each
+# table in chunks and prefetching many to many relations per chunk instead of per object
+def iter_dump(models, using="default", chunk_size=2000):
+    for model in dependency_order(models):
+        queryset = model._default_manager.using(using).order_by(model._meta.pk.name)
+        m2m_names = [field.name for field in model._meta.many_to_many]
+        if m2m_names:
+            queryset = queryset.prefetch_related(*m2m_names)
+        chunk = []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                yield from serializers.serialize("python", chunk)
+                chunk = []
+        if chunk:
+            yield from serializers.serialize("python", chunk)
+
+
+# Write serialized objects as a JSON array or as JSON Lines, returning how many were written
+def write_snapshot(objects, output, snapshot_format="json"):
+    count = 0
+    if snapshot_format == "json":
+        output.write("[")
+    for data in objects:
+        encoded = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+        if snapshot_format == "json":
+            output.write(("," if count else "") + "\n" + encoded)
+        else:
+            output.write(encoded + "\n")
+        count += 1
+    if snapshot_format == "json":
+        output.write("\n]\n")
+    return count
+
@@ -1,10 +1,59 @@
 # tests.py
 
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.db import OperationalError, connection
+from django.urls import reverse
+from django.test import override_settings
+from .pagination import decode_cursor, encode_cursor
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+import csv
+import json
+import os
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from .importers import ItemImporter, iter_json_array, iter_rows
+from .datagen import generate_inventory
+from .snapshots import SnapshotLoader
+from .search import ranked_item_ids
+from .alerts import AlertDispatcher, AlertSink
+from .bulk import apply_bulk_action, raw_delete
+from .signals import item_deleted
+from django.db.models.signals import post_delete, pre_delete
+from .analytics import analytics_report, refresh_analytics, slice_items
+from .jobs import JOBS, Worker, claim_jobs, enqueue, run_job
+from django.conf import settings
+from .ledger import changes_since, item_quantity_at, levels_at, replay_levels_at, take_snapshot
+from .cache import get_cache, get_categories
+from .forms import InventoryItemForm
+from .middleware import InstrumentationMiddleware, QueryBudgetExceeded, QueryBudgetMiddleware
+from asgiref.sync import iscoroutinefunction
+from .metrics import registry, render_text
+import asyncio
+import threading
 from django.contrib.auth.models import User
-from .models import InventoryItem, Category
-from datetime import datetime
+from .models import (
+    InventoryItem, Category, InventoryMovement, Job, JobClaimLost, LowStockAlert, StaleItemError, UserInventorySummary,
+)
+from datetime import datetime, timedelta
+from django.utils import timezone
 from django.utils.html import escape, strip_tags
+from unittest.mock import ANY, MagicMock, patch
+from django.urls import include, path
+from django.db.models import F, QuerySet, Sum
+from .async_views import AsyncDashboard, AsyncItemListApi, async_admin_view
+
+# URL configuration routing the dashboard, admin view and item list to their async views, ahead
+# of the regular patterns so every other page keeps working
+urlpatterns = [
+    path("dashboard/", AsyncDashboard.as_view(), name="dashboard"),
+    path("admin-view/", async_admin_view, name="admin-view"),
+    path("api/items/", AsyncItemListApi.as_view(), name="api-items"),
+    path("", include("inventory_management.urls")),
+]
 
 # Test cases for the Category model
 class CategoryModelTests(TestCase):
@@ -151,3 +200,1625 @@ class XSSProtectionTests(TestCase):
         # Ensure that rendering the name in templates escapes the input correctly
         rendered_name = escape(retrieved_category.name)
         self.assertEqual(rendered_name, "", "The output should be an empty string because it was sanitized.")
+
+
+# Test cases for the Dashboard view query behaviour
+class DashboardQueryTests(TestCase):
+    def setUp(self):
+        # Create a logged in test user and a category for the dashboard items
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.category = Category.objects.create(name="Electronics")
+        self.client.force_login(self.user)
+
+    def create_items(self, count, quantity=10):
+        # Helper to create a number of items for the test user
+        for i in range(count):
+            InventoryItem.objects.create(
+                name=f"Item {i}", quantity=quantity, category=self.category, user=self.user
+            )
+
+    def count_dashboard_queries(self):
+        # Render the dashboard and return the number of queries it ran, with the category cache warm
+        get_categories()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_items(self):
+        # The number of queries must stay the same as the user's item count grows
+        self.create_items(1)
+        small = self.count_dashboard_queries()
+        self.create_items(25, quantity=1)
+        self.assertEqual(self.count_dashboard_queries(), small)
+
+    def test_low_inventory_flag_and_message(self):
+        # Low stock rows are flagged and the banner reports the low stock count
+        self.create_items(2, quantity=1)
+        self.create_items(1, quantity=10)
+        response = self.client.get(reverse("dashboard"))
+        flags = [item.is_low for item in response.context["items"]]
+        self.assertEqual(flags, [True, True, False])
+        self.assertContains(response, "2 items have a low stock level")
+
+
+# Test cases for the Dashboard keyset pagination, sorting and filtering
+@override_settings(DASHBOARD_PAGE_SIZE=5)
+class DashboardPaginationTests(TestCase):
+    def setUp(self):
+        # Create a logged in test user with items spread over two categories
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.cables = Category.objects.create(name="Cables")
+        self.servers = Category.objects.create(name="Servers")
+        for i in range(12):
+            InventoryItem.objects.create(
+                name=f"Item {i:02d}",
+                quantity=i,
+                category=self.cables if i % 2 else self.servers,
+                user=self.user,
+            )
+        self.client.force_login(self.user)
+
+    def walk(self, params):
+        # Follow the next links from the first page and collect every item id in order
+        ids, after = [], None
+        while True:
+            query = dict(params, after=after) if after else params
+            page = self.client.get(reverse("dashboard"), query).context["page"]
+            ids.extend(item.id for item in page)
+            if not page.has_next:
+                return ids
+            after = page.next_cursor
+
+    def test_pages_cover_every_item_once(self):
+        # Walking the pages returns every item exactly once, in sort order
+        ids = self.walk({"sort": "-quantity"})
+        expected = list(InventoryItem.objects.order_by("-quantity", "-id").values_list("id", flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_sort_by_category_then_id(self):
+        # Sorting by category orders by the category id, uncategorised items first, with the id as
+        # tie breaker, and walks the same rows backwards in reverse
+        InventoryItem.objects.filter(quantity__in=[3, 4, 9]).update(category=None)
+        ids = self.walk({"sort": "category"})
+        expected = list(
+            InventoryItem.objects.order_by(F("category_id").asc(nulls_first=True), "id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(self.walk({"sort": "-category"}), expected[::-1])
+
+    def test_previous_page_returns_to_start(self):
+        # Following next then previous returns the first page again
+        first = self.client.get(reverse("dashboard"), {"sort": "name"}).context["page"]
+        second = self.client.get(reverse("dashboard"), {"sort": "name", "after": first.next_cursor}).context["page"]
+        back = self.client.get(reverse("dashboard"), {"sort": "name", "before": second.previous_cursor}).context["page"]
+        self.assertEqual([item.id for item in back], [item.id for item in first])
+        self.assertFalse(back.has_previous)
+
+    def test_filters_by_category_and_low_stock(self):
+        # Category and low stock filters narrow the rows returned
+        ids = self.walk({"category": self.cables.id, "low": "1"})
+        self.assertEqual(
+            ids, list(InventoryItem.objects.filter(category=self.cables, quantity__lte=3).values_list("id", flat=True))
+        )
+
+    def test_deep_page_costs_the_same_as_first_page(self):
+        # Paging deep into the table runs the same number of queries as the first page
+        get_categories()
+        with CaptureQueriesContext(connection) as first:
+            page = self.client.get(reverse("dashboard"), {"sort": "last_edited"}).context["page"]
+        cursor = encode_cursor(*decode_cursor(page.next_cursor))
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(reverse("dashboard"), {"sort": "last_edited", "after": cursor})
+        self.assertEqual(len(first.captured_queries), len(deep.captured_queries))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        # A tampered cursor shows the first page instead of failing
+        response = self.client.get(reverse("dashboard"), {"after": "not-a-cursor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 5)
+
+
+# Test cases for the admin view query behaviour
+@override_settings(ADMIN_VIEW_PAGE_SIZE=50)
+class AdminViewQueryTests(TestCase):
+    def setUp(self):
+        # Create and log in an admin user
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        self.category = Category.objects.create(name="Electronics")
+        self.client.force_login(self.admin)
+
+    def create_users(self, count):
+        # Helper to create users that each own two items
+        for i in range(count):
+            user = User.objects.create_user(username=f"user{User.objects.count()}", password="password123")
+            for quantity in (2, 5):
+                InventoryItem.objects.create(name="Laptop", quantity=quantity, category=self.category, user=user)
+
+    def count_admin_view_queries(self):
+        # Render the admin view and return the number of queries it ran
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("admin-view"))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_users(self):
+        # The number of queries must stay the same as the number of users grows
+        self.create_users(2)
+        small = self.count_admin_view_queries()
+        self.create_users(10)
+        self.assertEqual(self.count_admin_view_queries(), small)
+
+    def test_items_grouped_with_totals(self):
+        # Each user is listed with their own items and database computed totals
+        self.create_users(3)
+        response = self.client.get(reverse("admin-view"))
+        for user, items in response.context["user_items"]:
+            self.assertTrue(all(item.user_id == user.id for item in items))
+            self.assertEqual(user.inventory_summary.total_items, len(items))
+            self.assertEqual(user.inventory_summary.total_quantity, sum(item.quantity for item in items))
+
+
+class AdminItemListTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:inventory_inventoryitem_changelist")
+
+    def create_items(self, count):
+        # Helper giving every item its own user and category
+        for i in range(InventoryItem.objects.count(), InventoryItem.objects.count() + count):
+            user = User.objects.create_user(username=f"user{i}", password="password123")
+            category = Category.objects.create(name=f"Category {i}")
+            InventoryItem.objects.create(name=f"Mouse {i}", quantity=i, category=category, user=user)
+
+    def changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query["sql"] for query in context.captured_queries]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_items(2)
+        _, small = self.changelist_queries()
+        self.create_items(20)
+        response, queries = self.changelist_queries()
+        self.assertEqual(len(queries), len(small))
+        self.assertEqual(response.context["cl"].result_count, 22)
+
+    @override_settings(ESTIMATED_COUNT_MIN=10, LOW_QUANTITY=5)
+    def test_large_tables_use_the_estimated_count(self):
+        self.create_items(12)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE inventory_inventoryitem")
+        InventoryItem.objects.filter(quantity__lt=2).delete()
+        response, queries = self.changelist_queries()
+        # The statistics still hold the count ANALYZE recorded
+        self.assertEqual(response.context["cl"].result_count, 12)
+        self.assertFalse([sql for sql in queries if "COUNT(" in sql])
+        # Filtered lists the statistics cannot estimate are counted
+        response, _ = self.changelist_queries({"low": "1"})
+        self.assertEqual(response.context["cl"].result_count, 4)
+
+    def test_search_and_filters(self):
+        self.create_items(3)
+        item = InventoryItem.objects.get(name="Mouse 1")
+        item.name = "Keyboard"
+        item.save()
+        response, _ = self.changelist_queries({"q": "keyb"})
+        self.assertEqual(list(response.context["cl"].result_list), [item])
+        response, _ = self.changelist_queries({"category": item.category_id})
+        self.assertEqual(list(response.context["cl"].result_list), [item])
+        response = self.client.get(reverse("admin:inventory_inventoryitem_change", args=[item.pk]))
+        self.assertContains(response, "admin-autocomplete")
+
+
+    def test_change_form_rejects_stale_edits(self):
+        # The version cannot be edited, and a form filled in before someone else saved the item
+        # is turned away with the item's current state instead of overwriting it
+        self.create_items(1)
+        item = InventoryItem.objects.get()
+        url = reverse("admin:inventory_inventoryitem_change", args=[item.pk])
+        form = self.client.get(url).context["adminform"].form
+        self.assertNotIn("version", form.fields)
+        self.assertEqual(form["loaded_version"].initial, 1)
+        data = {"name": "Mouse", "quantity": 3, "category": item.category_id, "user": item.user_id,
+                "low_stock_threshold": "", "loaded_version": 1, "version": 99}
+        InventoryItem.adjust_quantity(item.pk, 5)
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, "It now holds 5 of Mouse 0. Your changes were not saved")
+        item.refresh_from_db()
+        self.assertEqual((item.name, item.quantity, item.version), ("Mouse 0", 5, 2))
+        self.client.post(url, dict(data, loaded_version=2))
+        item.refresh_from_db()
+        self.assertEqual((item.name, item.quantity, item.version), ("Mouse", 3, 3))
+
+
+# Test cases for the index benchmark management command, the schema changes need real transactions
+class BenchmarkIndexesCommandTests(TransactionTestCase):
+    def test_benchmark_records_plans_and_cleans_up(self):
+        # Run the benchmark at a tiny scale and check the recorded results
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_indexes", items=200, users=4, repeat=1, interactive=False,
+                output=output, stdout=StringIO(),
+            )
+            with open(output) as results_file:
+                results = json.load(results_file)
+        self.assertEqual(set(results["before"]), set(results["after"]))
+        self.assertIn("item_user_low_stock_idx", results["after"]["low_stock_rows"]["plan"])
+        # The seeded rows are removed once the benchmark finishes
+        self.assertFalse(InventoryItem.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith="bench-index-").exists())
+
+
+# Test cases for the incrementally maintained user inventory summaries
+class UserInventorySummaryTests(TestCase):
+    def setUp(self):
+        # Create a test user and two categories
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other = User.objects.create_user(username="otheruser", password="password123")
+        self.cables = Category.objects.create(name="Cables")
+        self.servers = Category.objects.create(name="Servers")
+
+    def assertSummariesMatch(self):
+        # The stored summaries must equal a fresh computation from the item table
+        expected = UserInventorySummary.compute()
+        for summary in UserInventorySummary.objects.all():
+            values = expected[summary.user_id]
+            self.assertEqual(summary.total_items, values["total_items"])
+            self.assertEqual(summary.total_quantity, values["total_quantity"])
+            self.assertEqual(summary.low_stock_count, values["low_stock_count"])
+            self.assertEqual(summary.category_counts, values["category_counts"])
+
+    def test_new_user_gets_empty_summary(self):
+        # Creating a user creates an empty summary row
+        summary = UserInventorySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_items, summary.total_quantity, summary.low_stock_count), (0, 0, 0))
+
+    def test_thresholds_come_from_item_then_category(self):
+        # An item's override wins over its category's threshold, which wins over LOW_QUANTITY
+        self.cables.low_stock_threshold = 50
+        self.cables.save()
+        self.servers.low_stock_threshold = 1
+        self.servers.save()
+        cable = InventoryItem.objects.create(name="Cable", quantity=10, category=self.cables, user=self.user)
+        InventoryItem.objects.create(name="Patch", quantity=10, category=self.cables, low_stock_threshold=5,
+                                     user=self.user)
+        InventoryItem.objects.create(name="Server", quantity=2, category=self.servers, user=self.user)
+        InventoryItem.objects.create(name="Fan", quantity=2, user=self.user)
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).low_stock_count, 2)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"), {"low": "1", "sort": "name"})
+        self.assertEqual([item.name for item in response.context["items"]], ["Cable", "Fan"])
+        # Changing or deleting a category with a threshold recounts its owners' low items
+        self.cables.low_stock_threshold = 5
+        self.cables.save()
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).low_stock_count, 1)
+        self.servers.low_stock_threshold = 2
+        self.servers.save()
+        self.servers.delete()
+        self.assertSummariesMatch()
+        # Raising the item's own threshold above its quantity makes it low again and queues an alert
+        cable = InventoryItem.objects.get(pk=cable.pk)
+        cable.low_stock_threshold = 60
+        cable.save()
+        self.assertSummariesMatch()
+        self.assertEqual(list(LowStockAlert.objects.filter(item=cable).values_list("event", flat=True)),
+                         ["low", "low"])
+
+    def test_summary_follows_item_changes(self):
+        # Creating, editing, reassigning and deleting items keeps the summaries in step
+        item = InventoryItem.objects.create(name="Cable", quantity=10, category=self.cables, user=self.user)
+        InventoryItem.objects.create(name="Server", quantity=1, category=self.servers, user=self.user)
+        self.assertSummariesMatch()
+        item = InventoryItem.objects.get(pk=item.pk)
+        item.quantity = 2
+        item.category = None
+        item.save()
+        self.assertSummariesMatch()
+        item.user = self.other
+        item.save()
+        self.assertSummariesMatch()
+        InventoryItem.objects.filter(user=self.user).delete()
+        self.assertSummariesMatch()
+        summary = UserInventorySummary.objects.get(user=self.other)
+        self.assertEqual((summary.total_items, summary.low_stock_count), (1, 1))
+
+    def test_deleting_category_moves_counts_to_none(self):
+        # Items of a deleted category are counted under "none"
+        InventoryItem.objects.create(name="Cable", quantity=10, category=self.cables, user=self.user)
+        self.cables.delete()
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).category_counts, {"none": 1})
+        self.assertSummariesMatch()
+
+    def test_command_detects_and_fixes_drift(self):
+        # Bulk updates bypass the signals, the command reports the drift and rebuilds the summary
+        InventoryItem.objects.create(name="Cable", quantity=10, category=self.cables, user=self.user)
+        InventoryItem.objects.filter(user=self.user).update(quantity=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_inventory_summary", check=True, stdout=StringIO())
+        call_command("rebuild_inventory_summary", stdout=StringIO())
+        call_command("rebuild_inventory_summary", check=True, stdout=StringIO())
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).low_stock_count, 1)
+
+
+# Test cases for the bulk item import pipeline
+class ItemImportTests(TestCase):
+    def setUp(self):
+        # Create a test user and an existing category
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.category = Category.objects.create(name="Electronics")
+
+    def test_json_array_is_streamed_in_chunks(self):
+        # Values are decoded correctly even when split across tiny read chunks
+        document = json.dumps([{"name": f"Item {i}", "quantity": i} for i in range(20)])
+        values = list(iter_json_array(StringIO(document), chunk_size=7))
+        self.assertEqual(values, json.loads(document))
+
+    def test_import_reports_rejected_rows(self):
+        # Valid rows are inserted, invalid rows are reported with their row number
+        rows = [
+            {"name": "Laptop", "quantity": "4", "category": "electronics"},
+            {"name": "<script>Monitor</script>", "quantity": "2", "category": ""},
+            {"name": "Broken", "quantity": "-1", "category": "Electronics"},
+            {"name": "Mystery", "quantity": "1", "category": "Unknown"},
+        ]
+        result = ItemImporter(self.user, batch_size=2).run(rows)
+        self.assertEqual(result.created, 2)
+        self.assertEqual([number for number, _ in result.errors], [3, 4])
+        self.assertEqual(
+            sorted(InventoryItem.objects.values_list("name", "category__name")),
+            [("Laptop", "Electronics"), ("Monitor", None)],
+        )
+        # The user's summary is rebuilt after the bulk insert
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_items, 2)
+
+    def test_import_queues_alerts_for_low_items(self):
+        # Items imported at or below their threshold queue an alert like items created one by one
+        self.category.low_stock_threshold = 10
+        self.category.save()
+        rows = [
+            {"name": "Toner", "quantity": "0"},
+            {"name": "Laptop", "quantity": "8", "category": "Electronics"},
+            {"name": "Paper", "quantity": "500"},
+        ]
+        ItemImporter(self.user, batch_size=2).run(rows)
+        alerts = LowStockAlert.objects.order_by("item_name").values_list("item_name", "event", "previous_quantity")
+        self.assertEqual(list(alerts), [("Laptop", "low", None), ("Toner", "low", None)])
+
+    def test_upload_view_imports_csv(self):
+        # Uploading a CSV file imports its rows for the logged in user
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("items.csv", b"name,quantity,category\nCable,40,Cables\nMouse,x,\n")
+        response = self.client.post(reverse("import-items"), {"file": upload, "create_categories": "on"})
+        self.assertEqual(response.context["result"].created, 1)
+        self.assertEqual(response.context["result"].errors, [(2, "Quantity must be a whole number.")])
+        self.assertTrue(InventoryItem.objects.filter(name="Cable", category__name="Cables", user=self.user).exists())
+
+    def test_upload_view_reports_files_that_are_not_utf8(self):
+        # A file that is not UTF-8 text is reported on the form, with the rows imported before it
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("items.csv", b"\xff\xfe")
+        response = self.client.post(reverse("import-items"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].errors["file"], ["Row 1: the file is not UTF-8 encoded text."])
+        rows = b"".join(f"Item {i},1,\n".encode() for i in range(2000))
+        upload = SimpleUploadedFile("items.csv", b"name,quantity,category\n" + rows + b"\xff\xfe,1,\n")
+        response = self.client.post(reverse("import-items"), {"file": upload})
+        result = response.context["result"]
+        self.assertIn("not UTF-8", result.format_error)
+        self.assertIn(result.format_error, response.context["form"].errors["file"])
+        self.assertGreater(result.created, 0)
+        self.assertEqual(InventoryItem.objects.count(), result.created)
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_items, result.created)
+
+    def test_malformed_csv_keeps_the_rows_before_it(self):
+        # A CSV error stops the import at its row, the rows read before it are still imported
+        stream = StringIO("name,quantity\nCable,4\nMouse,2\n" + "x" * (csv.field_size_limit() + 1) + ",1\n")
+        result = ItemImporter(self.user).run(iter_rows(stream, "csv"))
+        self.assertEqual(result.created, 2)
+        self.assertTrue(result.format_error.startswith("Row 3: "))
+
+    def test_command_benchmark_rolls_back(self):
+        # The benchmark mode compares both import paths without keeping any rows
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "items.jsonl")
+            with open(path, "w") as handle:
+                for i in range(30):
+                    handle.write(json.dumps({"name": f"Item {i}", "quantity": i}) + "\n")
+            output = StringIO()
+            call_command("import_items", path, user="testuser", benchmark=True, stdout=output)
+        self.assertIn("rows/s", output.getvalue())
+        self.assertFalse(InventoryItem.objects.exists())
+
+
+# Test cases for the streaming exports
+class ExportTests(TestCase):
+    def setUp(self):
+        # Create a user and an admin that each own items
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        category = Category.objects.create(name="Electronics")
+        InventoryItem.objects.create(name="Laptop", quantity=4, category=category, user=self.user)
+        InventoryItem.objects.create(name="Cable", quantity=9, user=self.user)
+        InventoryItem.objects.create(name="Server", quantity=1, category=category, user=self.admin)
+
+    def download(self, url):
+        # Fetch a streaming export and return its content as text
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_user_export_is_limited_to_own_items(self):
+        # A user's CSV export only holds their own items
+        self.client.force_login(self.user)
+        lines = self.download(reverse("export-items", args=["csv"])).splitlines()
+        self.assertEqual(lines[0], "id,name,quantity,category,username,date_created,last_edited")
+        self.assertEqual([line.split(",")[1:4] for line in lines[1:]], [["Laptop", "4", "Electronics"], ["Cable", "9", ""]])
+
+    def test_admin_export_holds_every_item(self):
+        # The admin JSON export is one valid array with every user's items
+        self.client.force_login(self.admin)
+        rows = json.loads(self.download(reverse("export-all-items", args=["json"])))
+        self.assertEqual([row["name"] for row in rows], ["Laptop", "Cable", "Server"])
+
+    def test_admin_export_requires_admin(self):
+        # Non admin users are redirected away from the all users export
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("export-all-items", args=["jsonl"]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_unknown_format_is_not_found(self):
+        # Unsupported formats return a 404
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("export-items", args=["xml"])).status_code, 404)
+
+
+# Test cases for the cached category catalogue
+class CategoryCacheTests(TestCase):
+    def setUp(self):
+        # Start from an empty cache with two categories
+        get_cache().clear()
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.cables = Category.objects.create(name="Cables")
+        self.servers = Category.objects.create(name="Servers")
+
+    def test_repeated_reads_use_the_cache(self):
+        # Only the first read queries the database
+        get_categories()
+        with self.assertNumQueries(0):
+            self.assertEqual([c.name for c in get_categories()], ["Cables", "Servers"])
+
+    def test_saving_or_deleting_a_category_invalidates_the_cache(self):
+        # Category writes bump the catalogue version so the next read sees them
+        get_categories()
+        Category.objects.create(name="Adapters")
+        self.assertEqual([c.name for c in get_categories()], ["Adapters", "Cables", "Servers"])
+        self.servers.delete()
+        self.assertEqual([c.name for c in get_categories()], ["Adapters", "Cables"])
+
+    def test_item_form_renders_and_validates_from_the_cache(self):
+        # The item form builds its choices from the cache, only model validation checks the foreign key
+        get_categories()
+        with self.assertNumQueries(0):
+            self.assertIn("Servers", str(InventoryItemForm()["category"]))
+        form = InventoryItemForm(data={"name": "Cable", "quantity": 3, "category": self.cables.pk})
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["category"], self.cables)
+        form = InventoryItemForm(data={"name": "Cable", "quantity": 3, "category": 999})
+        self.assertFalse(form.is_valid())
+
+    def test_add_item_page_does_not_query_categories(self):
+        # Rendering the add item page twice runs no category queries the second time
+        self.client.force_login(self.user)
+        self.client.get(reverse("add-item"))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("add-item"))
+        self.assertFalse(any("inventory_category" in query["sql"] for query in context.captured_queries))
+
+
+# Test cases for the dashboard and admin view page caching and conditional GET support
+class PageCacheTests(TestCase):
+    def setUp(self):
+        # Create a logged in admin user that owns an item
+        self.user = User.objects.create_superuser(username="admin", password="password123")
+        self.category = Category.objects.create(name="Cables")
+        self.item = InventoryItem.objects.create(name="Cable", quantity=10, category=self.category, user=self.user)
+        self.client.force_login(self.user)
+
+    def test_unchanged_dashboard_table_is_served_from_cache(self):
+        # The second render of an unchanged dashboard does not query the items
+        self.client.get(reverse("dashboard"))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Cable")
+        self.assertFalse(any("inventory_inventoryitem" in query["sql"] for query in context.captured_queries))
+
+    def test_dashboard_conditional_get(self):
+        # A matching ETag or Last-Modified date gets a 304 until the inventory changes
+        response = self.client.get(reverse("dashboard"))
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(self.client.get(reverse("dashboard"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(reverse("dashboard"), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.item.name = "Patch Cable"
+        self.item.save()
+        response = self.client.get(reverse("dashboard"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Patch Cable")
+
+    def test_category_rename_invalidates_dashboard(self):
+        # Renaming a category shown in the table renders the table again
+        self.client.get(reverse("dashboard"))
+        self.category.name = "Network Cables"
+        self.category.save()
+        self.assertContains(self.client.get(reverse("dashboard")), "Network Cables")
+
+    def test_admin_view_conditional_get_and_invalidation(self):
+        # The admin view answers 304 while nothing changes and re-renders after an item is deleted
+        etag = self.client.get(reverse("admin-view"))["ETag"]
+        self.assertEqual(self.client.get(reverse("admin-view"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.item.delete()
+        response = self.client.get(reverse("admin-view"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "No items assigned to admin")
+
+
+# Tests for the JSON API
+class ApiTests(TestCase):
+    def setUp(self):
+        # Create a user with a few items and a second user with an item of their own
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other = User.objects.create_user(username="otheruser", password="password123")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = InventoryItem.objects.create(name="Laptop", quantity=4, category=self.category, user=self.user)
+        self.cable = InventoryItem.objects.create(name="Cable", quantity=2, user=self.user)
+        self.foreign = InventoryItem.objects.create(name="Server", quantity=9, user=self.other)
+        self.client.force_login(self.user)
+
+    def send(self, method, url, data, **headers):
+        # Send a JSON body with the given method
+        return getattr(self.client, method)(url, json.dumps(data), content_type="application/json", **headers)
+
+    def test_requires_login(self):
+        # Anonymous requests get a JSON 401 rather than a login redirect
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api-items")).status_code, 401)
+
+    def test_list_is_paginated_and_limited_to_own_items(self):
+        # Items are listed by cursor pages holding only the requested fields
+        response = self.client.get(reverse("api-items"), {"sort": "name", "limit": 1, "fields": "id,name"})
+        body = response.json()
+        self.assertEqual(body["results"], [{"id": self.cable.id, "name": "Cable"}])
+        body = self.client.get(reverse("api-items"), {"sort": "name", "limit": 1, "after": body["next"]}).json()
+        self.assertEqual([item["name"] for item in body["results"]], ["Laptop"])
+        self.assertIsNone(body["next"])
+        self.assertEqual(self.client.get(reverse("api-items"), {"fields": "password"}).status_code, 400)
+
+    def test_list_answers_conditional_requests(self):
+        # The list ETag changes when the user's items change
+        etag = self.client.get(reverse("api-items")).headers["ETag"]
+        self.assertEqual(self.client.get(reverse("api-items"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.cable.quantity = 7
+        self.cable.save()
+        self.assertEqual(self.client.get(reverse("api-items"), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_create_and_patch_item(self):
+        # Items are created and partially updated with validated JSON
+        response = self.send("post", reverse("api-items"), {"name": "Mouse", "quantity": 3, "category": self.category.id})
+        self.assertEqual(response.status_code, 201)
+        item = InventoryItem.objects.get(pk=response.json()["id"])
+        self.assertEqual((item.user, item.category), (self.user, self.category))
+        response = self.send("patch", reverse("api-item", args=[item.id]), {"quantity": 8})
+        self.assertEqual(response.json()["quantity"], 8)
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_quantity, 14)
+        response = self.send("post", reverse("api-items"), {"name": "Bad", "quantity": -1})
+        self.assertIn("quantity", response.json()["errors"])
+
+    def test_patch_checks_if_match(self):
+        # A stale If-Match is rejected and the item is left unchanged
+        url = reverse("api-item", args=[self.laptop.id])
+        etag = self.client.get(url).headers["ETag"]
+        self.assertEqual(self.send("patch", url, {"quantity": 5}, HTTP_IF_MATCH=etag).status_code, 200)
+        self.assertEqual(self.send("patch", url, {"quantity": 6}, HTTP_IF_MATCH=etag).status_code, 412)
+        self.laptop.refresh_from_db()
+        self.assertEqual(self.laptop.quantity, 5)
+
+    def test_other_users_items_are_not_found(self):
+        # Items of other users can be neither read nor changed
+        url = reverse("api-item", args=[self.foreign.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.send("patch", url, {"quantity": 1}).status_code, 404)
+
+    def test_batch_runs_in_constant_queries(self):
+        # A batch is applied with a fixed number of queries and the summary is rebuilt once
+        get_categories()
+        payload = {
+            "create": [{"name": f"Item {i}", "quantity": i} for i in range(20)],
+            "update": [{"id": self.laptop.id, "quantity": 1}],
+            "delete": [self.cable.id, self.foreign.id],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send("post", reverse("api-items-batch"), payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(queries), 22)
+        self.assertEqual(response.json()["deleted"], 1)
+        self.assertTrue(InventoryItem.objects.filter(pk=self.foreign.id).exists())
+        summary = UserInventorySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_items, summary.total_quantity), (21, 1 + sum(range(20))))
+
+        # Deleting more items runs no more queries, and each deletion is written to the ledger
+        counts = []
+        for size in (1, 10):
+            items = InventoryItem.objects.bulk_create(
+                InventoryItem(name=f"Old {i}", quantity=3, user=self.user) for i in range(size)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                response = self.send("post", reverse("api-items-batch"), {"delete": [item.id for item in items]})
+            self.assertEqual(response.json()["deleted"], size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(InventoryMovement.objects.filter(kind=InventoryMovement.DELETED, quantity_delta=-3).count(), 11)
+        summary = UserInventorySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_items, summary.total_quantity), (21, 1 + sum(range(20))))
+
+    def test_invalid_batch_changes_nothing(self):
+        # One bad entry rejects the whole batch
+        payload = {"create": [{"name": "Good", "quantity": 1}], "update": [{"id": self.foreign.id, "quantity": 1}]}
+        response = self.send("post", reverse("api-items-batch"), payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("update.0", response.json()["errors"])
+        self.assertFalse(InventoryItem.objects.filter(name="Good").exists())
+
+    def test_batch_ids_must_be_unique_integers(self):
+        # Ids that are not whole numbers or name an item twice are rejected as invalid, not failed
+        payload = {
+            "update": [{"id": [self.laptop.id], "quantity": 1}, {"id": self.laptop.id, "quantity": 2},
+                       {"id": self.laptop.id, "quantity": 3}, {"id": True, "quantity": 4}],
+            "delete": [{"id": self.cable.id}, self.cable.id, self.cable.id],
+        }
+        response = self.send("post", reverse("api-items-batch"), payload)
+        self.assertEqual(response.status_code, 400)
+        codes = {key: value["id"][0]["code"] for key, value in response.json()["errors"].items()}
+        self.assertEqual(codes, {
+            "update.0": "invalid", "update.2": "duplicate", "update.3": "invalid",
+            "delete.0": "invalid", "delete.2": "duplicate",
+        })
+        self.assertEqual(InventoryItem.objects.get(pk=self.laptop.id).quantity, self.laptop.quantity)
+        # Adjustments only take POST, the detail methods are not inherited
+        url = reverse("api-item-adjust", args=[self.laptop.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.send("patch", url, {"quantity": 1}).status_code, 405)
+
+    def test_categories_are_listed(self):
+        # Categories are served from the cached catalogue
+        response = self.client.get(reverse("api-categories"))
+        self.assertEqual(response.json()["results"], [{"id": self.category.id, "name": "Electronics", "low_stock_threshold": None}])
+
+
+# Tests for the async views, served through the URL configuration at the top of this module
+@override_settings(ROOT_URLCONF="inventory.tests")
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        # Create an admin and a user that each own items
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        category = Category.objects.create(name="Electronics")
+        InventoryItem.objects.create(name="Laptop", quantity=4, category=category, user=self.user)
+        InventoryItem.objects.create(name="Cable", quantity=1, user=self.user)
+        InventoryItem.objects.create(name="Server", quantity=9, user=self.admin)
+
+    def test_dashboard_matches_sync_view(self):
+        # The async dashboard renders the same rows, banner and validators as the sync view
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"), {"sort": "name"})
+        self.assertContains(response, "1 item has a low stock count")
+        self.assertEqual([item.name for item in response.context["items"]], ["Cable", "Laptop"])
+        response = self.client.get(reverse("dashboard"), {"sort": "name"}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_dashboard_requires_login(self):
+        # Anonymous users are sent to the login page
+        response = self.client.get(reverse("dashboard"))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('dashboard')}")
+
+    def test_admin_view_lists_users_and_items(self):
+        # The async admin view groups every user's items, and is for admins only
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin-view"))
+        user_items = {user.username: [item.name for item in items] for user, items in response.context["user_items"]}
+        self.assertEqual(user_items, {"admin": ["Server"], "testuser": ["Laptop", "Cable"]})
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("admin-view")).status_code, 302)
+
+    def test_api_reads_async_and_writes_sync(self):
+        # The async item list serves reads, while creating items still runs the sync handler
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("api-items"), json.dumps({"name": "Mouse", "quantity": 2}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(reverse("api-items"), {"sort": "name", "fields": "name"})
+        self.assertEqual(response.json()["results"], [{"name": "Cable"}, {"name": "Laptop"}, {"name": "Mouse"}])
+        self.assertEqual(self.client.delete(reverse("api-items")).status_code, 405)
+
+
+# Tests for the per-request query budgets
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        # Create a logged in user with an item
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        InventoryItem.objects.create(name="Laptop", quantity=4, user=self.user)
+        self.client.force_login(self.user)
+
+    def test_queries_are_counted(self):
+        # The query count and database time are recorded on the request
+        response = self.client.get(reverse("dashboard"))
+        self.assertGreater(response.wsgi_request.query_count, 0)
+        self.assertGreater(response.wsgi_request.query_seconds, 0)
+
+    @override_settings(ROOT_URLCONF="inventory.tests")
+    async def test_queries_of_async_requests_are_counted(self):
+        # Under ASGI the middleware runs async and counts the queries run for the async view
+        self.assertTrue(iscoroutinefunction(QueryBudgetMiddleware(self.async_client.handler.get_response_async)))
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.asgi_request.query_count, 0)
+        with self.settings(QUERY_BUDGETS={"dashboard": 1}, QUERY_BUDGET_ACTION="raise"):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "over its budget of 1"):
+                await self.async_client.get(reverse("dashboard"))
+
+    async def test_overlapping_async_requests_count_their_own_queries(self):
+        # Async requests share the thread their ORM calls run in, yet each counts only its queries
+        async def view(request):
+            for _ in range(int(request.GET["queries"])):
+                await User.objects.acount()
+                await asyncio.sleep(0)
+            return HttpResponse()
+
+        middleware = QueryBudgetMiddleware(view)
+        requests = [RequestFactory().get("/", {"queries": queries}) for queries in (1, 2, 3)]
+        await asyncio.gather(*(middleware(request) for request in requests))
+        self.assertEqual([request.query_count for request in requests], [1, 2, 3])
+
+    @override_settings(QUERY_BUDGETS={"dashboard": 1}, QUERY_BUDGET_ACTION="raise")
+    def test_over_budget_raises(self):
+        # A view running more queries than its budget fails loudly
+        with self.assertRaisesMessage(QueryBudgetExceeded, "over its budget of 1"):
+            self.client.get(reverse("dashboard"))
+
+    @override_settings(QUERY_BUDGETS={}, QUERY_BUDGET_DEFAULT=1, QUERY_BUDGET_ACTION="log")
+    def test_over_budget_logs(self):
+        # In log mode the page is served and a warning is logged, the default budget applies
+        with self.assertLogs("inventory.queries", "WARNING") as logs:
+            response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("GET /dashboard/", logs.output[0])
+
+
+# Tests for the request metrics and Server-Timing headers
+class MetricsTests(TestCase):
+    def setUp(self):
+        # Start every test from an empty registry with a logged in admin
+        registry.reset()
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        InventoryItem.objects.create(name="Laptop", quantity=4, user=self.admin)
+        self.client.force_login(self.admin)
+
+    def test_server_timing_header(self):
+        # Responses report the render, database and total time
+        response = self.client.get(reverse("dashboard"))
+        timings = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(timings, ["render", "db", "total"])
+        self.assertIn('desc="inventory/dashboard.html"', response["Server-Timing"])
+
+    @override_settings(ROOT_URLCONF="inventory.tests")
+    async def test_async_requests_are_recorded(self):
+        # Under ASGI the middleware runs async and still reports the database time of async views
+        self.assertTrue(iscoroutinefunction(InstrumentationMiddleware(self.async_client.handler.get_response_async)))
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse("dashboard"))
+        timings = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(timings, ["render", "db", "total"])
+        self.assertIn('inventory_requests_total{view="dashboard",method="GET",status="200"} 1', render_text())
+
+    def test_metrics_endpoint(self):
+        # Request latency, query counts and fragment cache hits are exposed in the text format
+        self.client.get(reverse("dashboard"))
+        self.client.get(reverse("dashboard"))
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('inventory_requests_total{view="dashboard",method="GET",status="200"} 2', text)
+        self.assertIn('inventory_request_duration_seconds_count{view="dashboard"} 2', text)
+        self.assertIn('inventory_request_duration_seconds_bucket{view="dashboard",le="+Inf"} 2', text)
+        self.assertIn('inventory_cache_requests_total{cache="dashboard_table",result="hit"} 1', text)
+        self.assertIn('inventory_cache_requests_total{cache="dashboard_table",result="miss"} 1', text)
+        self.assertIn('inventory_db_queries_total{view="dashboard"}', text)
+
+    def test_metrics_endpoint_requires_admin(self):
+        # Non admin users are redirected away from the metrics
+        user = User.objects.create_user(username="testuser", password="password123")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 302)
+
+    def test_shards_of_finished_threads_are_kept(self):
+        # Values recorded by other threads are summed, also after the thread has finished
+        thread = threading.Thread(target=lambda: registry.increment("inventory_requests_total", (("view", "x"),), 3))
+        thread.start()
+        thread.join()
+        registry.increment("inventory_requests_total", (("view", "x"),), 2)
+        self.assertIn('inventory_requests_total{view="x"} 5', render_text())
+        self.assertIn('inventory_requests_total{view="x"} 5', render_text())
+
+
+# Tests for the synthetic data generator and the view benchmark
+class DataGeneratorTests(TestCase):
+    def test_generates_skewed_consistent_data(self):
+        # Items are spread unevenly over the users and their summaries match the items
+        user_ids = generate_inventory(users=10, categories=5, items=2000, batch_size=300)
+        self.assertEqual(InventoryItem.objects.filter(user__in=user_ids).count(), 2000)
+        self.assertEqual(Category.objects.filter(name__startswith="gen-").count(), 5)
+        counts = [InventoryItem.objects.filter(user=user_id).count() for user_id in user_ids]
+        self.assertGreater(counts[0], counts[-1] * 3)
+        expected = UserInventorySummary.compute(user_ids)
+        for summary in UserInventorySummary.objects.filter(user__in=user_ids):
+            self.assertEqual(summary.total_items, expected[summary.user_id]["total_items"])
+            self.assertEqual(summary.category_counts, expected[summary.user_id]["category_counts"])
+        # Every item opens its history in the ledger with its generated state
+        self.assertEqual(levels_at(user_ids[0], timezone.now()), replay_levels_at(user_ids[0], timezone.now()))
+        openings = InventoryMovement.objects.filter(kind=InventoryMovement.OPENING, user_id__in=user_ids)
+        self.assertEqual(openings.count(), 2000)
+        self.assertEqual(
+            openings.aggregate(total=Sum("quantity_delta"))["total"],
+            InventoryItem.objects.filter(user__in=user_ids).aggregate(total=Sum("quantity"))["total"],
+        )
+
+    def test_same_seed_generates_same_items(self):
+        # Runs with the same seed generate the same rows
+        generate_inventory(users=3, categories=2, items=50, prefix="a-")
+        generate_inventory(users=3, categories=2, items=50, prefix="b-")
+        rows = lambda prefix: list(
+            InventoryItem.objects.filter(user__username__startswith=prefix).order_by("id").values_list("name", "quantity")
+        )
+        self.assertEqual(rows("a-"), rows("b-"))
+
+    def test_benchmark_views_writes_results(self):
+        # The benchmark reports every scenario and rolls its data back
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_views", users=3, items=60, requests=2, warmup=1, output=path, stdout=StringIO()
+            )
+            with open(path) as results:
+                scenarios = json.load(results)["scenarios"]
+            self.assertIn("admin_view", scenarios)
+            self.assertEqual(scenarios["dashboard"]["queries_per_request"], 3)
+            self.assertFalse(User.objects.filter(username__startswith="bench-views-").exists())
+            # Comparing against a run with an impossible regression limit fails
+            with self.assertRaisesMessage(CommandError, "p95 latency regressed"):
+                call_command(
+                    "benchmark_views", users=3, items=60, requests=2, warmup=1, scenarios=["add_item"],
+                    compare=path, max_regression=-1000, stdout=StringIO(),
+                )
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="snap", password="pass")
+        self.category = Category.objects.create(name="Snap category")
+        self.item = InventoryItem.objects.create(name="Snap item", quantity=2, category=self.category, user=self.user)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def dump(self, filename, *labels):
+        path = os.path.join(self.directory.name, filename)
+        call_command("dump_snapshot", *labels, output=path, stdout=StringIO(), stderr=StringIO())
+        return path
+
+    def test_round_trip_restores_rows(self):
+        # Dumps in every format load back into an empty database with relations and summaries
+        group = self.user.groups.create(name="Snap group")
+        for filename in ("snapshot.json", "snapshot.jsonl", "snapshot.jsonl.gz"):
+            path = self.dump(filename, "auth.user", "auth.group", "inventory.category", "inventory.inventoryitem")
+            InventoryItem.objects.all().delete()
+            User.objects.all().delete()
+            Category.objects.all().delete()
+            call_command("load_snapshot", path, stdout=StringIO())
+            item = InventoryItem.objects.get(pk=self.item.pk)
+            # JSON keeps datetimes to the millisecond, as dumpdata does
+            self.assertEqual(item.last_edited, self.item.last_edited.replace(microsecond=self.item.last_edited.microsecond // 1000 * 1000))
+            self.assertEqual(item.category_id, self.category.pk)
+            self.assertEqual(list(User.objects.get(pk=self.user.pk).groups.all()), [group])
+            self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_items, 1)
+            # The loaded item opens its history in the ledger at its loaded quantity
+            self.assertEqual(item_quantity_at(item.pk, timezone.now()), 2)
+        self.assertEqual(
+            InventoryMovement.objects.filter(item_id=self.item.pk, kind=InventoryMovement.OPENING).count(), 3
+        )
+
+    def test_updates_existing_rows_and_rejects_broken_references(self):
+        # Objects whose primary key exists update the row, dangling foreign keys roll the load back
+        rows = [{"model": "inventory.category", "pk": self.category.pk, "fields": {"name": "Renamed"}}]
+        result = SnapshotLoader().load(rows)
+        self.assertEqual(result.counts, {"inventory.Category": 1})
+        self.assertEqual(Category.objects.get(pk=self.category.pk).name, "Renamed")
+        broken = rows + [{
+            "model": "inventory.inventoryitem", "pk": 999,
+            "fields": {"name": "Orphan", "quantity": 1, "category": None, "user": 12345},
+        }]
+        with self.assertRaises(Exception):
+            SnapshotLoader().load(broken)
+        self.assertFalse(InventoryItem.objects.filter(pk=999).exists())
+
+    def test_exclude_skips_models(self):
+        path = self.dump("snapshot.json", "inventory")
+        InventoryItem.objects.all().delete()
+        call_command("load_snapshot", path, exclude=["inventory.inventoryitem"], stdout=StringIO())
+        self.assertFalse(InventoryItem.objects.exists())
+        self.assertTrue(Category.objects.filter(pk=self.category.pk).exists())
+
+
+# Tests for searching items by item and category name
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other = User.objects.create_user(username="otheruser", password="password123")
+        self.category = Category.objects.create(name="Laptops")
+        self.laptop = InventoryItem.objects.create(name="Black Laptop", quantity=4, user=self.user)
+        self.mouse = InventoryItem.objects.create(name="Mouse", quantity=2, category=self.category, user=self.user)
+        self.foreign = InventoryItem.objects.create(name="Laptop", quantity=9, user=self.other)
+        self.client.force_login(self.user)
+
+    def test_prefix_search_ranks_names_first(self):
+        # Partial words match, names weigh more than categories and other users' items are left out
+        self.assertEqual(ranked_item_ids(self.user.id, "lap", 10), [self.laptop.id, self.mouse.id])
+        self.assertEqual(ranked_item_ids(self.user.id, "bla LAP", 10), [self.laptop.id])
+        self.assertEqual(ranked_item_ids(self.user.id, '" OR *', 10), [])
+
+    def test_best_matches_win_over_newer_ones(self):
+        # Every match is ranked, so an older exact match beats newer items matching the prefix
+        lamp = InventoryItem.objects.create(name="Lamp", quantity=1, user=self.user)
+        InventoryItem.objects.bulk_create(
+            [InventoryItem(name=f"Lamp Shade Large {number}", quantity=1, user=self.user) for number in range(5)]
+        )
+        self.assertEqual(ranked_item_ids(self.user.id, "lam", 2)[0], lamp.id)
+        # Queries of single letters rank only their newest matches
+        self.assertNotIn(lamp.id, ranked_item_ids(self.user.id, "l", 2))
+
+    def test_index_follows_writes(self):
+        # Renames, category renames, queryset updates and deletes are reflected in the results
+        self.laptop.name = "Grey Notebook"
+        self.laptop.save()
+        self.assertEqual(ranked_item_ids(self.user.id, "notebook", 10), [self.laptop.id])
+        self.category.name = "Pointers"
+        self.category.save()
+        self.assertEqual(ranked_item_ids(self.user.id, "pointers", 10), [self.mouse.id])
+        InventoryItem.objects.filter(pk=self.mouse.pk).update(user=self.other)
+        self.assertEqual(ranked_item_ids(self.user.id, "mouse", 10), [])
+        self.laptop.delete()
+        self.assertEqual(ranked_item_ids(self.user.id, "grey", 10), [])
+
+    def test_dashboard_search_is_paginated(self):
+        # The dashboard lists matches by rank, page by page, keeping the filters
+        InventoryItem.objects.bulk_create(
+            [InventoryItem(name=f"Laptop {number}", quantity=9, user=self.user) for number in range(3)]
+        )
+        with self.settings(DASHBOARD_PAGE_SIZE=2):
+            response = self.client.get(reverse("dashboard"), {"q": "laptop"})
+            self.assertEqual(len(response.context["items"]), 2)
+            self.assertContains(response, "page=2")
+            response = self.client.get(reverse("dashboard"), {"q": "laptop", "page": "3"})
+            self.assertEqual([item.name for item in response.context["items"]], ["Mouse"])
+            response = self.client.get(reverse("dashboard"), {"q": "laptop", "low": "1"})
+            self.assertEqual([item.name for item in response.context["items"]], ["Mouse"])
+
+    def test_filters_apply_before_the_result_limit(self):
+        # Newer matches outside the filters do not push the filtered matches past the limit
+        InventoryItem.objects.bulk_create(
+            [InventoryItem(name=f"Laptop {number}", quantity=9, user=self.user) for number in range(3)]
+        )
+        with self.settings(SEARCH_MAX_RESULTS=2):
+            response = self.client.get(reverse("dashboard"), {"q": "laptop", "category": self.category.id})
+            self.assertEqual([item.name for item in response.context["items"]], ["Mouse"])
+            response = self.client.get(reverse("dashboard"), {"q": "laptop", "low": "1"})
+            self.assertEqual([item.name for item in response.context["items"]], ["Mouse"])
+        ids = ranked_item_ids(None, "laptop", 2, items=InventoryItem.objects.filter(quantity__lte=4))
+        self.assertEqual(ids, [self.laptop.id, self.mouse.id])
+
+    def test_search_api(self):
+        # The API serves autocompletion with the requested fields, and needs a query
+        response = self.client.get(reverse("api-items-search"), {"q": "la", "fields": "name", "limit": 1})
+        self.assertEqual(response.json(), {"results": [{"name": "Black Laptop"}], "page": 1, "next_page": 2,
+                                           "previous_page": None})
+        self.assertEqual(self.client.get(reverse("api-items-search"), {"q": "?"}).status_code, 400)
+
+
+# Sink keeping the digests it was given, or failing every delivery
+class RecordingSink(AlertSink):
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+        self.digests = []
+
+    def deliver(self, user, alerts):
+        if self.fail:
+            raise ConnectionError("sink down")
+        self.digests.append((user.username, [(alert.item_name, alert.event) for alert in alerts]))
+
+
+# Tests for low stock alerts and their delivery
+class LowStockAlertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.item = InventoryItem.objects.create(name="Toner", quantity=10, user=self.user)
+
+    def set_quantity(self, item, quantity):
+        item.quantity = quantity
+        item.save()
+
+    def test_threshold_crossings_are_queued(self):
+        # Only saves crossing the threshold queue an alert, new items that start low included
+        self.set_quantity(self.item, 2)
+        self.set_quantity(self.item, 1)
+        self.set_quantity(self.item, 8)
+        InventoryItem.objects.create(name="Paper", quantity=0, user=self.user)
+        alerts = LowStockAlert.objects.order_by("id").values_list("item_name", "event", "previous_quantity")
+        self.assertEqual(list(alerts), [("Toner", "low", 10), ("Toner", "restocked", 1), ("Paper", "low", None)])
+        # Batch API changes queue their alerts too
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("api-items-batch"), json.dumps({"update": [{"id": self.item.id, "quantity": 0}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(LowStockAlert.objects.filter(item=self.item, event="low").count(), 2)
+
+    def test_dispatcher_deduplicates_and_rate_limits(self):
+        # Flapping items are dropped, each user gets one digest, then waits out the interval
+        self.set_quantity(self.item, 1)
+        self.set_quantity(self.item, 9)
+        InventoryItem.objects.create(name="Paper", quantity=0, user=self.user)
+        sink = RecordingSink()
+        counts = AlertDispatcher(sinks=[sink]).run_once()
+        self.assertEqual((counts["delivered"], counts["superseded"]), (1, 2))
+        self.assertEqual(sink.digests, [("testuser", [("Paper", "low")])])
+        self.set_quantity(self.item, 0)
+        counts = AlertDispatcher(sinks=[sink]).run_once()
+        self.assertEqual(counts["deferred"], 1)
+        self.assertEqual(LowStockAlert.objects.get(item=self.item, event="low", status="pending").attempts, 0)
+        self.assertEqual(AlertDispatcher(sinks=[sink]).run_once()["claimed"], 0)
+
+    def test_failed_deliveries_are_retried_then_given_up(self):
+        self.set_quantity(self.item, 0)
+        with override_settings(ALERT_MAX_ATTEMPTS=2, ALERT_RETRY_DELAY=0):
+            with self.assertLogs("inventory.alerts", "ERROR"):
+                self.assertEqual(AlertDispatcher(sinks=[RecordingSink(fail=True)]).run_once()["retrying"], 1)
+                self.assertEqual(AlertDispatcher(sinks=[RecordingSink(fail=True)]).run_once()["failed"], 1)
+        alert = LowStockAlert.objects.get()
+        self.assertEqual((alert.status, alert.attempts), ("failed", 2))
+        self.assertIn("sink down", alert.last_error)
+
+    def test_deliver_alerts_command(self):
+        # The worker delivers through the configured sinks and exits with --once
+        self.set_quantity(self.item, 0)
+        with self.assertLogs("inventory.alerts", "WARNING") as logs:
+            call_command("deliver_alerts", once=True, stdout=StringIO())
+        self.assertIn("Toner", logs.output[0])
+        self.assertEqual(LowStockAlert.objects.get().status, "delivered")
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other = User.objects.create_user(username="otheruser", password="password123")
+        self.category = Category.objects.create(name="Cables")
+
+    def test_saves_and_deletes_write_movements(self):
+        item = InventoryItem.objects.create(name="Cable", quantity=5, user=self.user)
+        item.quantity = 8
+        item.save()
+        # Saves that leave quantity, category and owner alone write nothing
+        item.name = "Long cable"
+        item.save()
+        item.user = self.other
+        item.save()
+        item.delete()
+        movements = InventoryMovement.objects.order_by("id").values_list("kind", "user_id", "quantity", "quantity_delta")
+        self.assertEqual(list(movements), [
+            ("created", self.user.id, 5, 5),
+            ("updated", self.user.id, 8, 3),
+            ("transferred_out", self.user.id, 0, -8),
+            ("transferred_in", self.other.id, 8, 8),
+            ("deleted", self.other.id, 0, -8),
+        ])
+        with self.assertRaises(ValueError):
+            InventoryMovement.objects.first().save()
+
+    def test_batch_api_and_import_write_movements(self):
+        item = InventoryItem.objects.create(name="Cable", quantity=5, user=self.user)
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("api-items-batch"),
+            json.dumps({"create": [{"name": "Dock", "quantity": 2}], "update": [{"id": item.id, "quantity": 1}],
+                        "delete": [item.id]}),
+            content_type="application/json",
+        )
+        ItemImporter(self.user).run([{"name": "Mouse", "quantity": "4"}])
+        kinds = InventoryMovement.objects.order_by("id").values_list("kind", "quantity")
+        self.assertEqual(list(kinds), [("created", 5), ("created", 2), ("updated", 1), ("deleted", 0), ("created", 4)])
+
+    def test_point_in_time_queries_match_a_full_replay(self):
+        start = timezone.now() - timedelta(days=1)
+
+        # Stamp the writes of each step an hour after the previous one
+        def at(hour):
+            return patch("django.utils.timezone.now", return_value=start + timedelta(hours=hour))
+
+        with at(0):
+            item = InventoryItem.objects.create(name="Cable", quantity=5, user=self.user, category=self.category)
+            spare = InventoryItem.objects.create(name="Spare", quantity=1, user=self.user)
+            spare_id = spare.id
+        with at(1):
+            # Queryset updates bypass the ledger, the next save records the state it loaded
+            InventoryItem.objects.filter(pk=item.pk).update(quantity=7)
+            item.refresh_from_db()
+            item.quantity = 3
+            item.save()
+        take_snapshot(start + timedelta(hours=2))
+        with at(3):
+            spare.user = self.other
+            spare.save()
+        take_snapshot(start + timedelta(hours=4))
+        with at(5):
+            item.quantity = 9
+            item.save()
+            spare.delete()
+
+        for hour in range(7):
+            moment = start + timedelta(hours=hour, minutes=30)
+            for user in (self.user, self.other):
+                self.assertEqual(levels_at(user.id, moment), replay_levels_at(user.id, moment))
+        # The second snapshot carried the unchanged item over from the first one
+        self.assertEqual(levels_at(self.user.id, start + timedelta(hours=4)), {item.id: (self.category.id, 3)})
+        self.assertEqual(levels_at(self.other.id, start + timedelta(hours=4)), {spare_id: (None, 1)})
+        self.assertEqual(item_quantity_at(item.id, start + timedelta(hours=2)), 3)
+        self.assertIsNone(item_quantity_at(spare_id, start + timedelta(hours=6)))
+        self.assertEqual(take_snapshot().item_count, 1)
+        changes = {row["item_id"]: row["net_change"] for row in changes_since(self.user.id, start + timedelta(hours=2))}
+        self.assertEqual(changes, {item.id: 6, spare_id: -1})
+
+
+class ConcurrentEditTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.category = Category.objects.create(name="Printing")
+        self.item = InventoryItem.objects.create(name="Toner", quantity=10, user=self.user, category=self.category)
+        self.client.force_login(self.user)
+
+    def send(self, url, data, method="post"):
+        return getattr(self.client, method)(url, json.dumps(data), content_type="application/json")
+
+    def test_saving_a_stale_item_is_rejected(self):
+        # Two copies loaded at the same version, the second save would undo the first
+        first, second = InventoryItem.objects.get(pk=self.item.pk), InventoryItem.objects.get(pk=self.item.pk)
+        first.quantity = 7
+        first.save()
+        second.quantity = 12
+        with self.assertRaises(StaleItemError):
+            second.save()
+        self.assertEqual(second.version, 1)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.version), (7, 2))
+
+    def test_edit_form_shows_conflicts(self):
+        url = reverse("edit-item", args=[self.item.pk])
+        self.assertContains(self.client.get(url), 'name="version" value="1"')
+        InventoryItem.objects.get(pk=self.item.pk).save()
+        data = {"name": "Toner", "quantity": 3, "category": self.category.pk, "version": 1}
+        response = self.client.post(url, data)
+        self.assertContains(response, "Someone else changed this item", status_code=409)
+        self.assertContains(response, 'name="version" value="2"', status_code=409)
+        # Saving the form again applies the user's values over the other change
+        self.assertEqual(self.client.post(url, {**data, "version": 2}).status_code, 302)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.version), (3, 3))
+
+    def test_api_conflicts_and_adjustments(self):
+        url = reverse("api-item", args=[self.item.pk])
+        response = self.send(url, {"quantity": 4, "version": 1}, "patch")
+        self.assertEqual(response.json()["version"], 2)
+        response = self.send(url, {"quantity": 5, "version": 1}, "patch")
+        self.assertEqual((response.status_code, response.json()["current"]["quantity"]), (409, 4))
+        batch = self.send(reverse("api-items-batch"), {"update": [{"id": self.item.pk, "quantity": 5, "version": 1}]})
+        self.assertEqual(batch.status_code, 409)
+        adjust = reverse("api-item-adjust", args=[self.item.pk])
+        response = self.send(adjust, {"delta": -3})
+        self.assertEqual((response.json()["quantity"], response.json()["version"]), (1, 3))
+        self.assertEqual(self.send(adjust, {"delta": -2}).status_code, 409)
+        self.assertEqual(self.send(adjust, {"delta": "1"}).status_code, 400)
+        # Adjustments keep the summary, alerts and ledger in step like a save
+        summary = UserInventorySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_quantity, summary.low_stock_count), (1, 1))
+        self.assertEqual(LowStockAlert.objects.get().previous_quantity, 4)
+        self.assertEqual(InventoryMovement.objects.order_by("-id").values_list("quantity_delta", flat=True)[0], -3)
+
+
+class ConcurrentStressTests(TransactionTestCase):
+    def setUp(self):
+        # Threads of an in-memory SQLite test database share one connection
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("Needs a test database that allows concurrent connections.")
+
+    def test_no_updates_are_lost(self):
+        # Threads adjust the same item and edit it with retries on conflicts, every change lands
+        user = User.objects.create_user(username="testuser", password="password123")
+        item = InventoryItem.objects.create(name="Toner", quantity=0, user=user)
+        threads, rounds = 8, 25
+
+        def adjust():
+            for _ in range(rounds):
+                InventoryItem.adjust_quantity(item.pk, 1)
+            connection.close()
+
+        def edit():
+            for _ in range(rounds):
+                while True:
+                    copy = InventoryItem.objects.get(pk=item.pk)
+                    copy.quantity += 2
+                    try:
+                        copy.save()
+                        break
+                    except StaleItemError:
+                        continue
+            connection.close()
+
+        workers = [threading.Thread(target=adjust if i % 2 else edit) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, (threads // 2) * rounds * 3)
+        self.assertEqual(UserInventorySummary.objects.get(user=user).total_quantity, item.quantity)
+
+
+class SavePathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.item = InventoryItem.objects.create(name="Toner", quantity=10, user=self.user)
+
+    def test_saves_write_only_changed_columns(self):
+        item = InventoryItem.objects.get(pk=self.item.pk)
+        item.quantity = 4
+        with CaptureQueriesContext(connection) as queries, patch("inventory.models.sanitise_name") as sanitise:
+            item.save()
+        update = next(query["sql"] for query in queries if query["sql"].startswith("UPDATE \"inventory_inventoryitem\""))
+        self.assertIn('"quantity"', update)
+        self.assertNotIn('"date_created"', update)
+        self.assertNotIn('"name"', update)
+        # The name did not change, so it was not sanitised again
+        sanitise.assert_not_called()
+        item.name = "<script>alert(1)</script>Toner"
+        item.save()
+        category = Category.objects.create(name="Ink")
+        category.name = "<script>x</script>Ink"
+        category.save()
+        self.assertEqual(InventoryItem.objects.get(pk=item.pk).name, "alert(1)Toner")
+        self.assertEqual(Category.objects.get(pk=category.pk).name, "xInk")
+
+    def test_refresh_before_save_compares_against_reloaded_values(self):
+        # An item reloaded after someone else changed it writes a value set back to the one it was
+        # first loaded with, and the summary and ledger record the change from the reloaded value
+        item = InventoryItem.objects.get(pk=self.item.pk)
+        InventoryItem.adjust_quantity(item.pk, -8)
+        item.refresh_from_db()
+        item.quantity = 10
+        item.save()
+        self.assertEqual(InventoryItem.objects.get(pk=item.pk).quantity, 10)
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_quantity, 10)
+        movement = InventoryMovement.objects.order_by("-id").values_list("quantity", "quantity_delta").first()
+        self.assertEqual(movement, (10, 8))
+        # Reloading some of the fields only resets those
+        item.name = "Ink"
+        InventoryItem.adjust_quantity(item.pk, -1)
+        item.refresh_from_db(fields=["quantity", "version"])
+        self.assertEqual(item.changed_fields(), {"name"})
+
+    def test_bulk_writes_are_validated(self):
+        with self.assertRaises(ValueError):
+            InventoryItem.objects.bulk_create([InventoryItem(name="Bad", quantity=-1, user=self.user)])
+        with self.assertRaises(ValueError):
+            InventoryItem.objects.filter(pk=self.item.pk).update(quantity=-5)
+        created = InventoryItem.objects.bulk_create([InventoryItem(name="<img src=x>Cable", quantity=1, user=self.user)])
+        self.item.name = "<script>x</script>Toner"
+        InventoryItem.objects.bulk_update([self.item], ["name"])
+        InventoryItem.objects.filter(pk=created[0].pk).update(name="<script>y</script>Cable", quantity=F("quantity") + 1)
+        names = InventoryItem.objects.order_by("id").values_list("name", "quantity")
+        self.assertEqual(list(names), [("xToner", 10), ("yCable", 2)])
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.other = User.objects.create_user(username="otheruser", password="password123")
+        self.category = Category.objects.create(name="Cables", low_stock_threshold=3)
+
+    def create_items(self, count, user=None):
+        return InventoryItem.objects.bulk_create(
+            [InventoryItem(name=f"Item {i}", quantity=10, user=user or self.user) for i in range(count)]
+        )
+
+    def test_query_count_does_not_depend_on_selection_size(self):
+        # Load the category catalogue into the cache, so the first run does not count its query
+        get_categories()
+        for action, value in (("set_quantity", 2), ("set_category", self.category.id),
+                              ("reassign", self.other.id), ("delete", None)):
+            counts = []
+            for size in (2, 40):
+                items = self.create_items(size)
+                queryset = InventoryItem.objects.filter(pk__in=[item.pk for item in items])
+                with CaptureQueriesContext(connection) as queries:
+                    summary = apply_bulk_action(queryset, action, value)
+                counts.append(len(queries))
+                self.assertEqual((summary["selected"], summary["changed"]), (size, size))
+            self.assertEqual(counts[0], counts[1], action)
+
+    def test_dashboard_bulk_actions(self):
+        items = self.create_items(3)
+        foreign = self.create_items(1, user=self.other)[0]
+        self.client.force_login(self.user)
+        ids = [item.pk for item in items]
+        response = self.client.post(reverse("bulk-items"), {"items": ids, "action": "set_quantity", "quantity": 1},
+                                    follow=True)
+        self.assertContains(response, "Set the quantity of 3 items to 1. Total quantity went from 30 to 3.")
+        summary = UserInventorySummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_quantity, summary.low_stock_count), (3, 3))
+        self.assertEqual(LowStockAlert.objects.filter(event=LowStockAlert.LOW, item_id__in=ids).count(), 3)
+        self.assertEqual(set(InventoryItem.objects.filter(pk__in=ids).values_list("version", flat=True)), {2})
+
+        # Moving the items to a category with a higher threshold keeps them low, no alert is raised
+        self.client.post(reverse("bulk-items"), {"items": ids, "action": "set_category", "category": self.category.id})
+        self.assertEqual(LowStockAlert.objects.count(), 3)
+        # Only staff may reassign items, and to active users, unknown and inactive usernames
+        # getting the same error
+        reassign = {"items": ids[:2], "action": "reassign", "username": "otheruser"}
+        self.assertNotContains(self.client.get(reverse("dashboard")), 'name="username"')
+        response = self.client.post(reverse("bulk-items"), reassign, follow=True)
+        self.assertContains(response, "is not one of the available choices")
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        User.objects.create_user(username="former", password="password123", is_active=False)
+        for username in ("nobody", "former"):
+            response = self.client.post(reverse("bulk-items"), dict(reassign, username=username), follow=True)
+            self.assertContains(response, "Enter the username of an active user to reassign the items to.")
+        self.assertFalse(InventoryItem.objects.filter(user=self.other, pk__in=ids).exists())
+        self.client.post(reverse("bulk-items"), reassign)
+        self.client.post(reverse("bulk-items"), {"items": ids[2:], "action": "delete"})
+        self.assertEqual(InventoryItem.objects.filter(user=self.other).count(), 3)
+        self.assertFalse(InventoryItem.objects.filter(pk=ids[2]).exists())
+        self.assertEqual(UserInventorySummary.objects.get(user=self.user).total_items, 0)
+        self.assertEqual(UserInventorySummary.objects.get(user=self.other).total_items, 3)
+        now = timezone.now()
+        for user in (self.user, self.other):
+            self.assertEqual(levels_at(user.id, now), replay_levels_at(user.id, now))
+        self.assertEqual(levels_at(self.other.id, now)[ids[0]], (self.category.id, 1))
+
+        # Items of other users cannot be selected
+        response = self.client.post(reverse("bulk-items"), {"items": [foreign.pk], "action": "delete"}, follow=True)
+        self.assertContains(response, "is not one of the available choices")
+        self.assertTrue(InventoryItem.objects.filter(pk=foreign.pk).exists())
+
+    def test_admin_actions(self):
+        admin = User.objects.create_superuser(username="admin", password="password123")
+        items = self.create_items(2)
+        self.client.force_login(admin)
+        url = reverse("admin:inventory_inventoryitem_changelist")
+        ids = [item.pk for item in items]
+        self.assertContains(self.client.get(url), 'name="username"')
+        self.client.post(url, {"action": "reassign", "_selected_action": ids, "username": "otheruser"})
+        self.assertEqual(InventoryItem.objects.filter(user=self.other).count(), 2)
+        self.client.post(url, {"action": "delete_selected", "_selected_action": ids, "post": "yes"})
+        self.assertFalse(InventoryItem.objects.exists())
+        kinds = InventoryMovement.objects.filter(kind=InventoryMovement.DELETED).values_list("user_id", flat=True)
+        self.assertEqual(list(kinds), [self.other.id] * 2)
+
+    def test_raw_deletes_skip_nothing(self):
+        # Items are deleted without the ORM only while nothing relies on it: every relation to
+        # them is DO_NOTHING and the only delete receiver is the one delete_items does the work of
+        self.assertFalse(pre_delete.has_listeners(InventoryItem))
+        self.assertTrue(post_delete.disconnect(item_deleted, sender=InventoryItem))
+        try:
+            self.assertFalse(post_delete.has_listeners(InventoryItem))
+        finally:
+            post_delete.connect(item_deleted, sender=InventoryItem)
+        items = self.create_items(2)
+        self.assertEqual(raw_delete(InventoryItem.objects.filter(pk__in=[item.pk for item in items])), 2)
+        # Models whose rows others cascade from are refused
+        with self.assertRaisesMessage(ValueError, "which a raw delete would skip"):
+            raw_delete(User.objects.filter(pk=self.other.pk))
+        self.assertTrue(User.objects.filter(pk=self.other.pk).exists())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(JOB_FILES_DIR=directory.name))
+
+    # Run the due jobs in this thread, returning their outcomes
+    def run_due_jobs(self, now=None):
+        return [run_job(job.pk, job.claim_token) for job in claim_jobs(10, now)]
+
+    def test_background_import_and_export(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("items.csv", b"name,quantity,category\nCable,40,\nMouse,x,\n")
+        response = self.client.post(reverse("import-items"), {"file": upload, "background": "on"})
+        self.assertRedirects(response, reverse("jobs"))
+        self.assertFalse(InventoryItem.objects.exists())
+        self.assertEqual(self.run_due_jobs(), ["succeeded"])
+        job = Job.objects.get(name="import_items")
+        self.assertEqual((job.result["created"], job.result["rejected"], job.percent), (1, 1, 100))
+
+        self.client.post(reverse("export-items-job", args=["csv"]))
+        self.assertEqual(self.run_due_jobs(), ["succeeded"])
+        export = Job.objects.get(name="export_items")
+        self.assertEqual((export.progress, export.progress_total), (1, 1))
+        response = self.client.get(reverse("download-job-file", args=[export.pk]))
+        self.assertIn(b"Cable,40", b"".join(response.streaming_content))
+        self.assertContains(self.client.get(reverse("jobs")), reverse("download-job-file", args=[export.pk]))
+        self.assertEqual(self.client.get(reverse("api-job", args=[export.pk])).json()["status"], "succeeded")
+        other = User.objects.create_user(username="otheruser", password="password123")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse("download-job-file", args=[export.pk])).status_code, 404)
+
+    @override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_DELAY=30)
+    def test_failed_jobs_are_retried_with_backoff(self):
+        failing = MagicMock(side_effect=RuntimeError("disk full"), max_attempts=None)
+        with patch.dict(JOBS, {"failing": failing}):
+            job = enqueue("failing", user=self.user)
+            start = timezone.now()
+            self.assertEqual(self.run_due_jobs(start), ["retrying"])
+            self.assertEqual(self.run_due_jobs(start + timedelta(seconds=29)), [])
+            self.assertEqual(self.run_due_jobs(start + timedelta(seconds=31)), ["retrying"])
+            # The second retry waits twice as long after the failure
+            self.assertEqual(self.run_due_jobs(start + timedelta(seconds=59)), [])
+            self.assertEqual(self.run_due_jobs(start + timedelta(seconds=61)), ["failed"])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.FAILED, 3, "RuntimeError: disk full"))
+
+    def test_expired_claims_are_taken_over(self):
+        enqueue("wait")
+        stale = claim_jobs(10)[0]
+        self.assertEqual(claim_jobs(10), [])
+        later = timezone.now() + timedelta(seconds=settings.JOB_CLAIM_TIMEOUT + 1)
+        self.assertEqual(self.run_due_jobs(later), ["succeeded"])
+        # The worker that lost the claim cannot run the job or record an outcome
+        self.assertEqual(run_job(stale.pk, stale.claim_token), "lost")
+        with self.assertRaises(JobClaimLost):
+            stale.report_progress(1, 2)
+        self.assertEqual(Job.objects.get(pk=stale.pk).attempts, 1)
+
+    def test_outcome_writes_are_retried(self):
+        # A finished run whose outcome meets a locked table writes it again instead of being lost
+        enqueue("wait")
+        job = claim_jobs(1)[0]
+        update, calls = QuerySet.update, []
+
+        def flaky_update(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise OperationalError("database table is locked")
+            return update(queryset, **kwargs)
+
+        with patch.object(QuerySet, "update", flaky_update):
+            self.assertEqual(run_job(job.pk, job.claim_token), "succeeded")
+        self.assertEqual((len(calls), Job.objects.get(pk=job.pk).status), (2, Job.SUCCEEDED))
+
+    def test_expired_claims_use_up_attempts(self):
+        # A job whose claim expired on its last attempt is failed instead of run again, imports
+        # having a single attempt as they commit as they go
+        job = enqueue("import_items", user_id=self.user.id, file="items.csv", file_format="csv")
+        claim_jobs(10)
+        later = timezone.now() + timedelta(seconds=settings.JOB_CLAIM_TIMEOUT + 1)
+        self.assertEqual(claim_jobs(10, later), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+        self.assertIn("claim on the job expired", job.last_error)
+
+
+
+@override_settings(ANALYTICS_SETTLE=0, LOW_QUANTITY=3)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="password123")
+        self.user = User.objects.create_user(username="testuser", password="password123")
+        self.cables = Category.objects.create(name="Cables", low_stock_threshold=50)
+        self.laptops = Category.objects.create(name="Laptops")
+        InventoryItem.objects.create(name="Cable A", quantity=40, category=self.cables, user=self.user)
+        InventoryItem.objects.create(name="Cable B", quantity=80, category=self.cables, user=self.user)
+        self.laptop = InventoryItem.objects.create(name="Laptop", quantity=2, category=self.laptops, user=self.user)
+        self.loose = InventoryItem.objects.create(name="Adapter", quantity=7, user=self.user)
+        InventoryItem.objects.create(name="Laptop", quantity=10, category=self.laptops, user=self.admin)
+
+    def totals(self, rows):
+        # Helper reducing rows by category to (items, quantity, low stock) by category name
+        return {row["category"]: (row["items"], row["quantity"], row["low_stock"]) for row in rows}
+
+    def test_refresh_reads_only_the_users_changed_since_the_watermark(self):
+        self.assertEqual(refresh_analytics()["full"], True)
+        report = analytics_report()
+        self.assertEqual(
+            self.totals(report["by_category"]), {"Cables": (2, 120, 1), "Laptops": (2, 12, 1), "No category": (1, 7, 0)}
+        )
+        self.assertEqual([row["user__username"] for row in report["by_user"]], ["testuser", "admin"])
+        self.assertEqual(report["activity"], [{"day": timezone.now().date(), "created": 5, "edited": 5}])
+        self.assertEqual(refresh_analytics()["users"], 0)
+
+        self.laptop.quantity = 9
+        self.laptop.save()
+        self.loose.delete()
+        self.assertEqual(refresh_analytics(), {"full": False, "users": 1, "rollups": 2, "seconds": ANY})
+        self.assertEqual(self.totals(analytics_report()["by_category"]), {"Cables": (2, 120, 1), "Laptops": (2, 19, 0)})
+        # A new category threshold changes no item but the low stock counts of every owner
+        self.laptops.low_stock_threshold = 10
+        self.laptops.save()
+        self.assertEqual(refresh_analytics()["users"], 2)
+        report = analytics_report()
+        self.assertEqual(report["overall"], {"items": 4, "quantity": 139, "low_stock": 3, "low_stock_ratio": 0.75})
+        refresh_analytics(full=True)
+        self.assertEqual(analytics_report()["by_category"], report["by_category"])
+
+    def test_slices_match_the_items(self):
+        InventoryItem.objects.filter(name="Cable B").update(date_created=timezone.now() - timedelta(days=10))
+        refresh_analytics()
+        self.assertEqual(self.totals(slice_items()), self.totals(analytics_report()["by_category"]))
+        self.assertEqual(
+            self.totals(slice_items(user_ids=[self.user.pk], low_only=True)), {"Cables": (1, 40, 1), "Laptops": (1, 2, 1)}
+        )
+        self.assertEqual(self.totals(slice_items(category_ids=[None, self.cables.pk])), {
+            "Cables": (2, 120, 1), "No category": (1, 7, 0),
+        })
+        recent = slice_items(category_ids=[self.cables.pk], created_since=timezone.now().date() - timedelta(days=2))
+        self.assertEqual(self.totals(recent), {"Cables": (1, 40, 1)})
+        self.assertEqual(slice_items(edited_since=timezone.now().date() + timedelta(days=1)), [])
+
+    def test_analytics_page(self):
+        refresh_analytics()
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("analytics"), {"username": "testuser", "categories": ["none"]})
+        self.assertContains(response, "Cables")
+        self.assertEqual(self.totals(response.context["sliced"]), {"No category": (1, 7, 0)})
+        response = self.client.get(reverse("analytics"), {"username": "nobody"})
+        self.assertIsNone(response.context["sliced"])
+        self.assertContains(response, "No user has this username.")
+
+        self.assertRedirects(self.client.post(reverse("analytics"), {"full": "1"}), reverse("jobs"))
+        job = Job.objects.get(name="refresh_analytics")
+        self.assertEqual(job.arguments, {"full": True})
+        self.assertEqual(run_job(job.pk, claim_jobs(1)[0].claim_token), "succeeded")
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("analytics")).status_code, 302)
+
+
+# The worker runs jobs on threads with their own connections, which need committed jobs
+class JobWorkerTests(TransactionTestCase):
+    def test_thread_pool_runs_every_job_once(self):
+        for seconds in [0.01] * 12:
+            enqueue("wait", seconds=seconds)
+        counts = Worker(concurrency=4, poll_interval=0.01).run(once=True)
+        self.assertEqual(counts, {"succeeded": 12})
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 12)
+        output = StringIO()
+        call_command("runworker", once=True, stdout=output)
+        self.assertIn("No jobs were due.", output.getvalue())
+
+    def test_runs_failing_outside_the_job_are_counted(self):
+        # A run that raises outside the job function is logged and counted, the other runs go on
+        for seconds in [0.01] * 3:
+            enqueue("wait", seconds=seconds)
+        outcomes = [RuntimeError("connection lost"), "succeeded", "succeeded"]
+        with patch("inventory.jobs.run_job", side_effect=outcomes), self.assertLogs("inventory.jobs", "ERROR"):
+            counts = Worker(concurrency=1, poll_interval=0.01).run(once=True)
+        self.assertEqual(counts, {"error": 1, "succeeded": 2})
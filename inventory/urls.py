@@ -1,9 +1,18 @@
 # urls.py
 
 from django.urls import path
-from .views import Index, SignUpView, Dashboard, AddItem, EditItem, DeleteItem, simple_logout, admin_view, about
+from .views import Index, SignUpView, Dashboard, AddItem, EditItem, DeleteItem, BulkItems, ImportItems, simple_logout, admin_view, analytics_view, about
+from .views import export_items, export_all_items, metrics, JobList, export_items_job, download_job_file
+from .api import ItemListApi, ItemDetailApi, ItemAdjustApi, ItemBatchApi, ItemSearchApi, CategoryListApi, JobDetailApi
+from .async_views import AsyncDashboard, async_admin_view, AsyncItemListApi, AsyncItemDetailApi, AsyncCategoryListApi
+from django.conf import settings
 from django.contrib.auth import views as auth_views
 
+# Serve the read heavy pages with their async views when running under an ASGI server
+if settings.INVENTORY_ASYNC_VIEWS:
+    Dashboard, admin_view = AsyncDashboard, async_admin_view
+    ItemListApi, ItemDetailApi, CategoryListApi = AsyncItemListApi, AsyncItemDetailApi, AsyncCategoryListApi
+
 # Define URL patterns for the inventory app
 urlpatterns = [
     # Path for the index view (homepage)
@@ -12,10 +21,14 @@ urlpatterns = [
     path('dashboard/', Dashboard.as_view(), name='dashboard'),
     # Path for adding a new inventory item
     path('add-item/', AddItem.as_view(), name='add-item'),
+    # Path for bulk importing inventory items from a file
+    path('import-items/', ImportItems.as_view(), name='import-items'),
     # Path for editing an existing inventory item using its primary key
     path('edit-item/<int:pk>', EditItem.as_view(), name='edit-item'),
     # Path for deleting an existing inventory item using its primary key
     path('delete-item/<int:pk>', DeleteItem.as_view(), name='delete-item'),
+    # Path for applying a bulk action to the selected items
+    path('bulk-items/', BulkItems.as_view(), name='bulk-items'),
     # Path for user signup view
     path('signup/', SignUpView.as_view(), name='signup'),
     # Path for user login view
@@ -24,6 +37,26 @@ urlpatterns = [
     path('simple_logout/', simple_logout, name='simple_logout'),
     # Path for admin view
     path('admin-view/', admin_view, name='admin-view'),
+    # Path for the inventory analytics, admin only
+    path('analytics/', analytics_view, name='analytics'),
+    # Path for exporting the current user's items as csv, json or jsonl
+    path('export/<str:export_format>/', export_items, name='export-items'),
+    # Path for exporting every user's items, admin only
+    path('admin-view/export/<str:export_format>/', export_all_items, name='export-all-items'),
+    # Paths for the background jobs page, queueing an export and downloading its file
+    path('jobs/', JobList.as_view(), name='jobs'),
+    path('jobs/export/<str:export_format>/', export_items_job, name='export-items-job'),
+    path('jobs/<int:pk>/download/', download_job_file, name='download-job-file'),
+    # Paths for the JSON API
+    path('api/items/', ItemListApi.as_view(), name='api-items'),
+    path('api/items/batch/', ItemBatchApi.as_view(), name='api-items-batch'),
+    path('api/items/search/', ItemSearchApi.as_view(), name='api-items-search'),
+    path('api/items/<int:pk>/', ItemDetailApi.as_view(), name='api-item'),
+    path('api/items/<int:pk>/adjust/', ItemAdjustApi.as_view(), name='api-item-adjust'),
+    path('api/categories/', CategoryListApi.as_view(), name='api-categories'),
+    path('api/jobs/<int:pk>/', JobDetailApi.as_view(), name='api-job'),
+    # Path for the Prometheus metrics of this process, admin only
+    path('metrics/', metrics, name='metrics'),
     # Path for the about screen
     path('about/', about, name='about'),
 
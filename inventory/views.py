@@ -1,17 +1,36 @@
 # views.py
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
-from django.views.generic import TemplateView, View, CreateView, UpdateView, DeleteView
+from django.views.generic import TemplateView, View, CreateView, UpdateView, DeleteView, FormView
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .forms import UserRegisterForm, InventoryItemForm
-from .models import InventoryItem, Category
-from inventory_management.settings import LOW_QUANTITY
+from .forms import UserRegisterForm, InventoryItemForm, InventoryItemEditForm, ItemImportForm, BulkActionForm, AnalyticsSliceForm
+from .analytics import analytics_report, slice_items
+from .bulk import apply_bulk_action, available_actions, describe_bulk_action
+from .jobs import enqueue, job_storage
+from .importers import ItemImporter, detect_format, iter_rows
+from .exporters import CONTENT_TYPES, stream_export
+from .cache import categories_version, get_categories, make_token
+from .metrics import record_cache, record_render, render_text
+from .models import InventoryItem, Category, Job, StaleItemError, UserInventorySummary, low_stock_condition
+from django.conf import settings
+from .pagination import SORT_FIELDS, InvalidCursor, paginate_keyset, parse_sort
+from .search import parse_page_number, search_page
 from django.contrib import messages
-from django.http import HttpResponseRedirect
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db.models import BooleanField, Case, Count, Max, Sum, Value, When
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.http import http_date, quote_etag
+from itertools import groupby
+from operator import attrgetter
+from urllib.parse import urlencode
+import time
 
 # View for rendering the index/homepage
 
@@ -20,41 +39,180 @@ class Index(TemplateView):
     template_name = "inventory/index.html"
 
 
-# View for the user's dashboard, requires login
-class Dashboard(LoginRequiredMixin, View):
-    def get(self, request):
-        # Fetch items belonging to the current user and order them by ID
-        items = InventoryItem.objects.filter(user=self.request.user.id).order_by("id")
+# Answer with a 304 if the browser already holds this version of the page, otherwise None
+def not_modified_response(request, etag, last_modified):
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+# Add the validators to a freshly rendered page, and make browsers revalidate it on every visit
+def add_validators(response, etag, last_modified):
+    if etag:
+        response.headers["ETag"] = etag
+    if last_modified:
+        response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Render a template like render(), recording how long it took for the metrics and the
+# Server-Timing header
+def timed_render(request, template_name, context=None):
+    start = time.perf_counter()
+    response = render(request, template_name, context)
+    record_render(request, template_name, time.perf_counter() - start)
+    return response
+
+
+# Record whether a cached table fragment was served from the cache, which is the case when
+# the template never had to load the lazily loaded page behind it
+def record_fragment_cache(name, page):
+    record_cache(name, type(page) is SimpleLazyObject and page._wrapped is empty)
 
-        # Check for low inventory items
-        low_inventory = InventoryItem.objects.filter(
-            user=self.request.user.id, quantity__lte=LOW_QUANTITY
-        )
 
-        # Display a message for low inventory items
-        if low_inventory.count() > 0:
-            if low_inventory.count() > 1:
-                messages.error(
-                    request, f"{low_inventory.count()} items have a low stock level"
-                )
-            else:
-                messages.error(
-                    request, f"{low_inventory.count()} item has a low stock count"
-                )
-
-        # Get IDs of low inventory items
-        low_inventory_ids = InventoryItem.objects.filter(
-            user=self.request.user.id, quantity__lte=LOW_QUANTITY
-        ).values_list("id", flat=True)
-
-        # Render the dashboard template with item data and low inventory IDs
-        return render(
-            request,
-            "inventory/dashboard.html",
-            {"items": items, "low_inventory_ids": low_inventory_ids},
+# Summary values used when the user has no summary row yet
+EMPTY_SUMMARY_STATE = {"version": 0, "last_modified": None, "low_stock_count": 0}
+
+
+# The user's summary row versions the dashboard, its version is bumped by every write to
+# the user's items or their categories, and it also holds the low inventory count
+def dashboard_state(user_id):
+    return UserInventorySummary.objects.filter(user=user_id).values("version", "last_modified", "low_stock_count")
+
+
+# Key of the cached dashboard table, and the ETag of the page
+def dashboard_fragment_key(request, state, categories_token):
+    return make_token(
+        request.user.id, state["version"], state["last_modified"], categories_token, request.GET.urlencode()
+    )
+
+
+# Fetch items belonging to the current user, joining the category and flagging low inventory
+# rows in SQL so the template does not need a second lookup, with the optional filters applied
+def dashboard_items(user_id, category, low_only):
+    items = (
+        InventoryItem.objects.filter(user=user_id)
+        .select_related("category")
+        .annotate(
+            is_low=Case(
+                When(low_stock_condition(), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        )
+    )
+    if category.isdigit():
+        items = items.filter(category=int(category))
+    if low_only:
+        items = items.filter(low_stock_condition())
+    return items
+
+
+# Keyword arguments selecting the requested page of dashboard items
+def dashboard_page_arguments(request, sort, descending):
+    return {
+        "sort": sort,
+        "descending": descending,
+        "after": request.GET.get("after"),
+        "before": request.GET.get("before"),
+        "page_size": settings.DASHBOARD_PAGE_SIZE,
+    }
+
+
+# Fetch a single page of items with keyset pagination over (sort key, id)
+def load_dashboard_page(items, arguments):
+    try:
+        return paginate_keyset(items, **arguments)
+    except InvalidCursor:
+        # Fall back to the first page if the cursor has been tampered with
+        return paginate_keyset(items, **{**arguments, "after": None, "before": None})
+
+
+# Fetch a page of the items matching the search box, best matches first
+def load_search_page(items, user_id, request):
+    return search_page(
+        items, user_id, request.GET.get("q", ""), parse_page_number(request.GET.get("page")),
+        settings.DASHBOARD_PAGE_SIZE,
+    )
+
+
+# Display a message for low inventory items
+def add_low_stock_message(request, low_inventory_count):
+    if low_inventory_count > 1:
+        messages.error(
+            request, f"{low_inventory_count} items have a low stock level"
+        )
+    elif low_inventory_count == 1:
+        messages.error(
+            request, f"{low_inventory_count} item has a low stock count"
         )
 
 
+# Template context of the dashboard, shared by the sync and async views
+def dashboard_context(request, page, state, categories, sort, descending, fragment_key):
+    # Query strings that keep the current filters when following sort and page links
+    current_filters = {key: request.GET[key] for key in ("category", "low") if request.GET.get(key)}
+    sort_links = {
+        key: urlencode({**current_filters, "sort": key if key != sort or descending else f"-{key}"})
+        for key in SORT_FIELDS
+    }
+    page_filters = dict(current_filters)
+    for key in ("sort", "q"):
+        if request.GET.get(key):
+            page_filters[key] = request.GET[key]
+
+    return {
+        "items": SimpleLazyObject(lambda: page.items),
+        "page": page,
+        "low_inventory_count": state["low_stock_count"],
+        "categories": categories,
+        "bulk_actions": available_actions(request.user),
+        "sort": f"-{sort}" if descending else sort,
+        "selected_category": request.GET.get("category", ""),
+        "low_only": request.GET.get("low") == "1",
+        "query": request.GET.get("q", ""),
+        "filters": urlencode(page_filters),
+        "sort_links": sort_links,
+        "fragment_key": fragment_key,
+        "cache_alias": settings.INVENTORY_CACHE_ALIAS,
+        "cache_timeout": settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
+# View for the user's dashboard, requires login
+class Dashboard(LoginRequiredMixin, View):
+    def get(self, request):
+        # Read the sort order, filters and cursor from the query string
+        sort, descending = parse_sort(request.GET.get("sort", ""))
+        state = dashboard_state(request.user.id).first() or EMPTY_SUMMARY_STATE
+        fragment_key = dashboard_fragment_key(request, state, categories_version())
+
+        # Pending flash messages are rendered into the page, so never answer with a 304 then
+        etag, last_modified = quote_etag(fragment_key), state["last_modified"]
+        if len(messages.get_messages(request)):
+            etag = last_modified = None
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        items = dashboard_items(request.user.id, request.GET.get("category", ""), request.GET.get("low") == "1")
+        arguments = dashboard_page_arguments(request, sort, descending)
+
+        # The page is loaded lazily, only when the cached table fragment is missing. A search
+        # lists the matching items by rank instead of in the chosen sort order.
+        if request.GET.get("q"):
+            page = SimpleLazyObject(lambda: load_search_page(items, request.user.id, request))
+        else:
+            page = SimpleLazyObject(lambda: load_dashboard_page(items, arguments))
+        add_low_stock_message(request, state["low_stock_count"])
+
+        # Render the dashboard template with item data, low rows are flagged by is_low
+        context = dashboard_context(request, page, state, get_categories(), sort, descending, fragment_key)
+        response = timed_render(request, "inventory/dashboard.html", context)
+        record_fragment_cache("dashboard_table", page)
+        return add_validators(response, etag, last_modified)
+
+
 def logout_user(request):
     logout(request)
     messages.success(request, "You have been logged out")
@@ -99,7 +257,7 @@ class AddItem(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         # Pass category data to the form template
         context = super().get_context_data(**kwargs)
-        context["categories"] = Category.objects.all()
+        context["categories"] = get_categories()
         return context
 
     def form_valid(self, form):
@@ -108,18 +266,70 @@ class AddItem(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+# View for bulk importing inventory items from an uploaded file, requires login
+class ImportItems(LoginRequiredMixin, FormView):
+    form_class = ItemImportForm
+    template_name = "inventory/import_items.html"
+
+    def form_valid(self, form):
+        # Stream the uploaded file into the current user's inventory in batches
+        upload = form.cleaned_data["file"]
+        file_format = form.cleaned_data["format"] or detect_format(upload.name)
+        importer = ItemImporter(
+            self.request.user,
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            create_categories=form.cleaned_data["create_categories"],
+        )
+        if form.cleaned_data["background"]:
+            # Hand the file to a worker, which streams it in the same way
+            name = job_storage().save(f"imports/{upload.name}", upload)
+            enqueue(
+                "import_items", user=self.request.user, user_id=self.request.user.id, file=name,
+                file_format=file_format, create_categories=form.cleaned_data["create_categories"],
+            )
+            messages.success(self.request, f"{upload.name} will be imported in the background.")
+            return redirect("jobs")
+        result = importer.run(iter_rows(upload, file_format))
+        if result.format_error:
+            # The file stopped parsing part way, report the rows imported before it with the error
+            form.add_error("file", result.format_error)
+            return self.render_to_response(self.get_context_data(form=form, result=result))
+        # Show the form again with the import report
+        return self.render_to_response(self.get_context_data(form=ItemImportForm(), result=result))
+
+
 # View for editing existing inventory items, requires login
 class EditItem(LoginRequiredMixin, UpdateView):
     model = InventoryItem
-    form_class = InventoryItemForm
+    form_class = InventoryItemEditForm
     template_name = "inventory/item_form.html"
     success_url = reverse_lazy("dashboard")
 
     def form_valid(self, form):
-        response = super().form_valid(form)
+        try:
+            response = super().form_valid(form)
+        except StaleItemError:
+            return self.form_conflict(form)
         messages.success(self.request, 'Update was entered correctly.')
         return response
 
+    # The item was saved by someone else since the form was loaded. Show the form again with the
+    # user's values, what the item holds now and its current version, so saving the form again
+    # deliberately replaces the other change.
+    def form_conflict(self, form):
+        self.object = self.get_object()
+        data = form.data.copy()
+        data["version"] = self.object.version
+        form = self.get_form_class()(data=data, instance=self.object)
+        form.is_valid()
+        form.add_error(None, (
+            f"Someone else changed this item while you were editing it. It now holds "
+            f"{self.object.quantity} of {self.object.name}. Save again to replace their changes with yours."
+        ))
+        response = self.form_invalid(form)
+        response.status_code = 409
+        return response
+
 
 # View for deleting existing inventory items, requires login
 class DeleteItem(LoginRequiredMixin, DeleteView):
@@ -129,6 +339,24 @@ class DeleteItem(LoginRequiredMixin, DeleteView):
     context_object_name = "item"
 
 
+# View applying a bulk action to the items selected on the dashboard, requires login. The
+# action runs as one statement over the selection whatever its size, and the outcome is shown
+# on the dashboard.
+class BulkItems(LoginRequiredMixin, View):
+    def post(self, request):
+        form = BulkActionForm(request.POST, user=request.user)
+        if not form.is_valid():
+            for errors in form.errors.values():
+                for error in errors:
+                    messages.error(request, error)
+            return redirect("dashboard")
+        summary = apply_bulk_action(
+            form.cleaned_data["items"], form.cleaned_data["action"], form.action_value(), actor=request.user
+        )
+        messages.success(request, describe_bulk_action(summary))
+        return redirect("dashboard")
+
+
 def simple_logout(request):
     # Log out the user
     logout(request)
@@ -141,19 +369,156 @@ def is_admin(user):
     return user.is_superuser
 
 
+# Aggregates versioning the admin page from the summary rows, any item, category or user
+# change moves one of these
+def admin_state_aggregates():
+    return {"version": Sum("version"), "users": Count("id"), "last_modified": Max("last_modified")}
+
+
+# Key of the cached admin table, and the ETag of the page
+def admin_fragment_key(state, categories_token, page_number):
+    return make_token(state["version"], state["users"], state["last_modified"], categories_token, page_number)
+
+
+# Users listed by the admin view, with per-user totals read from their summary rows
+def admin_users():
+    return User.objects.select_related("inventory_summary").order_by("username", "id")
+
+
+# Items of the users on an admin page, ordered by user so they can be grouped in one pass
+def admin_items(user_ids):
+    return InventoryItem.objects.filter(user__in=user_ids).select_related("category").order_by("user_id", "id")
+
+
+# Pair each user on the admin page with their items
+def group_user_items(page_users, items):
+    grouped = {user_id: list(rows) for user_id, rows in groupby(items, key=attrgetter("user_id"))}
+    return [(user, grouped.get(user.id, [])) for user in page_users]
+
+
+# Load the users on an admin page, with the items of every user fetched in one query and
+# grouped in a single streaming pass
+def load_admin_page(page_number):
+    page = Paginator(admin_users(), settings.ADMIN_VIEW_PAGE_SIZE).get_page(page_number)
+    page_users = list(page)
+    page.user_items = group_user_items(page_users, admin_items([user.id for user in page_users]).iterator())
+    return page
+
+
+# Template context of the admin view, shared by the sync and async views
+def admin_context(page, fragment_key):
+    return {
+        'user_items': SimpleLazyObject(lambda: page.user_items),
+        'page': page,
+        'fragment_key': fragment_key,
+        'cache_alias': settings.INVENTORY_CACHE_ALIAS,
+        'cache_timeout': settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
 @login_required  # Requires user to be logged in
 @user_passes_test(is_admin)  # Requires user to pass the is_admin test
 def admin_view(request):
-    users = User.objects.all()
-    user_items = {}
-    # Iterate over each user
-    for user in users:
-        # Filter inventory items by the current user
-        items = InventoryItem.objects.filter(user=user).select_related('category')
-        # Add the items to the user_items dictionary
-        user_items[user] = items
-    # Render the admin view template with the user_items dictionary
-    return render(request, 'inventory/admin_view.html', {'user_items': user_items})
+    state = UserInventorySummary.objects.aggregate(**admin_state_aggregates())
+    page_number = request.GET.get("page", "1")
+    fragment_key = admin_fragment_key(state, categories_version(), page_number)
+    etag, last_modified = quote_etag(make_token(fragment_key, request.user.id)), state["last_modified"]
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    # Load the users on the page and their items, only when the cached table fragment is missing
+    page = SimpleLazyObject(lambda: load_admin_page(page_number))
+    # Render the admin view template with the users on this page and their items
+    response = timed_render(request, 'inventory/admin_view.html', admin_context(page, fragment_key))
+    record_fragment_cache("admin_view_table", page)
+    return add_validators(response, etag, last_modified)
+
+
+@login_required  # Requires user to be logged in
+@user_passes_test(is_admin)  # Requires user to pass the is_admin test
+def analytics_view(request):
+    # Queue a refresh of the rollups, which runs on a worker and shows on the jobs page
+    if request.method == "POST":
+        enqueue("refresh_analytics", user=request.user, full=request.POST.get("full") == "1")
+        messages.success(request, "The analytics will be refreshed shortly.")
+        return redirect("jobs")
+    # Read the reports from the rollups, and compute the slice chosen in the form if any
+    form = AnalyticsSliceForm(request.GET or None)
+    sliced = slice_items(**form.slice_arguments(timezone.now().date())) if form.is_valid() else None
+    return render(request, "inventory/analytics.html", {**analytics_report(), "form": form, "sliced": sliced})
+
+
+# View listing the user's latest background jobs with their progress, requires login
+class JobList(LoginRequiredMixin, View):
+    def get(self, request):
+        jobs = Job.objects.filter(user=request.user).order_by("-created_at", "-id")[:settings.JOB_LIST_SIZE]
+        return render(request, "inventory/jobs.html", {"jobs": jobs})
+
+
+# Queue an export of the user's items, or of every user's items for admins, written to a file by
+# a worker rather than streamed from the request
+@login_required  # Requires user to be logged in
+def export_items_job(request, export_format):
+    if request.method != "POST":
+        return redirect("jobs")
+    if export_format not in CONTENT_TYPES:
+        raise Http404("Unknown export format")
+    everything = request.POST.get("all") == "1" and is_admin(request.user)
+    enqueue(
+        "export_items", user=request.user, export_format=export_format,
+        user_id=None if everything else request.user.id,
+    )
+    messages.success(request, f"Your {export_format.upper()} export will be ready to download here shortly.")
+    return redirect("jobs")
+
+
+# Download the file written by one of the user's finished export jobs
+@login_required  # Requires user to be logged in
+def download_job_file(request, pk):
+    job = Job.objects.filter(pk=pk, user=request.user, name="export_items", status=Job.SUCCEEDED).first()
+    if job is None:
+        raise Http404("No such export")
+    export_format = job.arguments["export_format"]
+    return FileResponse(
+        job_storage().open(job.result["file"], "rb"),
+        as_attachment=True,
+        filename=f"inventory-{request.user.username}.{export_format}",
+        content_type=CONTENT_TYPES[export_format],
+    )
+
+
+# Build a streaming download of the items in a queryset, in CSV, JSON or JSON Lines format
+def export_response(queryset, export_format, filename):
+    if export_format not in CONTENT_TYPES:
+        raise Http404("Unknown export format")
+    response = StreamingHttpResponse(
+        stream_export(queryset, export_format, settings.EXPORT_CHUNK_SIZE),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+@login_required  # Requires user to be logged in
+def export_items(request, export_format):
+    # Stream the current user's items
+    items = InventoryItem.objects.filter(user=request.user.id)
+    return export_response(items, export_format, f"inventory-{request.user.username}")
+
+
+@login_required  # Requires user to be logged in
+@user_passes_test(is_admin)  # Requires user to pass the is_admin test
+def export_all_items(request, export_format):
+    # Stream the items of every user
+    return export_response(InventoryItem.objects.all(), export_format, "inventory-all-users")
+
+
+@login_required  # Requires user to be logged in
+@user_passes_test(is_admin)  # Requires user to pass the is_admin test
+def metrics(request):
+    # Serve the metrics of this process in the Prometheus text format
+    return HttpResponse(render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 # View for the about page
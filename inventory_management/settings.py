@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 # Middleware is processed in the listed order to handle requests and responses.
 MIDDLEWARE = [
+    'inventory.middleware.InstrumentationMiddleware',  # Request metrics and Server-Timing headers
     'django.middleware.security.SecurityMiddleware',  # Basic security enhancements
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files efficiently
     'django.contrib.sessions.middleware.SessionMiddleware',  # Session management
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',  # Cross-Site Request Forgery protection
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Authentication
     'django.contrib.messages.middleware.MessageMiddleware',  # Flash messages
+    'inventory.middleware.QueryBudgetMiddleware',  # Per-request query counts and budgets
     'django.middleware.clickjacking.XFrameOptionsMiddleware',  # Protect against clickjacking
 ]
 
@@ -90,8 +92,21 @@ WSGI_APPLICATION = "inventory_management.wsgi.application"
 
 # Database configuration
 # Using dj-database-url to parse DATABASE_URL from .env file for flexibility.
+# Connections are kept open between requests for CONN_MAX_AGE seconds and checked before reuse.
+# Under ASGI every request runs in its own thread, so persistent connections are off by default
+# there and pooling should be done by a pooler such as PgBouncer in front of the database.
 DATABASES = {
-    'default': dj_database_url.parse(env('DATABASE_URL'))
+    'default': dj_database_url.parse(
+        env('DATABASE_URL'),
+        conn_max_age=env.int('CONN_MAX_AGE', default=0 if env.bool('ASYNC_VIEWS', default=False) else 600),
+        conn_health_checks=env.bool('CONN_HEALTH_CHECKS', default=True),
+    )
+}
+
+# Cache configuration
+# Local memory cache by default, set CACHE_URL (for example redis://...) to share one between workers.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
 }
 
 # Password validation settings
@@ -138,7 +153,66 @@ LOGIN_REDIRECT_URL = '/dashboard'  # Redirect users to the dashboard after login
 LOGIN_URL = 'login'  # URL for the login view
 
 # Application-specific settings
-LOW_QUANTITY = 3  # Threshold for low inventory quantity alerts
+LOW_QUANTITY = 3  # Low stock threshold of items whose category and item set none of their own
+DASHBOARD_PAGE_SIZE = 50  # Number of items shown per page on the dashboard
+ADMIN_VIEW_PAGE_SIZE = 25  # Number of users shown per page on the admin view
+IMPORT_BATCH_SIZE = 1000  # Rows per bulk_create batch when importing items
+EXPORT_CHUNK_SIZE = 2000  # Rows fetched from the database per chunk when exporting items
+INVENTORY_CACHE_ALIAS = 'default'  # Cache used for the category catalogue and page caches
+CATEGORY_CACHE_TIMEOUT = 60 * 60  # Seconds the cached category catalogue is kept
+PAGE_CACHE_TIMEOUT = 5 * 60  # Seconds the cached dashboard and admin view tables are kept
+API_PAGE_SIZE = 50  # Items returned per page by the JSON API unless ?limit= is given
+API_MAX_PAGE_SIZE = 200  # Largest ?limit= the JSON API accepts
+API_MAX_BATCH_SIZE = 1000  # Most entries one JSON API batch request may hold
+SEARCH_MAX_RESULTS = 1000  # Most ranked matches a search returns, across all of its pages
+ESTIMATED_COUNT_MIN = 100_000  # Estimated rows from which the admin item list stops counting them exactly
+# Where low stock alerts are delivered by the deliver_alerts command, each entry names an
+# inventory.alerts sink class and the options it is built with
+ALERT_SINKS = [{'BACKEND': 'inventory.alerts.LogSink'}]
+if env('ALERT_WEBHOOK_URL', default=''):
+    ALERT_SINKS.append({'BACKEND': 'inventory.alerts.WebhookSink', 'OPTIONS': {'url': env('ALERT_WEBHOOK_URL')}})
+if env.bool('ALERT_EMAIL', default=False):
+    ALERT_SINKS.append({'BACKEND': 'inventory.alerts.EmailSink'})
+ALERT_BATCH_SIZE = 100  # Alerts claimed from the outbox per delivery round
+ALERT_USER_INTERVAL = 5 * 60  # Fewest seconds between two alert deliveries to the same user
+ALERT_MAX_ATTEMPTS = 5  # Failed deliveries before an alert is given up on
+ALERT_RETRY_DELAY = 60  # Seconds before retrying a failed delivery, doubled on every further failure
+ALERT_CLAIM_TIMEOUT = 5 * 60  # Seconds before alerts held by a worker that died are delivered again
+LEDGER_SNAPSHOT_SETTLE = 60  # Seconds a snapshot trails behind, longer than any transaction writing movements runs
+JOB_MAX_ATTEMPTS = 3  # Failed runs before a background job is given up on
+JOB_RETRY_DELAY = 30  # Seconds before retrying a failed job, doubled on every further failure
+JOB_CLAIM_TIMEOUT = 10 * 60  # Seconds without progress before a running job is claimed by another worker
+JOB_PROGRESS_INTERVAL = 1  # Fewest seconds between two progress writes of a running job
+JOB_POLL_INTERVAL = 2  # Seconds an idle worker waits before looking for jobs again
+JOB_LIST_SIZE = 50  # Latest jobs shown on a user's jobs page
+JOB_FILES_DIR = env('JOB_FILES_DIR', default=str(BASE_DIR / 'job_files'))  # Uploads and exports handed to and from jobs
+ANALYTICS_SETTLE = 60  # Seconds each analytics refresh looks back before the last one, longer than any transaction writing items runs
+ANALYTICS_BATCH_SIZE = 500  # Users whose analytics rollups are rebuilt per batch of item reads
+ANALYTICS_DAYS = 30  # Days of item activity shown on the analytics page
+ANALYTICS_TOP_USERS = 20  # Users with the most items shown on the analytics page
+# Route the dashboard, admin view and API reads to their async views, for ASGI servers such as uvicorn
+INVENTORY_ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Most queries each view may run per request, including the session and user lookups, keyed by
+# URL name. Views not listed use QUERY_BUDGET_DEFAULT, None means no limit.
+QUERY_BUDGETS = {
+    'dashboard': 8,
+    'admin-view': 8,
+    'analytics': 9,
+    'add-item': 12,
+    'edit-item': 12,
+    'delete-item': 12,
+    'api-items': 12,
+    'api-item': 12,
+    'api-item-adjust': 12,
+    'api-items-search': 8,
+    'api-categories': 4,
+    'jobs': 4,
+    'api-job': 4,
+}
+QUERY_BUDGET_DEFAULT = None
+# What to do when a view goes over its budget, "raise" fails the request, "log" logs a warning
+QUERY_BUDGET_ACTION = env('QUERY_BUDGET_ACTION', default='raise' if DEBUG else 'log')
 
 
 